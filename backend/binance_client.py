@@ -1,13 +1,23 @@
 import os
+import heapq
+import json
 import logging
+import random
 import re
+import socket
+import sys
+import threading
 import time
 from pathlib import Path
-from typing import Optional, List
-from functools import wraps
+from types import SimpleNamespace
+from typing import Any, Optional, List, Dict, Tuple, Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps, lru_cache
 
+import numpy as np  # pyright: ignore[reportMissingImports]
 import pandas as pd  # pyright: ignore[reportMissingImports]
-from dotenv import load_dotenv  # pyright: ignore[reportMissingImports]
+import requests  # pyright: ignore[reportMissingImports]
+from requests.adapters import HTTPAdapter  # pyright: ignore[reportMissingImports]
 
 from binance_sdk_derivatives_trading_usds_futures.derivatives_trading_usds_futures import (  # pyright: ignore[reportMissingImports]
     DerivativesTradingUsdsFutures,
@@ -18,21 +28,12 @@ from binance_sdk_derivatives_trading_usds_futures.rest_api.models import (  # py
     KlineCandlestickDataIntervalEnum,
     TopTraderLongShortRatioPositionsPeriodEnum
 )
-
-# 🔧 加载 .env 文件
-# 从当前文件所在目录向上查找 .env 文件（支持 backend/ 目录和项目根目录）
-backend_dir = Path(__file__).parent
-project_root = backend_dir.parent
-env_path = project_root / '.env'
-if not env_path.exists():
-    # 如果项目根目录没有 .env，尝试 backend 目录
-    env_path = backend_dir / '.env'
-
-if env_path.exists():
-    load_dotenv(dotenv_path=env_path)
-    logging.info(f"已加载环境变量文件: {env_path}")
-else:
-    logging.warning(f"未找到 .env 文件，将使用环境变量或默认值。查找路径: {env_path}")
+from binance_common.errors import (  # pyright: ignore[reportMissingImports]
+    NetworkError,
+    TooManyRequestsError,
+    RateLimitBanError
+)
+from urllib3.exceptions import ProtocolError, NewConnectionError  # pyright: ignore[reportMissingImports]
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -43,56 +44,262 @@ try:
         BINANCE_TIMEOUT,
         BINANCE_MAX_RETRIES,
         BINANCE_RETRY_DELAY,
-        BINANCE_PROXY
+        BINANCE_RETRY_MAX_DELAY,
+        BINANCE_RETRY_JITTER,
+        BINANCE_RATE_LIMIT_MAX_WAIT,
+        BINANCE_CB_THRESHOLD,
+        BINANCE_CB_COOLDOWN,
+        BINANCE_WEIGHT_PER_MINUTE,
+        BINANCE_PROXY,
+        BINANCE_FUTURES_BASE_URL
     )
 except ImportError:
     # 如果config模块不可用，使用环境变量或默认值
+    # config.py 存在时（即使缺少某些配置项）导入时已经加载过 .env；
+    # 只有 config.py 完全不可用时才自行加载，查找顺序与 config.py 相同：先项目根目录，再 backend 目录
+    if "config" not in sys.modules:
+        from dotenv import load_dotenv  # pyright: ignore[reportMissingImports]
+        _backend_dir = Path(__file__).resolve().parent
+        for _env_path in (_backend_dir.parent / '.env', _backend_dir / '.env'):
+            if _env_path.exists():
+                load_dotenv(dotenv_path=_env_path, override=False)
+                break
     BINANCE_TIMEOUT = int(os.getenv("BINANCE_TIMEOUT", "30"))
     BINANCE_MAX_RETRIES = int(os.getenv("BINANCE_MAX_RETRIES", "3"))
     BINANCE_RETRY_DELAY = float(os.getenv("BINANCE_RETRY_DELAY", "2.0"))
+    BINANCE_RETRY_MAX_DELAY = float(os.getenv("BINANCE_RETRY_MAX_DELAY", "30.0"))
+    BINANCE_RETRY_JITTER = float(os.getenv("BINANCE_RETRY_JITTER", "0.5"))
+    BINANCE_RATE_LIMIT_MAX_WAIT = float(os.getenv("BINANCE_RATE_LIMIT_MAX_WAIT", "300"))
+    BINANCE_CB_THRESHOLD = int(os.getenv("BINANCE_CB_THRESHOLD", "5"))
+    BINANCE_CB_COOLDOWN = float(os.getenv("BINANCE_CB_COOLDOWN", "60"))
+    BINANCE_WEIGHT_PER_MINUTE = int(os.getenv("BINANCE_WEIGHT_PER_MINUTE", "2000"))
     BINANCE_PROXY = os.getenv("BINANCE_PROXY", "")
+    BINANCE_FUTURES_BASE_URL = os.getenv("BINANCE_FUTURES_BASE_URL", "https://fapi.binance.com")
+
+# JSON 解析优先使用可选依赖 orjson（解析大体积的 exchangeInfo / ticker 响应更快），
+# 未安装时退回标准库 json
+try:
+    import orjson  # pyright: ignore[reportMissingImports]
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# 交易所交易对列表缓存时间（秒），交易对一天只会变动几次
+EXCHANGE_SYMBOLS_CACHE_TTL = 3600
+
+# SDK HTTP 连接池大小（需不小于并发线程数，才能真正复用连接）
+HTTP_POOL_SIZE = 32
+
+# 所有 BinanceClient 实例共享同一个连接池，复用到 fapi.binance.com 的 TCP/TLS 连接
+# 重试由 retry_on_network_error 负责，这里不再让 urllib3 重试
+_SHARED_HTTP_ADAPTER = HTTPAdapter(
+    pool_connections=HTTP_POOL_SIZE,
+    pool_maxsize=HTTP_POOL_SIZE,
+    max_retries=0,
+    pool_block=False
+)
+
+
+def _configure_http_session(session: requests.Session, proxy: str = "") -> None:
+    """为 SDK 的 requests.Session 挂载共享连接池，并开启 Keep-Alive"""
+    session.mount("https://", _SHARED_HTTP_ADAPTER)
+    session.mount("http://", _SHARED_HTTP_ADAPTER)
+    session.headers["Connection"] = "keep-alive"
+    if proxy:
+        session.proxies.update({"http": proxy, "https": proxy})
+
+
+# 视为网络错误（可重试）的异常类型
+# 不包含 OSError / requests.RequestException 整体，以免把 HTTP 4xx 之类的业务错误当成网络故障重试
+NETWORK_EXCEPTIONS = (
+    NetworkError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    ProtocolError,
+    NewConnectionError,
+    socket.timeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def _rate_limit_retry_after(e: Exception) -> Optional[float]:
+    """
+    判断异常是否为限流错误（HTTP 429/418）
+    
+    Returns:
+        限流错误返回建议等待的秒数（响应中没有 Retry-After 时为0），其他错误返回None
+    """
+    if isinstance(e, (TooManyRequestsError, RateLimitBanError)):
+        retry_after = getattr(e, "retry_after", None)
+        return float(retry_after) if retry_after else 0.0
+    
+    response = getattr(e, "response", None)
+    if getattr(response, "status_code", None) in (418, 429):
+        try:
+            return float(response.headers.get("Retry-After") or 0)
+        except (TypeError, ValueError):
+            return 0.0
+    return None
+
+
+class CircuitBreaker:
+    """
+    简单熔断器
+    
+    连续网络失败达到阈值后打开，冷却期内的请求立即失败，避免在币安不可用时
+    每次调用都耗费完整的重试等待；冷却期结束后放行请求试探（半开），
+    成功则关闭，失败则重新打开。
+    """
+    __slots__ = ("fail_count", "opened_at", "threshold", "cooldown")
+    
+    def __init__(self, threshold: int = BINANCE_CB_THRESHOLD, cooldown: float = BINANCE_CB_COOLDOWN):
+        self.fail_count = 0
+        self.opened_at: Optional[float] = None
+        self.threshold = threshold
+        self.cooldown = cooldown
+    
+    def is_open(self) -> bool:
+        """是否处于熔断状态（冷却期结束后返回 False，放行试探请求）"""
+        if self.opened_at is None:
+            return False
+        return time.monotonic() - self.opened_at < self.cooldown
+    
+    def record_failure(self) -> None:
+        """记录一次网络失败，达到阈值时打开熔断"""
+        self.fail_count += 1
+        if self.fail_count >= self.threshold:
+            if self.opened_at is None or not self.is_open():
+                logging.error(
+                    f"币安API连续 {self.fail_count} 次网络失败，熔断 {self.cooldown:.0f} 秒"
+                )
+            self.opened_at = time.monotonic()
+    
+    def reset(self) -> None:
+        """请求成功，关闭熔断"""
+        self.fail_count = 0
+        self.opened_at = None
+
 
+# 所有客户端请求同一个币安服务，共用一个熔断器
+_circuit_breaker = CircuitBreaker()
 
-def retry_on_network_error(max_retries: int = BINANCE_MAX_RETRIES, delay: float = BINANCE_RETRY_DELAY):
+
+class WeightLimiter:
+    """
+    请求权重令牌桶（线程安全）
+    
+    币安按IP统计每分钟的请求权重，超过上限返回 429。令牌按 per_minute/60 每秒补充，
+    桶容量为 per_minute：权重充足时立即放行，不足时只等待到补足所需的时间，
+    代替每次请求前固定 sleep。per_minute 为 0 时不限制。
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "lock")
+    
+    def __init__(self, per_minute: int = BINANCE_WEIGHT_PER_MINUTE):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self, weight: int = 1) -> None:
+        """取出 weight 个令牌，不足时阻塞等待"""
+        if self.rate <= 0:
+            return
+        weight = min(weight, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# 同一进程内的币安请求共用一个令牌桶
+_weight_limiter = WeightLimiter()
+
+# exchangeInfo 与不带 symbol 的 ticker/24hr 接口的请求权重
+EXCHANGE_INFO_WEIGHT = 1
+TICKER_24HR_ALL_WEIGHT = 40
+
+
+def _klines_weight(limit: Optional[int]) -> int:
+    """K线接口的请求权重（随 limit 增大，未指定时按默认 500 计）"""
+    limit = limit or 500
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+def retry_on_network_error(
+    max_retries: int = BINANCE_MAX_RETRIES,
+    delay: float = BINANCE_RETRY_DELAY,
+    max_delay: float = BINANCE_RETRY_MAX_DELAY,
+    jitter: float = BINANCE_RETRY_JITTER,
+    circuit_open_result: Callable[[], Any] = lambda: None
+):
     """
     网络错误重试装饰器
     
     Args:
         max_retries: 最大重试次数
         delay: 初始重试延迟（秒），使用指数退避
+        max_delay: 单次重试的最大延迟（秒）
+        jitter: 随机抖动比例，实际延迟在 [1 - jitter, 1 + jitter] 倍之间，避免多个调用方同时重试
+        circuit_open_result: 熔断期间返回值的工厂函数，应与被装饰方法失败时的返回值一致（默认返回None）
+    
+    限流错误（HTTP 429/418）同样会重试，优先按响应头 Retry-After 等待；
+    如果要求等待的时间超过 BINANCE_RATE_LIMIT_MAX_WAIT，则直接抛出异常。
+    
+    调用前先检查熔断器，熔断期间不发请求也不等待，直接返回 circuit_open_result()，
+    与方法内部请求失败时的返回值相同，调用方无需额外处理。
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
+            if _circuit_breaker.is_open():
+                logging.warning(f"币安API熔断中，跳过 {func.__name__}()")
+                return circuit_open_result()
             last_exception = None
             for attempt in range(max_retries + 1):
+                # 方法内部吞掉的网络错误会直接记入熔断器，返回后失败次数没有增加才算成功
+                fail_count_before = _circuit_breaker.fail_count
                 try:
-                    return func(*args, **kwargs)
+                    result = func(*args, **kwargs)
+                    if _circuit_breaker.fail_count == fail_count_before:
+                        _circuit_breaker.reset()
+                    return result
                 except Exception as e:
-                    error_msg = str(e).lower()
                     error_type = type(e).__name__
+                    is_network_error = isinstance(e, NETWORK_EXCEPTIONS)
+                    retry_after = _rate_limit_retry_after(e)
                     
-                    # 判断是否是网络相关错误
-                    is_network_error = (
-                        'network' in error_msg or
-                        'timeout' in error_msg or
-                        'connection' in error_msg or
-                        'connect' in error_msg or
-                        'ConnectTimeoutError' in error_type or
-                        'ConnectionError' in error_type or
-                        'TimeoutError' in error_type or
-                        'Max retries exceeded' in error_msg
-                    )
-                    
-                    if not is_network_error or attempt == max_retries:
-                        # 不是网络错误或已达到最大重试次数，直接抛出异常
+                    if (not is_network_error and retry_after is None) or attempt == max_retries:
+                        # 不是网络/限流错误或已达到最大重试次数，直接抛出异常
+                        if is_network_error:
+                            _circuit_breaker.record_failure()
                         raise
                     
                     last_exception = e
-                    # 指数退避：延迟时间 = delay * (2 ^ attempt)
-                    wait_time = delay * (2 ** attempt)
+                    if retry_after:
+                        if retry_after > BINANCE_RATE_LIMIT_MAX_WAIT:
+                            logging.error(f"触发API限流，需等待 {retry_after:.0f} 秒，超过上限 {BINANCE_RATE_LIMIT_MAX_WAIT:.0f} 秒，放弃重试")
+                            raise
+                        wait_time = retry_after
+                    else:
+                        # 指数退避（带随机抖动和上限）：延迟时间 = min(max_delay, delay * 2^attempt * (1 ± jitter))
+                        wait_time = min(max_delay, delay * (2 ** attempt) * (1 + random.uniform(-jitter, jitter)))
                     logging.warning(
-                        f"网络错误（尝试 {attempt + 1}/{max_retries + 1}）: {error_type}: {str(e)[:100]}"
+                        f"{'API限流' if retry_after is not None else '网络错误'}（尝试 {attempt + 1}/{max_retries + 1}）: {error_type}: {str(e)[:100]}"
                     )
                     logging.info(f"等待 {wait_time:.1f} 秒后重试...")
                     time.sleep(wait_time)
@@ -104,6 +311,89 @@ def retry_on_network_error(max_retries: int = BINANCE_MAX_RETRIES, delay: float
     return decorator
 
 
+@lru_cache(maxsize=32)
+def _symbol_matcher(symbol_pattern: str) -> Callable[[str], bool]:
+    """
+    根据交易对匹配模式返回判断函数（按模式缓存，正则只编译一次）
+    
+    默认模式 r"usdt$" 直接使用 str.endswith，比正则匹配快一个数量级
+    """
+    if symbol_pattern == r"usdt$":
+        return lambda symbol: symbol.upper().endswith("USDT")
+    return re.compile(symbol_pattern, re.IGNORECASE).search
+
+
+# get_top_gainers 输出的 24hr ticker 字段（固定列）
+_TICKER_NUMERIC_FIELDS = [
+    "price_change", "price_change_percent", "last_price",
+    "open_price", "volume", "quote_volume", "high_price", "low_price"
+]
+_TICKER_FIELDS = ("symbol", *_TICKER_NUMERIC_FIELDS, "open_time", "close_time")
+
+
+def _filter_and_sort_tickers(
+    tickers: List,
+    in_trading_symbols: List[str],
+    symbol_pattern: str = r"usdt$",
+    exclude_patterns: tuple = ("UP", "DOWN", "USDTM"),
+    reverse: bool = True,
+    top_n: Optional[int] = None
+) -> List:
+    """
+    过滤并按涨幅排序24小时行情
+    
+    Args:
+        tickers: 24小时行情列表（需包含 symbol 和 price_change_percent 属性）
+        in_trading_symbols: 交易所正常交易的交易对列表
+        symbol_pattern: 交易对符号匹配模式（默认匹配USDT结尾）
+        exclude_patterns: 要排除的交易对后缀（默认排除杠杆/合约交易对）
+        reverse: 是否降序排序（默认True，涨幅从高到低）
+        top_n: 只返回前N个（默认None返回全部；指定时用堆做部分排序）
+    
+    Returns:
+        排序后的交易对列表
+    """
+    match_symbol = _symbol_matcher(symbol_pattern)
+    # 符号匹配和后缀排除只取决于交易对名称，先在交易对列表上算好允许集合，
+    # 遍历行情时每个元素只剩一次 O(1) 的集合判断
+    allowed_symbols = frozenset(
+        s for s in in_trading_symbols
+        if match_symbol(s) and not s.endswith(exclude_patterns)
+    )
+    
+    # 单次遍历完成全部过滤
+    valid_tickers = (
+        t for t in tickers
+        if t.price_change_percent and t.symbol in allowed_symbols
+    )
+    
+    def change_percent(t):
+        return float(t.price_change_percent)
+    
+    if top_n is not None:
+        # 只取前N个时无需全量排序：堆选择 O(N log k)，结果与 sorted(...)[:top_n] 一致
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        return select(top_n, valid_tickers, key=change_percent)
+    
+    sorted_tickers = sorted(valid_tickers, key=change_percent, reverse=reverse)
+    
+    return sorted_tickers
+
+
+_CAMEL_TO_SNAKE_RE = re.compile(r"(?<!^)(?=[A-Z])")
+
+
+@lru_cache(maxsize=128)
+def _snake_case(name: str) -> str:
+    """camelCase 字段名转 snake_case（字段名种类很少，结果缓存）"""
+    return _CAMEL_TO_SNAKE_RE.sub("_", name).lower()
+
+
+def _ticker_from_json(item: Dict) -> SimpleNamespace:
+    """将 /fapi/v1/ticker/24hr 返回的 camelCase 字段转换为与 SDK 模型一致的 snake_case 属性"""
+    return SimpleNamespace(**{_snake_case(k): v for k, v in item.items()})
+
+
 class BinanceClient:
     """币安API客户端封装类"""
     
@@ -121,7 +411,7 @@ class BinanceClient:
             api_secret: API密钥（优先级：参数 > .env文件 > 环境变量 > 默认值）
             base_path: API基础路径（优先级：参数 > .env文件 > 环境变量 > 默认值）
         """
-        # 🔧 从 .env 文件或环境变量获取配置（已通过 load_dotenv() 加载）
+        # 🔧 从 .env 文件或环境变量获取配置（.env 已由 config 模块加载）
         # 优先级：函数参数 > .env文件/环境变量 > 默认值
         self.api_key = api_key or os.getenv("BINANCE_API_KEY")
         self.api_secret = api_secret or os.getenv("BINANCE_API_SECRET")
@@ -139,67 +429,86 @@ class BinanceClient:
                 "或在环境变量中设置 BINANCE_API_SECRET。"
             )
         
+        # 存储网络配置（用于日志和错误提示）
+        self.timeout = BINANCE_TIMEOUT
+        self.max_retries = BINANCE_MAX_RETRIES
+        self.retry_delay = BINANCE_RETRY_DELAY
+        self.proxy = BINANCE_PROXY
+        
+        # 交易对列表缓存: {(symbol_pattern, status): (缓存时间戳, 交易对元组)}
+        self._symbols_cache: Dict[Tuple[str, str], Tuple[float, Tuple[str, ...]]] = {}
+        
         # 创建配置和客户端
-        # 注意：binance_sdk 可能不支持直接设置超时和代理
-        # 如果需要这些功能，可能需要修改 SDK 或使用其他方式
         configuration_rest_api = ConfigurationRestAPI(
             api_key=self.api_key,
             api_secret=self.api_secret,
-            base_path=self.base_path
+            base_path=self.base_path,
+            keep_alive=True
         )
         self.client = DerivativesTradingUsdsFutures(config_rest_api=configuration_rest_api)
         
-        # 存储网络配置（用于日志和错误提示）
-        self.timeout = BINANCE_TIMEOUT
-        self.max_retries = BINANCE_MAX_RETRIES
-        self.retry_delay = BINANCE_RETRY_DELAY
-        self.proxy = BINANCE_PROXY
+        # SDK 内部每个客户端持有一个 requests.Session，这里替换为共享连接池
+        session = getattr(self.client.rest_api, "_session", None)
+        if not isinstance(session, requests.Session):
+            logging.debug("未找到 SDK 的 requests.Session，直连接口使用独立 Session")
+            session = requests.Session()
+        _configure_http_session(session, self.proxy)
+        # 直接请求公开行情接口时复用同一个 Session（与 SDK 共享连接）
+        self._http = session
         
         if self.proxy:
             logging.info(f"已配置代理: {self.proxy}")
         logging.info(f"网络配置: 超时={self.timeout}秒, 最大重试={self.max_retries}次")
     
-    @retry_on_network_error(max_retries=BINANCE_MAX_RETRIES, delay=BINANCE_RETRY_DELAY)
+    @retry_on_network_error(max_retries=BINANCE_MAX_RETRIES, delay=BINANCE_RETRY_DELAY, circuit_open_result=list)
     def in_exchange_trading_symbols(
         self,
         symbol_pattern: str = r"usdt$",
-        status: str = "TRADING"
+        status: str = "TRADING",
+        force_refresh: bool = False
     ) -> List[str]:
         """
-        获取币安交易所所有合约交易对
+        获取币安交易所所有合约交易对（带缓存，缓存时间 EXCHANGE_SYMBOLS_CACHE_TTL 秒）
         
         Args:
             symbol_pattern: 交易对符号匹配模式（默认匹配USDT结尾）
             status: 交易状态过滤（默认只返回TRADING状态的）
+            force_refresh: 是否强制刷新缓存，默认False
         
         Returns:
             符合条件的交易对符号列表
         """
+        cache_key = (symbol_pattern, status)
+        cached = self._symbols_cache.get(cache_key)
+        if (
+            not force_refresh
+            and cached is not None
+            and time.time() - cached[0] < EXCHANGE_SYMBOLS_CACHE_TTL
+        ):
+            return list(cached[1])
+        
         try:
+            _weight_limiter.acquire(EXCHANGE_INFO_WEIGHT)
             response = self.client.rest_api.exchange_information()
             rate_limits = response.rate_limits
             # logging.info(f"exchange_info() rate limits: {rate_limits}")
 
             data = response.data()
+            match_symbol = _symbol_matcher(symbol_pattern)
             usdt_symbols = [
                 t.symbol for t in data.symbols
-                if re.search(symbol_pattern, t.symbol, flags=re.IGNORECASE) and t.status == status
+                if t.status == status and match_symbol(t.symbol)
             ]
+            # 空列表不缓存，下次调用重新请求
+            if usdt_symbols:
+                self._symbols_cache[cache_key] = (time.time(), tuple(usdt_symbols))
             return usdt_symbols
         except Exception as e:
-            error_msg = str(e).lower()
             error_type = type(e).__name__
-            
-            # 判断是否是网络错误
-            is_network_error = (
-                'network' in error_msg or
-                'timeout' in error_msg or
-                'connection' in error_msg or
-                'ConnectTimeoutError' in error_type or
-                'ConnectionError' in error_type
-            )
+            is_network_error = isinstance(e, NETWORK_EXCEPTIONS)
             
             if is_network_error:
+                _circuit_breaker.record_failure()
                 logging.error(
                     f"连接币安API失败: {error_type}\n"
                     f"  错误详情: {str(e)[:200]}\n"
@@ -237,6 +546,7 @@ class BinanceClient:
             K线数据
         """
         try:
+            _weight_limiter.acquire(_klines_weight(limit))
             response = self.client.rest_api.kline_candlestick_data(
                 symbol=symbol,
                 interval=interval,
@@ -245,24 +555,17 @@ class BinanceClient:
                 limit=limit,
             )
 
-            rate_limits = response.rate_limits
-            logging.info(f"kline_candlestick_data() rate limits: {rate_limits}")
+            # 每次请求都会触发，降为 DEBUG 并延迟格式化，未开启 DEBUG 时不做字符串转换
+            logging.debug("kline_candlestick_data() rate limits: %s", response.rate_limits)
 
             data = response.data()
             return data
         except Exception as e:
-            error_msg = str(e).lower()
             error_type = type(e).__name__
-            
-            is_network_error = (
-                'network' in error_msg or
-                'timeout' in error_msg or
-                'connection' in error_msg or
-                'ConnectTimeoutError' in error_type or
-                'ConnectionError' in error_type
-            )
+            is_network_error = isinstance(e, NETWORK_EXCEPTIONS)
             
             if is_network_error:
+                _circuit_breaker.record_failure()
                 logging.error(
                     f"获取K线数据失败（{symbol}）: {error_type}\n"
                     f"  错误详情: {str(e)[:200]}"
@@ -276,33 +579,33 @@ class BinanceClient:
         """
         获取24小时价格变动统计
         
+        直接请求公开接口 /fapi/v1/ticker/24hr 并解析为轻量对象，
+        不经过 SDK 为几百个交易对逐个构建并校验 Pydantic 模型。
+        
         Returns:
-            24小时价格变动统计数据
+            24小时价格变动统计数据（属性名与 SDK 模型一致的 snake_case）
         """
         try:
-            response = self.client.rest_api.ticker24hr_price_change_statistics()
+            _weight_limiter.acquire(TICKER_24HR_ALL_WEIGHT)
+            response = self._http.get(
+                f"{self.base_path.rstrip('/')}/fapi/v1/ticker/24hr",
+                timeout=self.timeout
+            )
+            response.raise_for_status()
 
-            rate_limits = response.rate_limits
-            logging.info(f"ticker24hr_price_change_statistics() rate limits: {rate_limits}")
+            # 每次请求都会触发，降为 DEBUG 并延迟格式化，未开启 DEBUG 时不做字符串转换
+            logging.debug(
+                "ticker24hr_price_change_statistics() used weight (1m): %s",
+                response.headers.get("X-MBX-USED-WEIGHT-1M")
+            )
 
-            data = response.data()
-            for t in data:
-                if t[0] == "actual_instance":    
-                    return t[1]
-            return None
+            return [_ticker_from_json(item) for item in _json_loads(response.content)]
         except Exception as e:
-            error_msg = str(e).lower()
             error_type = type(e).__name__
-            
-            is_network_error = (
-                'network' in error_msg or
-                'timeout' in error_msg or
-                'connection' in error_msg or
-                'ConnectTimeoutError' in error_type or
-                'ConnectionError' in error_type
-            )
+            is_network_error = isinstance(e, NETWORK_EXCEPTIONS)
             
             if is_network_error:
+                _circuit_breaker.record_failure()
                 logging.error(
                     f"获取24小时价格统计失败: {error_type}\n"
                     f"  错误详情: {str(e)[:200]}"
@@ -315,7 +618,8 @@ class BinanceClient:
         self,
         symbol_pattern: str = r"usdt$",
         exclude_patterns: tuple = ("UP", "DOWN", "USDTM"),
-        reverse: bool = True
+        reverse: bool = True,
+        top_n: Optional[int] = None
     ) -> List:
         """
         按照涨幅降序排序交易对
@@ -324,42 +628,33 @@ class BinanceClient:
             symbol_pattern: 交易对符号匹配模式（默认匹配USDT结尾）
             exclude_patterns: 要排除的交易对后缀（默认排除杠杆/合约交易对）
             reverse: 是否降序排序（默认True，涨幅从高到低）
+            top_n: 只返回前N个交易对（默认None返回全部）
         
         Returns:
             排序后的交易对列表
         """
-        tickers = self.ticker24hr_price_change_statistics()
+        # 交易对列表（缓存过期时需要请求 exchangeInfo）与24小时行情互不依赖，在后台线程中并发获取
+        # 两个请求都经过 retry_on_network_error（熔断）和请求权重令牌桶
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            symbols_future = executor.submit(self.in_exchange_trading_symbols, symbol_pattern=symbol_pattern)
+            tickers = self.ticker24hr_price_change_statistics()
+            in_trading_symbols = symbols_future.result()
 
         if not tickers or tickers is None:
             logging.warning("ticker24hr_price_change_statistics() 返回空或None")
             return []
 
-        in_trading_symbols = self.in_exchange_trading_symbols(symbol_pattern=symbol_pattern)
-
         if not in_trading_symbols:
             return []
 
-        usdt_tickers = [
-            t for t in tickers
-            if re.search(symbol_pattern, t.symbol, flags=re.IGNORECASE)
-        ]
-
-        in_trading_tickers = [
-            t for t in usdt_tickers if t.symbol in in_trading_symbols
-        ]
-        
-        valid_tickers = [
-            t for t in in_trading_tickers
-            if t.price_change_percent and not t.symbol.endswith(exclude_patterns)
-        ]
-        
-        sorted_tickers = sorted(
-            valid_tickers,
-            key=lambda x: float(x.price_change_percent),
-            reverse=reverse
+        return _filter_and_sort_tickers(
+            tickers,
+            in_trading_symbols,
+            symbol_pattern=symbol_pattern,
+            exclude_patterns=exclude_patterns,
+            reverse=reverse,
+            top_n=top_n
         )
-        
-        return sorted_tickers
     
     def get_top_gainers(
         self,
@@ -381,40 +676,32 @@ class BinanceClient:
         try:
             tickers = self.sort_tickers(
                 symbol_pattern=symbol_pattern,
-                exclude_patterns=exclude_patterns
+                exclude_patterns=exclude_patterns,
+                top_n=top_n
             )
             
             if not tickers:
                 logging.warning("sort_tickers() 返回空列表")
                 return pd.DataFrame()
             
-            tickers_list = [vars(ticker) for ticker in tickers[:top_n]]
+            top_tickers = tickers[:top_n]
             
-            if not tickers_list:
-                logging.warning("tickers_list 为空")
+            if not top_tickers:
+                logging.warning("top_tickers 为空")
                 return pd.DataFrame()
 
-            df = pd.DataFrame(tickers_list)
-            
-            if df.empty:
-                logging.warning("DataFrame 为空")
-                return df
+            # 字段固定，直接按列构建，省去 vars() 拷贝和逐行推断类型
+            df = pd.DataFrame({
+                field: [getattr(ticker, field, None) for ticker in top_tickers]
+                for field in _TICKER_FIELDS
+            })
             
-            # 处理时间列（如果存在）
-            if 'open_time' in df.columns:
-                df['open_time'] = pd.to_datetime(df['open_time'], unit='ms', utc=True).dt.tz_localize(None)
-            if 'close_time' in df.columns:
-                df['close_time'] = pd.to_datetime(df['close_time'], unit='ms', utc=True).dt.tz_localize(None)
+            # 处理时间列（毫秒时间戳直接转为 naive UTC 的 datetime64[ms]）
+            for col in ('open_time', 'close_time'):
+                df[col] = df[col].to_numpy(dtype=np.int64).astype('datetime64[ms]')
             
-            # 数值列转换为浮点数
-            numeric_columns = [
-                'price_change', 'price_change_percent', 'last_price', 
-                'open_price', 'volume', 'high_price', 'low_price'
-            ]
-
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
+            # 数值列一次性转换为浮点数
+            df[_TICKER_NUMERIC_FIELDS] = df[_TICKER_NUMERIC_FIELDS].astype(np.float64)
 
             return df
         except Exception as e:
@@ -426,27 +713,45 @@ class BinanceClient:
 # 全局默认实例（保持向后兼容）
 # ============================================================================
 
-# 创建默认的客户端实例
-_default_client = BinanceClient()
+# 默认客户端延迟创建：导入模块时不校验 API 密钥、不初始化 SDK，
+# 只使用 kline2df 等纯函数的调用方无需任何网络/认证开销
+_default_client: Optional[BinanceClient] = None
+_default_client_lock = threading.Lock()
+
+
+def _get_default_client() -> BinanceClient:
+    """获取默认客户端实例（首次调用时创建，线程安全）"""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = BinanceClient()
+    return _default_client
 
 # ============================================================================
 # 便捷函数（保持向后兼容，内部使用默认实例）
 # ============================================================================
 
-def in_exchange_trading_symbols(symbol_pattern: str = r"usdt$", status: str = "TRADING") -> List[str]:
+def in_exchange_trading_symbols(
+    symbol_pattern: str = r"usdt$",
+    status: str = "TRADING",
+    force_refresh: bool = False
+) -> List[str]:
     """
-    获取币安交易所所有合约交易对（便捷函数）
+    获取币安交易所所有合约交易对（便捷函数，带缓存）
     
     Args:
         symbol_pattern: 交易对符号匹配模式（默认匹配USDT结尾）
         status: 交易状态过滤（默认只返回TRADING状态的）
+        force_refresh: 是否强制刷新缓存，默认False
     
     Returns:
         符合条件的交易对符号列表
     """
-    return _default_client.in_exchange_trading_symbols(
+    return _get_default_client().in_exchange_trading_symbols(
         symbol_pattern=symbol_pattern,
-        status=status
+        status=status,
+        force_refresh=force_refresh
     )
 
 
@@ -470,7 +775,7 @@ def kline_candlestick_data(
     Returns:
         K线数据
     """
-    return _default_client.kline_candlestick_data(
+    return _get_default_client().kline_candlestick_data(
         symbol=symbol,
         interval=interval,
         starttime=starttime,
@@ -479,6 +784,20 @@ def kline_candlestick_data(
     )
 
 
+# K线原始数据的列（与币安 /fapi/v1/klines 返回的字段顺序一致）
+KLINE_COLUMNS = [
+    "open_time", "open", "high", "low", "close",
+    "volume", "close_time", "quote_volume", "trade_count",
+    "active_buy_volume", "active_buy_quote_volume", "reserved_field"
+]
+
+# 以字符串返回的价格/成交量列，统一转换为 float64
+_KLINE_FLOAT_COLUMNS = [
+    "open", "high", "low", "close", "volume",
+    "quote_volume", "active_buy_volume", "active_buy_quote_volume"
+]
+
+
 def kline2df(data) -> pd.DataFrame:
     """
     K线数据转换为DataFrame
@@ -489,31 +808,27 @@ def kline2df(data) -> pd.DataFrame:
     Returns:
         转换后的DataFrame
     """
-    df = pd.DataFrame(data, columns=[
-        "open_time", "open", "high", "low", "close",
-        "volume", "close_time", "quote_volume", "trade_count",
-        "active_buy_volume", "active_buy_quote_volume", "reserved_field"
-    ])
+    df = pd.DataFrame(data, columns=KLINE_COLUMNS)
    
     # 数据类型转换（字符串→数值/日期）
-    df["open"] = pd.to_numeric(df["open"])
-    df["high"] = pd.to_numeric(df["high"])
-    df["low"] = pd.to_numeric(df["low"])
-    df["close"] = pd.to_numeric(df["close"])
-    df["volume"] = pd.to_numeric(df["volume"])
-    df["quote_volume"] = pd.to_numeric(df["quote_volume"])
-    df["trade_count"] = pd.to_numeric(df["trade_count"])
-    df["active_buy_volume"] = pd.to_numeric(df["active_buy_volume"])
-    df["active_buy_quote_volume"] = pd.to_numeric(df["active_buy_quote_volume"])
+    # 价格/成交量列一次性整块转换，避免逐列 pd.to_numeric 多次扫描
+    df[_KLINE_FLOAT_COLUMNS] = df[_KLINE_FLOAT_COLUMNS].astype(np.float64)
+    df["trade_count"] = df["trade_count"].astype(np.int64)
     
     # 计算涨跌幅
-    df["diff"] = df["close"] - df["close"].shift(1)
-    df["pct_chg"] = (df["close"] - df["close"].shift(1)) / df["close"].shift(1) * 100
+    # 只做一次 shift，diff 与 pct_chg 复用同一份前收盘价
+    close = df["close"].to_numpy()
+    prev_close = np.empty_like(close)
+    prev_close[:1] = np.nan
+    prev_close[1:] = close[:-1]
+    diff = close - prev_close
+    df["diff"] = diff
+    df["pct_chg"] = diff / prev_close * 100
     
-    # 时间戳转换为可读日期（毫秒级→秒级→datetime）
-    # 🔧 关键修复：显式指定 UTC，然后取消时区信息使其成为 naive datetime (本质仍是 UTC)
-    # 这可以避免 pandas 在转换过程中受到本地系统时区的影响
-    df["trade_date"] = pd.to_datetime(df["open_time"], unit="ms", utc=True).dt.tz_localize(None)
+    # 时间戳转换为可读日期（毫秒时间戳→datetime）
+    # 🔧 关键修复：结果是 naive datetime（本质是 UTC），不受本地系统时区影响
+    # 毫秒时间戳直接按 datetime64[ms] 解释，无需先生成带时区的序列再去掉时区
+    df["trade_date"] = df["open_time"].to_numpy(dtype=np.int64).astype("datetime64[ms]")
         
     return df
 
@@ -525,13 +840,14 @@ def ticker24hr_price_change_statistics():
     Returns:
         24小时价格变动统计数据
     """
-    return _default_client.ticker24hr_price_change_statistics()
+    return _get_default_client().ticker24hr_price_change_statistics()
 
 
 def sort_tickers(
     symbol_pattern: str = r"usdt$",
     exclude_patterns: tuple = ("UP", "DOWN", "USDTM"),
-    reverse: bool = True
+    reverse: bool = True,
+    top_n: Optional[int] = None
 ) -> List:
     """
     按照涨幅降序排序交易对（便捷函数）
@@ -540,14 +856,16 @@ def sort_tickers(
         symbol_pattern: 交易对符号匹配模式（默认匹配USDT结尾）
         exclude_patterns: 要排除的交易对后缀（默认排除杠杆/合约交易对）
         reverse: 是否降序排序（默认True，涨幅从高到低）
+        top_n: 只返回前N个交易对（默认None返回全部）
     
     Returns:
         排序后的交易对列表
     """
-    return _default_client.sort_tickers(
+    return _get_default_client().sort_tickers(
         symbol_pattern=symbol_pattern,
         exclude_patterns=exclude_patterns,
-        reverse=reverse
+        reverse=reverse,
+        top_n=top_n
     )
 
 
@@ -561,4 +879,5 @@ def get_top3_gainers(top_n: int = 3) -> pd.DataFrame:
     Returns:
         包含前N个交易对信息的DataFrame
     """
-    return _default_client.get_top_gainers(top_n=top_n)
+    return _get_default_client().get_top_gainers(top_n=top_n)
+
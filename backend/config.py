@@ -5,12 +5,17 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 
-# 加载 .env 文件
-backend_dir = Path(__file__).parent
+# 加载 .env 文件（全项目只在这里加载一次，其他模块通过 import config 获得环境变量）
+backend_dir = Path(__file__).resolve().parent
 project_root = backend_dir.parent
 env_path = project_root / '.env'
+if not env_path.exists():
+    # 如果项目根目录没有 .env，尝试 backend 目录
+    env_path = backend_dir / '.env'
+
+# override=False：已存在的环境变量（包括子进程从父进程继承的）不会被 .env 覆盖
 if env_path.exists():
-    load_dotenv(dotenv_path=env_path)
+    load_dotenv(dotenv_path=env_path, override=False)
 
 # 数据库配置 - PostgreSQL
 PG_HOST = os.getenv("PG_HOST", "localhost")
@@ -29,6 +34,13 @@ if PG_PASSWORD:
 else:
     DATABASE_URL = f"postgresql://{PG_USER}@{PG_HOST}:{PG_PORT}/{PG_DB}"
 
+# 连接池配置（每个进程独立的连接池，需不小于并发线程数）
+PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "20"))  # 常驻连接数
+PG_MAX_OVERFLOW = int(os.getenv("PG_MAX_OVERFLOW", "10"))  # 高峰时额外允许的连接数
+PG_POOL_RECYCLE = int(os.getenv("PG_POOL_RECYCLE", "60"))  # 连接最长复用时间（秒），避免被服务端或中间设备（如PgBouncer）断开
+PG_POOL_TIMEOUT = int(os.getenv("PG_POOL_TIMEOUT", "30"))  # 从连接池获取连接的最长等待时间（秒）
+PG_POOL_PRE_PING = os.getenv("PG_POOL_PRE_PING", "false").lower() == "true"  # 每次取出连接前是否先 SELECT 1 探活（默认关闭，依靠TCP keepalive和pool_recycle）
+
 # SSL 模式配置（如果需要）
 PG_SSLMODE = os.getenv("PG_SSLMODE", "")  # 可选值: disable, allow, prefer, require, verify-ca, verify-full
 
@@ -64,6 +76,12 @@ BINANCE_API_SECRET = os.getenv("BINANCE_API_SECRET", "")
 BINANCE_TIMEOUT = int(os.getenv("BINANCE_TIMEOUT", "30"))  # 连接超时时间（秒），默认30秒
 BINANCE_MAX_RETRIES = int(os.getenv("BINANCE_MAX_RETRIES", "3"))  # 最大重试次数，默认3次
 BINANCE_RETRY_DELAY = float(os.getenv("BINANCE_RETRY_DELAY", "2.0"))  # 重试延迟（秒），默认2秒
+BINANCE_RETRY_MAX_DELAY = float(os.getenv("BINANCE_RETRY_MAX_DELAY", "30.0"))  # 单次重试最大延迟（秒），默认30秒
+BINANCE_RETRY_JITTER = float(os.getenv("BINANCE_RETRY_JITTER", "0.5"))  # 重试延迟随机抖动比例（0~1），默认0.5
+BINANCE_RATE_LIMIT_MAX_WAIT = float(os.getenv("BINANCE_RATE_LIMIT_MAX_WAIT", "300"))  # 限流(429/418)时最多等待的秒数，超过则直接失败
+BINANCE_CB_THRESHOLD = int(os.getenv("BINANCE_CB_THRESHOLD", "5"))  # 连续网络失败多少次后熔断，默认5次
+BINANCE_CB_COOLDOWN = float(os.getenv("BINANCE_CB_COOLDOWN", "60"))  # 熔断后多少秒再放行试探请求，默认60秒
+BINANCE_WEIGHT_PER_MINUTE = int(os.getenv("BINANCE_WEIGHT_PER_MINUTE", "2000"))  # 币安请求（K线、exchangeInfo、24小时行情）每分钟最多使用的请求权重（币安按IP限制2400），0表示不限制
 BINANCE_PROXY = os.getenv("BINANCE_PROXY", "")  # 代理设置，格式: http://proxy_host:proxy_port 或 socks5://proxy_host:proxy_port
 
 # 币安期货API配置（用于其他数据下载）
@@ -1,11 +1,130 @@
-from db import engine
+from db import engine, forget_tables, PG_POOL_SIZE
 from sqlalchemy import text  # pyright: ignore[reportMissingImports]
+import numpy as np
 import pandas as pd  # pyright: ignore[reportMissingImports]
-from typing import Union, Dict, List, Optional
+from typing import Union, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime, timedelta
+import copy
+import heapq
+import html
+import json
 import logging
+import os
+import re
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext, suppress
+from functools import lru_cache
+from pathlib import Path
 
 from binance_client import in_exchange_trading_symbols, kline_candlestick_data, kline2df
+from download_klines import INTERVAL_SECONDS
+
+# 复检结果转换为原生类型时优先使用可选依赖 orjson，未安装时退回标准库 json
+try:
+    import orjson  # pyright: ignore[reportMissingImports]
+except ImportError:
+    orjson = None
+
+# 本地K线数据的进程内缓存
+# 定时任务在其他进程中更新数据，这里无法感知，因此缓存最多保留 KLINE_CACHE_TTL 秒
+# 每个条目是一整张表的 DataFrame（分钟级K线表很大），条目数不宜过多；过期条目在写入新条目时清除
+KLINE_CACHE_TTL = 60
+KLINE_CACHE_SIZE = 16
+_kline_cache: Dict[tuple, tuple] = {}
+_kline_cache_lock = threading.Lock()
+
+# 数据完整性检查结果的进程内缓存（先检查、再生成报告/下载缺失数据时复用同一次检查）
+# 本进程写入数据后随K线缓存一起清空；其他进程的写入最多 INTEGRITY_CACHE_TTL 秒后可见
+INTEGRITY_CACHE_TTL = 300
+INTEGRITY_CACHE_SIZE = 16
+_integrity_cache: Dict[tuple, tuple] = {}
+_integrity_cache_lock = threading.Lock()
+
+# 按交易对并行查询数据库时的线程数（不超过连接池大小）
+DB_QUERY_WORKERS = min(16, PG_POOL_SIZE)
+
+# 补全缺失数据时并行下载的交易对数（受交易所限流约束，不宜过大）
+DOWNLOAD_WORKERS = min(8, PG_POOL_SIZE)
+
+# 复查时并发下载同一交易对各时间段K线的线程数（受交易所限流约束）
+SEGMENT_DOWNLOAD_WORKERS = 4
+# 复检时并行处理的交易对数（每个任务占用一个数据库连接）
+RECHECK_WORKERS = min(8, PG_POOL_SIZE)
+# 复检时同时进行的交易所K线请求数上限（所有交易对和分段共用）
+EXCHANGE_REQUEST_CONCURRENCY = 5
+_exchange_request_slots = threading.BoundedSemaphore(EXCHANGE_REQUEST_CONCURRENCY)
+
+# 可以安全拼接到SQL表名中的交易对
+_SAFE_SYMBOL_RE = re.compile(r'^[A-Z0-9_]+$')
+# 可以安全拼接到SQL中的列名
+_SAFE_COLUMN_RE = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+# 本地表名列表的缓存 (表名集合, {小写表名: 实际表名})，查不到的表至少间隔这么多秒才重新加载
+TABLE_NAMES_MIN_REFRESH = 5
+_table_names: Optional[tuple] = None
+_table_names_loaded_at = 0.0
+_table_names_lock = threading.Lock()
+
+# public 下的普通表和分区表
+# 直接查系统目录，比 information_schema.tables（多层视图，还要做权限检查）快得多
+_PUBLIC_TABLES_SQL = """
+    SELECT c.relname AS table_name
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public'
+    AND c.relkind IN ('r', 'p')
+"""
+
+# delete_all_tables 每条 DROP TABLE 语句删除的表数量
+DROP_TABLE_BATCH_SIZE = 50
+
+# 数据完整性报告的分隔线
+REPORT_SEP = "=" * 80
+
+# HTML 报告的固定部分
+_HTML_STYLE = """    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }
+        .container { background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+        h1 { color: #333; border-bottom: 3px solid #4CAF50; padding-bottom: 10px; }
+        h2 { color: #555; margin-top: 30px; }
+        .stat { background: #f9f9f9; padding: 15px; margin: 10px 0; border-left: 4px solid #2196F3; }
+        .issue { background: #fff3cd; padding: 10px; margin: 5px 0; border-left: 4px solid #ffc107; }
+        .success { background: #d4edda; padding: 10px; margin: 5px 0; border-left: 4px solid #28a745; }
+        .error { background: #f8d7da; padding: 10px; margin: 5px 0; border-left: 4px solid #dc3545; }
+        pre { background: #f4f4f4; padding: 10px; border-radius: 4px; overflow-x: auto; }
+        table { width: 100%; border-collapse: collapse; margin: 20px 0; }
+        th, td { padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }
+        th { background-color: #4CAF50; color: white; }
+    </style>
+"""
+_HTML_REPORT_HEAD = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>数据完整性检查报告</title>
+""" + _HTML_STYLE + """</head>
+<body>
+    <div class="container">
+        <h1>数据完整性检查报告</h1>
+"""
+_HTML_REPORT_TAIL = """</pre>
+    </div>
+</body>
+</html>
+        """
+
+# 复检时统计空值的列
+_OHLCV_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+# 涨幅查询只需要的列
+_GAINER_COLUMNS = ['trade_date', 'close', 'pct_chg']
+_OHLC_COLUMNS = ['open', 'high', 'low', 'close']
+# 完整性检查和复检只需要的列（读取整表时只查询这些列）
+_KLINE_CHECK_COLUMNS = ['trade_date', *_OHLCV_COLUMNS]
 
 # 获取币安交易所所有合约交易对
 IN_EXCHANGE_SYMBOLS = in_exchange_trading_symbols()
@@ -17,12 +136,7 @@ def get_local_symbols(interval: str = "1d"):
         # 表名格式: K{interval}{symbol}, 例如: K1dBTCUSDT
         prefix = f'K{interval}'
         # 使用 ILIKE 进行不区分大小写的匹配
-        stmt = """
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name ILIKE :prefix
-        """
+        stmt = _PUBLIC_TABLES_SQL + " AND c.relname ILIKE :prefix"
         with engine.connect() as conn:
             result = conn.execute(text(stmt), {"prefix": f"{prefix}%"})
             table_names = result.fetchall()
@@ -47,6 +161,8 @@ try:
 except Exception as e:
     logging.warning(f"初始化本地交易对列表失败: {e}")
     LOCAL_SYMBOLS = []
+# 集合形式，用于成员判断
+LOCAL_SYMBOLS_SET = frozenset(LOCAL_SYMBOLS)
 
 #比较本地和交易所交易对，找出缺失的交易对
 def find_missing_symbols():
@@ -56,78 +172,216 @@ def find_missing_symbols():
     
     missing_symbols = [
         symbol for symbol in IN_EXCHANGE_SYMBOLS
-        if symbol not in LOCAL_SYMBOLS
+        if symbol not in LOCAL_SYMBOLS_SET
     ]
     return missing_symbols
 
 MISSING_SYMBOLS = find_missing_symbols()
 # print(f"Missing symbols: {MISSING_SYMBOLS}")  # 注释掉，避免每次导入时都打印
 
-def get_local_kline_data(symbol: str, interval: str = "1d") -> pd.DataFrame:
-    """获取本地数据库中指定交易对的K线数据"""
-    # 清洗输入
-    symbol = symbol.strip().upper()
-    interval = interval.strip()
-    table_name = f'K{interval}{symbol}'
+def _compress_kline_df(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    缩减K线DataFrame的内存占用（只做无损转换）
     
+    价格/成交量保持 float64：float32 只有约7位有效数字，接口返回的数值会出现精度误差；
+    trade_date 保持原格式，多个调用方按字符串/日期两种类型分别处理。
+    """
+    if 'trade_count' in df.columns:
+        df['trade_count'] = pd.to_numeric(df['trade_count'], downcast='integer')
+    # 保留字段几乎全是同一个值，用分类类型只存一份
+    if 'reserved_field' in df.columns:
+        df['reserved_field'] = df['reserved_field'].astype('category')
+    return df
+
+
+@lru_cache(maxsize=2048)
+def _select_kline_stmt(table_name: str, columns: Optional[tuple] = None):
+    """按 (表名, 列) 缓存查询语句对象，避免每次读取都重新构造 text()"""
+    select_list = ', '.join(f'"{c}"' for c in columns) if columns else '*'
     # PostgreSQL 表名需要用引号包裹（保持大小写）
-    safe_table_name = f'"{table_name}"'
-    stmt = f'SELECT * FROM {safe_table_name} ORDER BY open_time ASC'
+    return text(f'SELECT {select_list} FROM "{table_name}" ORDER BY open_time ASC')
+
+
+def _load_table_names(conn) -> Optional[tuple]:
+    """一次查询 public 下的全部表名，返回 (表名集合, {小写表名: 表名})；查询失败返回None"""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text(stmt))
-            data = result.fetchall()
-            columns = result.keys()
-        df = pd.DataFrame(data, columns=columns)
-        logging.debug(f"成功从表 {table_name} 获取 {len(df)} 条数据")
+        result = conn.execute(text(_PUBLIC_TABLES_SQL))
+        names = [row[0] for row in result]
+    except Exception as e:
+        logging.debug(f"获取表名列表失败: {e}")
+        with suppress(Exception):
+            conn.rollback()
+        return None
+    lowered = {}
+    for name in names:
+        lowered.setdefault(name.lower(), name)
+    return frozenset(names), lowered
+
+
+def _resolve_table_name(conn, table_name: str) -> Optional[str]:
+    """
+    查找表的实际名称（兼容大小写不一致），表不存在时返回None
+    
+    表名列表在进程内缓存 KLINE_CACHE_TTL 秒；查不到时如果缓存已超过
+    TABLE_NAMES_MIN_REFRESH 秒则重新加载一次，以便发现其他进程新建的表。
+    表名列表无法查询时原样返回表名，由后续查询自行报错。
+    """
+    global _table_names, _table_names_loaded_at
+    
+    now = time.monotonic()
+    with _table_names_lock:
+        names, loaded_at = _table_names, _table_names_loaded_at
+    age = now - loaded_at
+    if (
+        names is None
+        or age > KLINE_CACHE_TTL
+        or (table_name.lower() not in names[1] and age > TABLE_NAMES_MIN_REFRESH)
+    ):
+        names = _load_table_names(conn)
+        if names is None:
+            return table_name
+        with _table_names_lock:
+            _table_names, _table_names_loaded_at = names, now
+    
+    if table_name in names[0]:
+        return table_name
+    return names[1].get(table_name.lower())
+
+
+def _read_local_kline_data(
+    conn,
+    symbol: str,
+    interval: str,
+    columns: Optional[tuple] = None
+) -> pd.DataFrame:
+    """使用给定连接读取指定交易对的K线数据（columns 为空时读取全部列）"""
+    table_name = f'K{interval}{symbol}'
+    actual_name = _resolve_table_name(conn, table_name)
+    if actual_name is None:
+        # 表不存在时直接返回空DataFrame，不再查询数据库
+        logging.debug(f"本地K线表 {table_name} 不存在")
+        return pd.DataFrame()
+    if actual_name != table_name:
+        logging.info(f"发现表名大小写不匹配: 查询的是 {table_name}，实际表名是 {actual_name}")
+    
+    try:
+        df = _compress_kline_df(pd.read_sql(_select_kline_stmt(actual_name, columns), conn))
+        logging.debug(f"成功从表 {actual_name} 获取 {len(df)} 条数据")
         return df
     except Exception as e:
-        # 如果表不存在或其他数据库错误，返回空DataFrame
+        # 数据库错误时返回空DataFrame
         # 不抛出异常，让调用者处理空数据的情况
-        logging.warning(f"获取本地K线数据失败（表 {table_name} 可能不存在）: {e}")
-        # 尝试检查表是否存在（改进：极度宽松查找）
-        try:
-            with engine.connect() as conn:
-                result = conn.execute(
-                    text("""
-                        SELECT table_name 
-                        FROM information_schema.tables 
-                        WHERE table_schema = 'public' 
-                        AND (
-                            table_name = :table_name 
-                            OR table_name = LOWER(:table_name)
-                            OR table_name = UPPER(:table_name)
-                            OR LOWER(table_name) = LOWER(:table_name)
-                        )
-                        LIMIT 1
-                    """),
-                    {"table_name": table_name}
-                )
-                actual_table_name_row = result.fetchone()
-                
-                if not actual_table_name_row:
-                    # ILIKE 尝试回退
-                    result_fallback = conn.execute(
-                        text("SELECT table_name FROM information_schema.tables WHERE table_name ILIKE :table_name LIMIT 1"),
-                        {"table_name": table_name}
-                    )
-                    actual_table_name_row = result_fallback.fetchone()
-
-                if actual_table_name_row:
-                    actual_name = actual_table_name_row[0]
-                    logging.info(f"发现表名大小写不匹配或拼写相近: 查询的是 {table_name}，实际表名是 {actual_name}")
-                    # 使用实际表名重试
-                    safe_actual_name = f'"{actual_name}"'
-                    stmt_retry = f'SELECT * FROM {safe_actual_name} ORDER BY open_time ASC'
-                    result_retry = conn.execute(text(stmt_retry))
-                    data_retry = result_retry.fetchall()
-                    columns_retry = result_retry.keys()
-                    df_retry = pd.DataFrame(data_retry, columns=columns_retry)
-                    logging.info(f"使用实际表名 {actual_name} 成功获取 {len(df_retry)} 条数据")
-                    return df_retry
-        except Exception as e2:
-            logging.debug(f"检查表名时出错: {e2}")
+        logging.warning(f"获取本地K线数据失败（表 {actual_name}）: {e}")
+        # PostgreSQL 中出错的事务需要回滚后才能在同一连接上继续查询
+        with suppress(Exception):
+            conn.rollback()
+        return pd.DataFrame()
+
+
+def _get_local_kline_data_uncached(
+    symbol: str,
+    interval: str = "1d",
+    columns: Optional[tuple] = None,
+    conn=None
+) -> pd.DataFrame:
+    """从数据库读取指定交易对的K线数据（不经过缓存），未传入连接时从连接池获取"""
+    if conn is None:
+        with engine.connect() as conn:
+            return _read_local_kline_data(conn, symbol, interval, columns)
+    return _read_local_kline_data(conn, symbol, interval, columns)
+
+
+def _get_local_kline_data_cached(
+    symbol: str,
+    interval: str,
+    columns: Optional[tuple],
+    conn=None
+) -> pd.DataFrame:
+    """带缓存的K线读取，条目超过 KLINE_CACHE_TTL 秒后失效并被清除"""
+    key = (symbol, interval, columns)
+    now = time.monotonic()
+    with _kline_cache_lock:
+        cached = _kline_cache.get(key)
+        if cached is not None and now - cached[0] >= KLINE_CACHE_TTL:
+            del _kline_cache[key]
+            cached = None
+    if cached is not None:
+        return cached[1]
+    
+    df = _get_local_kline_data_uncached(symbol, interval, columns, conn=conn)
+    if df.empty:
+        # 空结果不缓存，表下载完成后可以立即读到
+        return df
+    with _kline_cache_lock:
+        # 先清除所有过期条目，仍然满了再淘汰最早写入的条目
+        expired = [k for k, (loaded_at, _) in _kline_cache.items() if now - loaded_at >= KLINE_CACHE_TTL]
+        for k in expired:
+            del _kline_cache[k]
+        _kline_cache.pop(key, None)
+        while len(_kline_cache) >= KLINE_CACHE_SIZE:
+            _kline_cache.pop(next(iter(_kline_cache)))
+        _kline_cache[key] = (now, df)
+    return df
+
+
+def get_local_kline_data(
+    symbol: str,
+    interval: str = "1d",
+    columns: Optional[List[str]] = None,
+    conn=None
+) -> pd.DataFrame:
+    """
+    获取本地数据库中指定交易对的K线数据
+    
+    同一进程内重复读取同一张表时直接使用缓存，返回的是副本，调用方可以自由修改。
+    本进程写入数据后请调用 get_local_kline_data.cache_clear()。
+    
+    Args:
+        symbol: 交易对符号
+        interval: K线间隔，默认"1d"
+        columns: 只读取这些列（可选，默认读取全部列）。只用到少数几列时传入，减少传输量
+        conn: 已打开的数据库连接（可选）。循环读取多张表时传入同一个连接，
+              避免每张表都从连接池取连接并做一次存活检测
+    """
+    # 清洗输入
+    symbol = symbol.strip().upper()
+    interval = interval.strip()
+    if columns:
+        columns = tuple(columns)
+        invalid = [c for c in columns if not _SAFE_COLUMN_RE.match(c)]
+        if invalid:
+            raise ValueError(f"无效的列名: {invalid}")
+    else:
+        columns = None
+    df = _get_local_kline_data_cached(symbol, interval, columns, conn=conn)
+    if df.empty:
         return pd.DataFrame()
+    return df.copy()
+
+
+def _clear_local_kline_caches() -> None:
+    """清空K线数据缓存、表名缓存和完整性检查缓存（本进程写入、建表或删表后调用）"""
+    global _table_names
+    with _kline_cache_lock:
+        _kline_cache.clear()
+    with _table_names_lock:
+        _table_names = None
+    with _integrity_cache_lock:
+        _integrity_cache.clear()
+
+
+get_local_kline_data.cache_clear = _clear_local_kline_caches
+
+
+def _trade_days(trade_date: pd.Series) -> pd.Series:
+    """
+    把 trade_date 转换为当天零点的 datetime64（向量化解析）
+    
+    兼容 'YYYY-MM-DD'、'YYYY-MM-DD HH:MM:SS' 字符串和 datetime 类型，无法解析的为 NaT。
+    """
+    if not pd.api.types.is_datetime64_any_dtype(trade_date):
+        trade_date = pd.to_datetime(trade_date, format='ISO8601', errors='coerce')
+    return trade_date.dt.normalize()
 
 
 def get_kline_data_for_date(symbol: str, date: str) -> Optional[pd.Series]:
@@ -146,15 +400,8 @@ def get_kline_data_for_date(symbol: str, date: str) -> Optional[pd.Series]:
         if df.empty:
             return None
         
-        # 将trade_date转换为日期字符串格式进行比较（处理多种日期格式）
-        if df['trade_date'].dtype == 'object':
-            # 字符串格式，提取日期部分
-            df['trade_date_str'] = df['trade_date'].str[:10]
-        else:
-            # datetime格式
-            df['trade_date_str'] = pd.to_datetime(df['trade_date']).dt.strftime('%Y-%m-%d')
-        
-        date_data = df[df['trade_date_str'] == date]
+        # 按日期比较（trade_date 可能带时间部分）
+        date_data = df[_trade_days(df['trade_date']) == pd.Timestamp(date)]
         if date_data.empty:
             return None
         
@@ -165,6 +412,16 @@ def get_kline_data_for_date(symbol: str, date: str) -> Optional[pd.Series]:
 
 
 
+def _quote_volume_window(entry_datetime: str) -> tuple:
+    """建仓时间往前24小时的时间窗口 (开始, 结束)，格式与1h表的 trade_date 一致"""
+    if ' ' in entry_datetime:
+        entry_dt = datetime.strptime(entry_datetime, '%Y-%m-%d %H:%M:%S')
+    else:
+        entry_dt = datetime.strptime(entry_datetime, '%Y-%m-%d')
+    start_dt = entry_dt - timedelta(hours=24)
+    return start_dt.strftime('%Y-%m-%d %H:%M:%S'), entry_dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
 def get_24h_quote_volume(symbol: str, entry_datetime: str) -> float:
     """
     获取建仓时刻往前24小时的成交额（quote_volume）
@@ -180,27 +437,24 @@ def get_24h_quote_volume(symbol: str, entry_datetime: str) -> float:
     Returns:
         24小时成交额（USDT），失败返回-1
     """
+    symbol = symbol.strip().upper()
     table_name = f'K1h{symbol}'
     try:
-        # 解析建仓时间
-        if ' ' in entry_datetime:
-            entry_dt = datetime.strptime(entry_datetime, '%Y-%m-%d %H:%M:%S')
-        else:
-            entry_dt = datetime.strptime(entry_datetime, '%Y-%m-%d')
+        if not _SAFE_SYMBOL_RE.match(symbol):
+            raise ValueError(f"无效的交易对: {symbol}")
         
-        # 计算24小时前的时间
-        start_dt = entry_dt - timedelta(hours=24)
+        # 计算24小时的时间窗口
+        start_str, end_str = _quote_volume_window(entry_datetime)
         
-        # 查询24小时内的成交额总和
+        # 查询24小时内的成交额总和（日期使用绑定参数）
         query = f'''
             SELECT SUM(quote_volume) as total_volume
-            FROM {table_name}
-            WHERE trade_date >= "{start_dt.strftime('%Y-%m-%d %H:%M:%S')}"
-            AND trade_date < "{entry_dt.strftime('%Y-%m-%d %H:%M:%S')}"
+            FROM "{table_name}"
+            WHERE trade_date >= :start AND trade_date < :end
         '''
         
         with engine.connect() as conn:
-            result = conn.execute(text(query))
+            result = conn.execute(text(query), {"start": start_str, "end": end_str})
             row = result.fetchone()
             if row and row[0]:
                 return float(row[0])
@@ -210,6 +464,76 @@ def get_24h_quote_volume(symbol: str, entry_datetime: str) -> float:
         return -1
 
 
+def get_24h_quote_volume_bulk(symbol_times: List[tuple], batch_size: int = 200) -> Dict[tuple, float]:
+    """
+    批量获取多个交易对建仓时刻往前24小时的成交额
+    
+    每批交易对的查询用 UNION ALL 合并成一条SQL，一次往返拿到全部结果。
+    
+    Args:
+        symbol_times: [(交易对, 建仓时间), ...]，建仓时间格式同 get_24h_quote_volume
+        batch_size: 每条SQL合并的查询数量
+    
+    Returns:
+        {(交易对, 建仓时间): 24小时成交额}，表不存在或失败的为-1
+    """
+    results = {(symbol, entry): -1 for symbol, entry in symbol_times}
+    if not symbol_times:
+        return results
+    
+    try:
+        with engine.connect() as conn:
+            tables = _get_local_kline_tables(conn, interval="1h")
+            
+            queries = []
+            for symbol, entry in results:
+                table_name = tables.get(symbol.strip().upper())
+                if table_name is None:
+                    continue
+                try:
+                    window = _quote_volume_window(entry)
+                except ValueError as e:
+                    logging.warning(f"获取 {symbol} 24小时成交额失败: {e}")
+                    continue
+                queries.append(((symbol, entry), table_name, window))
+            
+            for batch_start in range(0, len(queries), batch_size):
+                batch = queries[batch_start:batch_start + batch_size]
+                arms = []
+                params = {}
+                for i, (_, table_name, (start_str, end_str)) in enumerate(batch):
+                    arms.append(
+                        f'SELECT {i} AS idx, SUM(quote_volume) AS total_volume FROM "{table_name}" '
+                        f'WHERE trade_date >= :s{i} AND trade_date < :e{i}'
+                    )
+                    params[f"s{i}"] = start_str
+                    params[f"e{i}"] = end_str
+                rows = conn.execute(text(" UNION ALL ".join(arms)), params).fetchall()
+                for idx, total_volume in rows:
+                    if total_volume:
+                        results[batch[idx][0]] = float(total_volume)
+    except Exception as e:
+        logging.warning(f"批量获取24小时成交额失败: {e}")
+    
+    return results
+
+
+def _fill_missing_pct_chg(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    pct_chg 为空时用前一天的收盘价补算涨幅（向量化）
+    
+    只有上一行恰好是前一天、且前收盘价大于0时才补算，与逐行查找前一天数据的结果一致。
+    需要 trade_day（_trade_days 的结果）和 close 列。
+    """
+    df = df.sort_values('trade_day')
+    close = pd.to_numeric(df['close'], errors='coerce')
+    prev_close = close.shift(1)
+    is_prev_day = df['trade_day'].diff() == pd.Timedelta(days=1)
+    calc = ((close - prev_close) / prev_close * 100).where(is_prev_day & (prev_close > 0))
+    df['pct_chg'] = pd.to_numeric(df['pct_chg'], errors='coerce').fillna(calc)
+    return df
+
+
 def get_top_gainer_by_date(date: str) -> Optional[tuple]:
     """
     获取指定日期涨幅第一的交易对
@@ -220,67 +544,75 @@ def get_top_gainer_by_date(date: str) -> Optional[tuple]:
     Returns:
         Tuple[symbol, pct_chg] 或 None
     """
-    from typing import Tuple
     symbols = get_local_symbols()
     top_gainer = None
     max_pct_chg = float('-inf')
+    target_day = pd.Timestamp(date)
     
-    for symbol in symbols:
-        try:
-            df = get_local_kline_data(symbol)
-            if df.empty:
-                continue
+    # 整个循环复用同一个数据库连接（没有交易对时不取连接）
+    with engine.connect() if symbols else nullcontext() as conn:
+        for symbol in symbols:
+            try:
+                df = get_local_kline_data(symbol, columns=_GAINER_COLUMNS, conn=conn)
+                if df.empty:
+                    continue
             
-            # 将trade_date转换为字符串格式进行比较（处理多种日期格式）
-            if df['trade_date'].dtype == 'object':
-                # 字符串格式，提取日期部分
-                df['trade_date_str'] = df['trade_date'].str[:10]
-            else:
-                # datetime格式
-                df['trade_date_str'] = pd.to_datetime(df['trade_date']).dt.strftime('%Y-%m-%d')
+                # 按日期比较（trade_date 可能带时间部分）
+                df['trade_day'] = _trade_days(df['trade_date'])
             
-            # 查找指定日期的数据
-            date_data = df[df['trade_date_str'] == date]
-            if date_data.empty:
-                continue
+                # pct_chg 为空时用前一天收盘价补算
+                df = _fill_missing_pct_chg(df)
             
-            row = date_data.iloc[0]
-            pct_chg = row['pct_chg']
+                # 查找指定日期的数据
+                date_data = df[df['trade_day'] == target_day]
+                if date_data.empty:
+                    continue
             
-            # 如果pct_chg是NaN，尝试使用收盘价和开盘价计算涨幅
-            if pd.isna(pct_chg):
-                # 查找前一天的收盘价
-                date_dt = datetime.strptime(date, '%Y-%m-%d')
-                prev_date = (date_dt - timedelta(days=1)).strftime('%Y-%m-%d')
-                prev_data = df[df['trade_date_str'] == prev_date]
-                
-                if not prev_data.empty and not pd.isna(prev_data.iloc[0]['close']):
-                    prev_close = prev_data.iloc[0]['close']
-                    current_close = row['close']
-                    if not pd.isna(current_close) and prev_close > 0:
-                        # 计算涨幅
-                        pct_chg = (current_close - prev_close) / prev_close * 100
-                    else:
-                        continue
-                else:
+                pct_chg = date_data['pct_chg'].iloc[0]
+                if pd.isna(pct_chg):
                     continue
             
-            if pct_chg > max_pct_chg:
-                max_pct_chg = pct_chg
-                top_gainer = symbol
-        except Exception as e:
-            logging.debug(f"获取 {symbol} 在 {date} 的数据失败: {e}")
-            continue
+                if pct_chg > max_pct_chg:
+                    max_pct_chg = pct_chg
+                    top_gainer = symbol
+            except Exception as e:
+                logging.debug(f"获取 {symbol} 在 {date} 的数据失败: {e}")
+                continue
     
     if top_gainer:
         return (top_gainer, max_pct_chg)
     return None
 
 
+def _get_local_kline_tables(conn, interval: str = "1d") -> Dict[str, str]:
+    """
+    获取本地K线表的实际表名
+    
+    Returns:
+        {交易对(大写): 实际表名}
+    """
+    prefix = f'K{interval}'
+    result = conn.execute(
+        text(_PUBLIC_TABLES_SQL + " AND c.relname ILIKE :prefix ORDER BY c.relname"),
+        {"prefix": f"{prefix}%"}
+    )
+    tables = {}
+    for (name,) in result:
+        symbol = name[len(prefix):].upper()
+        # 表名会直接拼进SQL，只接受字母数字和下划线
+        if symbol and _SAFE_SYMBOL_RE.match(symbol):
+            tables.setdefault(symbol, name)
+    return tables
+
+
 def get_all_top_gainers(start_date: str, end_date: str) -> pd.DataFrame:
     """
     获取指定日期范围内所有涨幅第一的交易对（优化版本）
     
+    所有交易对的日线表通过 UNION ALL 合并成一条查询，由 PostgreSQL 用
+    DISTINCT ON 选出每天涨幅最大的交易对，只传输 (日期, 交易对, 涨幅) 三列。
+    pct_chg 为空时与前一天收盘价计算涨幅（与逐表读取时的处理一致）。
+    
     Args:
         start_date: 开始日期 'YYYY-MM-DD'
         end_date: 结束日期 'YYYY-MM-DD'
@@ -288,82 +620,70 @@ def get_all_top_gainers(start_date: str, end_date: str) -> pd.DataFrame:
     Returns:
         DataFrame包含日期、交易对、涨幅
     """
-    symbols = get_local_symbols()
-    all_data = []
+    empty_df = pd.DataFrame(columns=['date', 'symbol', 'pct_chg'])
     
-    # 一次性读取所有交易对的数据
-    logging.info(f"正在读取 {len(symbols)} 个交易对的数据...")
-    for symbol in symbols:
-        try:
-            df = get_local_kline_data(symbol)
-            if df.empty:
-                continue
-            
-            # 标准化trade_date格式
-            if df['trade_date'].dtype == 'object':
-                df['trade_date_str'] = df['trade_date'].str[:10]
-            else:
-                df['trade_date_str'] = pd.to_datetime(df['trade_date']).dt.strftime('%Y-%m-%d')
-            
-            # 筛选日期范围
-            date_mask = (df['trade_date_str'] >= start_date) & (df['trade_date_str'] <= end_date)
-            df_filtered = df[date_mask].copy()
-            
-            if df_filtered.empty:
-                continue
-            
-            # 添加symbol列
-            df_filtered['symbol'] = symbol
-            
-            # 处理NaN的pct_chg
-            for idx, row in df_filtered.iterrows():
-                if pd.isna(row['pct_chg']):
-                    # 尝试计算涨幅
-                    date_str = row['trade_date_str']
-                    date_dt = datetime.strptime(date_str, '%Y-%m-%d')
-                    prev_date = (date_dt - timedelta(days=1)).strftime('%Y-%m-%d')
-                    prev_data = df[df['trade_date_str'] == prev_date]
-                    
-                    if not prev_data.empty and not pd.isna(prev_data.iloc[0]['close']):
-                        prev_close = prev_data.iloc[0]['close']
-                        current_close = row['close']
-                        if not pd.isna(current_close) and prev_close > 0:
-                            df_filtered.at[idx, 'pct_chg'] = (current_close - prev_close) / prev_close * 100
+    # 多取前一天的数据，用于补算起始日期缺失的涨幅
+    prev_date = (datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+    # trade_date 是 'YYYY-MM-DD[ HH:MM:SS]' 字符串，直接按字符串比较范围（可以走主键索引），
+    # 结束日期当天带时间的记录都小于下一天
+    next_date = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    
+    try:
+        with engine.connect() as conn:
+            tables = _get_local_kline_tables(conn, interval="1d")
+            if not tables:
+                logging.warning("未找到任何数据")
+                return empty_df
             
-            # 只保留需要的列
-            df_filtered = df_filtered[['trade_date_str', 'symbol', 'pct_chg']].copy()
-            all_data.append(df_filtered)
-        except Exception as e:
-            logging.debug(f"读取 {symbol} 数据失败: {e}")
-            continue
+            logging.info(f"正在查询 {len(tables)} 个交易对的涨幅第一...")
+            # NULLIF(..., 'NaN')：PostgreSQL 排序时 NaN 大于任何数值，需要当作空值处理
+            per_table = [
+                f"""
+                SELECT d, '{symbol}' AS symbol, pct_chg, close,
+                       LAG(d) OVER (ORDER BY d) AS prev_d,
+                       LAG(close) OVER (ORDER BY d) AS prev_close
+                FROM (
+                    SELECT CAST(LEFT(trade_date, 10) AS DATE) AS d,
+                           NULLIF(pct_chg, 'NaN') AS pct_chg,
+                           NULLIF(close, 'NaN') AS close
+                    FROM "{table_name}"
+                    WHERE trade_date >= :prev_date AND trade_date < :next_date
+                ) s
+                """
+                for symbol, table_name in tables.items()
+            ]
+            stmt = f"""
+                SELECT DISTINCT ON (d) TO_CHAR(d, 'YYYY-MM-DD') AS date, symbol, pct_chg
+                FROM (
+                    SELECT d, symbol,
+                           COALESCE(
+                               pct_chg,
+                               CASE WHEN prev_d = d - 1 AND prev_close > 0
+                                    THEN (close - prev_close) / prev_close * 100
+                               END
+                           ) AS pct_chg
+                    FROM ({" UNION ALL ".join(per_table)}) u
+                    WHERE d >= CAST(:start_date AS DATE)
+                ) t
+                WHERE pct_chg IS NOT NULL
+                ORDER BY d, pct_chg DESC, symbol
+            """
+            top_gainers = pd.read_sql(
+                text(stmt),
+                conn,
+                params={"prev_date": prev_date, "start_date": start_date, "next_date": next_date}
+            )
+    except Exception as e:
+        logging.error(f"查询涨幅第一失败: {e}")
+        return empty_df
     
-    if not all_data:
+    if top_gainers.empty:
         logging.warning("未找到任何数据")
-        return pd.DataFrame(columns=['date', 'symbol', 'pct_chg'])
-    
-    # 合并所有数据
-    logging.info("正在合并数据并计算涨幅第一...")
-    combined_df = pd.concat(all_data, ignore_index=True)
-    
-    # 过滤掉pct_chg为NaN的行
-    combined_df = combined_df[combined_df['pct_chg'].notna()]
-    
-    # 按日期分组，使用nlargest找出每天涨幅最大的交易对
-    top_gainers = (
-        combined_df.groupby('trade_date_str', group_keys=False)
-        .apply(lambda x: x.nlargest(1, 'pct_chg'))
-        .reset_index(drop=True)
-    )
-    
-    # 重命名列
-    top_gainers = top_gainers.rename(columns={'trade_date_str': 'date'})
-    
-    # 按日期排序
-    top_gainers = top_gainers.sort_values('date').reset_index(drop=True)
+        return empty_df
     
     # 记录日志
-    for _, row in top_gainers.iterrows():
-        logging.info(f"{row['date']}: 涨幅第一 {row['symbol']}, 涨幅 {row['pct_chg']:.2f}%")
+    for date, symbol, pct_chg in top_gainers[['date', 'symbol', 'pct_chg']].itertuples(index=False):
+        logging.info(f"{date}: 涨幅第一 {symbol}, 涨幅 {pct_chg:.2f}%")
     
     return top_gainers[['date', 'symbol', 'pct_chg']]
 
@@ -396,18 +716,24 @@ def delete_all_tables(confirm: bool = False) -> int:
             print("数据库中没有表")
             return 0
         
-        # 删除所有表
+        # 删除所有表：每批一条 DROP TABLE 语句，减少往返和目录锁的获取次数
+        # 每批单独提交，某一批失败时回滚该批，不影响已删除的表
         deleted_count = 0
-        for table_name in table_names:
+        for i in range(0, len(table_names), DROP_TABLE_BATCH_SIZE):
+            batch = table_names[i:i + DROP_TABLE_BATCH_SIZE]
             try:
                 # 🔧 改进：使用引号包裹表名，处理大小写
-                conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}";'))
-                print(f"已删除表: {table_name}")
-                deleted_count += 1
+                conn.execute(text('DROP TABLE IF EXISTS ' + ', '.join(f'"{t}"' for t in batch) + ';'))
+                conn.commit()
+                for table_name in batch:
+                    print(f"已删除表: {table_name}")
+                deleted_count += len(batch)
             except Exception as e:
-                print(f"删除表 {table_name} 失败: {e}")
+                conn.rollback()
+                print(f"删除表 {', '.join(batch)} 失败: {e}")
         
-        conn.commit()
+        forget_tables()
+        get_local_kline_data.cache_clear()
         print(f"共删除 {deleted_count} 个表")
         return deleted_count
 
@@ -456,6 +782,8 @@ def delete_table(table_name: str) -> bool:
             actual_table_name = actual_row[0]
             conn.execute(text(f'DROP TABLE IF EXISTS "{actual_table_name}";'))
             conn.commit()
+            forget_tables([actual_table_name])
+            get_local_kline_data.cache_clear()
             print(f"已成功删除表: {actual_table_name} (原请求: {table_name})")
             return True
         except Exception as e:
@@ -483,9 +811,6 @@ def delete_kline_data(
     Returns:
         Dict: 删除结果统计
     """
-    from datetime import datetime
-    from sqlalchemy import text
-    
     # 清洗输入数据
     symbol = symbol.strip().upper()
     interval = interval.strip()
@@ -535,6 +860,8 @@ def delete_kline_data(
         if start_time is None and end_time is None:
             conn.execute(text(f'DROP TABLE IF EXISTS "{actual_table_name}";'))
             conn.commit()
+            forget_tables([actual_table_name])
+            get_local_kline_data.cache_clear()
             if verbose:
                 print(f"已从数据库彻底删除表: {actual_table_name}")
             return {
@@ -544,13 +871,9 @@ def delete_kline_data(
             }
         
         # 删除指定时间范围内的数据
-        # 先获取删除前的记录数
-        count_stmt = f'SELECT COUNT(*) FROM "{actual_table_name}"'
-        count_result = conn.execute(text(count_stmt))
-        before_count = count_result.fetchone()[0]
-        
-        # 构建WHERE条件
+        # 构建WHERE条件（时间使用绑定参数）
         conditions = []
+        params = {}
         if start_time:
             try:
                 # 尝试解析完整时间格式
@@ -569,7 +892,8 @@ def delete_kline_data(
                         'message': f'无效的开始时间格式: {start_time}',
                         'deleted_count': 0
                     }
-            conditions.append(f"trade_date >= '{start_str}'")
+            conditions.append("trade_date >= :start_str")
+            params["start_str"] = start_str
         
         if end_time:
             try:
@@ -590,19 +914,17 @@ def delete_kline_data(
                         'message': f'无效的结束时间格式: {end_time}',
                         'deleted_count': 0
                     }
-            conditions.append(f"trade_date <= '{end_str}'")
+            conditions.append("trade_date <= :end_str")
+            params["end_str"] = end_str
         
         where_clause = " AND ".join(conditions)
         delete_stmt = f'DELETE FROM "{actual_table_name}" WHERE {where_clause}'
         
         try:
-            conn.execute(text(delete_stmt))
+            # 删除的记录数直接取自 DELETE 的影响行数，不需要删除前后各 COUNT 一次
+            deleted_count = conn.execute(text(delete_stmt), params).rowcount
             conn.commit()
-            
-            # 获取删除后的记录数
-            count_result = conn.execute(text(count_stmt))
-            after_count = count_result.fetchone()[0]
-            deleted_count = before_count - after_count
+            get_local_kline_data.cache_clear()
             
             if verbose:
                 print(f"已从表 {actual_table_name} 删除 {deleted_count} 条记录")
@@ -610,9 +932,7 @@ def delete_kline_data(
             return {
                 'success': True,
                 'message': f'已从表 {actual_table_name} 删除 {deleted_count} 条记录',
-                'deleted_count': deleted_count,
-                'before_count': before_count,
-                'after_count': after_count
+                'deleted_count': deleted_count
             }
         except Exception as e:
             conn.rollback()
@@ -625,98 +945,184 @@ def delete_kline_data(
             }
 
 
-def check_data_integrity(
-    symbol: Optional[str] = None,
-    interval: str = "1d",
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    check_duplicates: bool = True,
-    check_missing_dates: bool = True,
-    check_data_quality: bool = True,
-    verbose: bool = True
-) -> Dict:
+def _kline_integrity_stats(conn, symbol: str, interval: str,
+                           start_date: Optional[str] = None,
+                           end_date: Optional[str] = None) -> Optional[Dict]:
     """
-    检查数据完整性
+    用一条聚合查询计算单个交易对的完整性指标（只返回一行标量）
     
-    Args:
-        symbol: 交易对符号，如果为None则检查所有交易对
-        interval: K线间隔，默认"1d"
-        start_date: 开始日期（可选），格式: YYYY-MM-DD
-        end_date: 结束日期（可选），格式: YYYY-MM-DD
-        check_duplicates: 是否检查重复数据，默认True
-        check_missing_dates: 是否检查缺失日期，默认True
-        check_data_quality: 是否检查数据质量（空值、异常值等），默认True
-        verbose: 是否输出详细信息，默认True
+    日期过滤与 check_data_integrity 一致：按 trade_date 前10位（日期）比较。
+    空值同时统计 NULL 和 NaN，任何空值都会让调用方回退到逐行检查，
+    因此 NaN 在 SQL 与 pandas 中比较语义不同不会影响结果。
     
     Returns:
-        Dict: 包含检查结果的字典
+        指标字典；交易对不合法或查询失败时返回None（由调用方回退到读取整表）
     """
-    results = {
-        'total_symbols': 0,
-        'checked_symbols': 0,
-        'symbols_with_issues': [],
-        'summary': {
-            'duplicates': 0,
-            'missing_dates': 0,
-            'data_quality_issues': 0,
-            'empty_tables': 0
-        },
-        'details': {}
-    }
+    symbol = symbol.upper()
+    if not _SAFE_SYMBOL_RE.match(symbol):
+        return None
     
-    # 获取要检查的交易对列表
-    if symbol:
-        symbols_to_check = [symbol]
-    else:
-        symbols_to_check = get_local_symbols(interval=interval)
+    conds = []
+    params = {}
+    if start_date:
+        conds.append("substr(trade_date, 1, 10) >= :start_date")
+        params["start_date"] = start_date
+    if end_date:
+        conds.append("substr(trade_date, 1, 10) <= :end_date")
+        params["end_date"] = end_date
+    in_range = " AND ".join(conds) or "TRUE"
     
-    results['total_symbols'] = len(symbols_to_check)
+    null_cond = " OR ".join(
+        f"{col} IS NULL OR {col} = 'NaN'" for col in ('open', 'high', 'low', 'close', 'volume')
+    )
+    query = f'''
+        SELECT
+            COUNT(*) AS total_count,
+            MIN(substr(trade_date, 1, 10)) AS min_day,
+            MAX(substr(trade_date, 1, 10)) AS max_day,
+            COUNT(*) FILTER (WHERE {in_range}) AS range_count,
+            COUNT(DISTINCT trade_date) FILTER (WHERE {in_range}) AS range_distinct,
+            COUNT(DISTINCT substr(trade_date, 1, 10)) FILTER (WHERE {in_range}) AS range_days,
+            MIN(substr(trade_date, 1, 10)) FILTER (WHERE {in_range}) AS range_min_day,
+            MAX(substr(trade_date, 1, 10)) FILTER (WHERE {in_range}) AS range_max_day,
+            COUNT(*) FILTER (WHERE ({in_range}) AND ({null_cond})) AS null_rows,
+            COUNT(*) FILTER (WHERE ({in_range}) AND (
+                high < low OR open > high OR open < low OR close > high OR close < low
+            )) AS invalid_price_rows,
+            COUNT(*) FILTER (WHERE ({in_range}) AND (
+                open <= 0 OR high <= 0 OR low <= 0 OR close <= 0
+            )) AS non_positive_rows,
+            COUNT(*) FILTER (WHERE ({in_range}) AND volume < 0) AS negative_volume_rows
+        FROM "K{interval}{symbol}"
+    '''
+    try:
+        row = conn.execute(text(query), params).mappings().fetchone()
+    except Exception as e:
+        logging.debug(f"{symbol} 聚合完整性检查失败，回退到逐行检查: {e}")
+        with suppress(Exception):
+            conn.rollback()
+        return None
+    return dict(row) if row is not None else None
+
+
+def _integrity_stats_clean(stats: Dict, start_date: Optional[str], end_date: Optional[str],
+                           check_duplicates: bool, check_missing_dates: bool,
+                           check_data_quality: bool) -> bool:
+    """根据聚合指标判断是否所有启用的检查都能通过（不通过时需要读取整表列出明细）"""
+    if check_duplicates and stats['range_count'] != stats['range_distinct']:
+        return False
     
-    if verbose:
-        print(f"开始检查数据完整性...")
-        print(f"时间间隔: {interval}")
-        print(f"待检查交易对数量: {len(symbols_to_check)}")
-        if start_date:
-            print(f"开始日期: {start_date}")
-        if end_date:
-            print(f"结束日期: {end_date}")
-        print("-" * 60)
+    if check_missing_dates and stats['range_count'] > 1:
+        check_start = pd.to_datetime(start_date or stats['range_min_day'])
+        check_end = pd.to_datetime(end_date or stats['range_max_day'])
+        expected_days = max((check_end - check_start).days + 1, 0)
+        if stats['range_days'] < expected_days:
+            return False
     
-    for symbol in symbols_to_check:
-        symbol_results = {
-            'symbol': symbol,
-            'table_name': f'K{interval}{symbol}',
-            'record_count': 0,
-            'date_range': None,
-            'issues': [],
-            'duplicate_count': 0,
-            'missing_dates': [],
-            'data_quality_issues': []
-        }
-        
-        try:
-            # 获取数据
-            df = get_local_kline_data(symbol, interval=interval)
-            
-            if df.empty:
-                symbol_results['issues'].append('表为空')
-                results['summary']['empty_tables'] += 1
-                results['details'][symbol] = symbol_results
+    if check_data_quality and (
+        stats['null_rows'] or stats['invalid_price_rows']
+        or stats['non_positive_rows'] or stats['negative_volume_rows']
+    ):
+        return False
+    
+    return True
+
+
+def _scan_ohlc(df: pd.DataFrame) -> tuple:
+    """
+    一次扫描 OHLC 四列，返回 (价格不合理的行掩码, 各列 <=0 的数量)
+    
+    不合理指 high < low，或 open/close 高于 high、低于 low。open/close 先取
+    行内最大/最小值再与 high/low 比较（fmax/fmin 忽略NaN），结果与逐个条件比较一致，
+    但不需要为每个条件生成一个临时布尔数组。
+    """
+    ohlc = df[_OHLC_COLUMNS].to_numpy(dtype=np.float64)
+    open_, high, low, close = ohlc.T
+    invalid_mask = (
+        (high < low)
+        | (np.fmax(open_, close) > high)
+        | (np.fmin(open_, close) < low)
+    )
+    return invalid_mask, (ohlc <= 0).sum(axis=0)
+
+
+def _check_symbol_integrity(
+    symbol: str,
+    interval: str,
+    start_date: Optional[str],
+    end_date: Optional[str],
+    check_duplicates: bool,
+    check_missing_dates: bool,
+    check_data_quality: bool,
+    verbose: bool
+) -> tuple:
+    """
+    检查单个交易对的数据完整性（在线程池中执行，使用独立的数据库连接）
+    
+    输出不直接打印，而是收集起来由调用方按交易对顺序打印，避免多线程输出交错。
+    
+    Returns:
+        (symbol_results, 汇总计数增量, 状态, 输出行)，状态为 'ok'/'issues'/'empty'/'error'
+    """
+    summary = {
+        'duplicates': 0,
+        'missing_dates': 0,
+        'data_quality_issues': 0,
+        'empty_tables': 0
+    }
+    output = []
+    emit = output.append
+    
+    symbol_results = {
+        'symbol': symbol,
+        'table_name': f'K{interval}{symbol}',
+        'record_count': 0,
+        'date_range': None,
+        'issues': [],
+        'duplicate_count': 0,
+        'missing_dates': [],
+        'missing_count': 0,  # 缺失日期总数（missing_dates 只保存前10个）
+        'data_quality_issues': []
+    }
+    
+    try:
+        with engine.connect() as conn:
+            # 先用聚合查询检查，全部通过时不需要读取整表
+            stats = _kline_integrity_stats(conn, symbol, interval, start_date, end_date)
+            if stats is not None and stats['total_count'] > 0 and _integrity_stats_clean(
+                stats, start_date, end_date,
+                check_duplicates, check_missing_dates, check_data_quality
+            ):
+                min_date = pd.to_datetime(stats['min_day'])
+                max_date = pd.to_datetime(stats['max_day'])
+                symbol_results['record_count'] = int(stats['total_count'])
+                symbol_results['date_range'] = {
+                    'start': min_date.strftime('%Y-%m-%d'),
+                    'end': max_date.strftime('%Y-%m-%d'),
+                    'days': (max_date - min_date).days + 1
+                }
                 if verbose:
-                    print(f"⚠️  {symbol}: 表为空")
-                continue
+                    emit(f"✅ {symbol}: 数据完整性检查通过（{symbol_results['record_count']} 条记录，日期范围: {symbol_results['date_range']['start']} 至 {symbol_results['date_range']['end']}）")
+                return symbol_results, summary, 'ok', output
             
+            # 有问题（或聚合查询不可用）时读取整表，列出具体的问题数据
+            df = get_local_kline_data(symbol, interval=interval, columns=_KLINE_CHECK_COLUMNS, conn=conn)
+        
+            if df.empty:
+                symbol_results['issues'].append('表为空')
+                summary['empty_tables'] += 1
+                if verbose:
+                    emit(f"⚠️  {symbol}: 表为空")
+                return symbol_results, summary, 'empty', output
+        
             symbol_results['record_count'] = len(df)
-            
+        
             # 处理日期格式
-            if df['trade_date'].dtype == 'object':
-                df['trade_date_dt'] = pd.to_datetime(df['trade_date'].str[:10])
-            else:
-                df['trade_date_dt'] = pd.to_datetime(df['trade_date'])
-            
+            df['trade_date_dt'] = _trade_days(df['trade_date'])
+        
             # 按日期排序
             df = df.sort_values('trade_date_dt').reset_index(drop=True)
-            
+        
             # 日期范围
             min_date = df['trade_date_dt'].min()
             max_date = df['trade_date_dt'].max()
@@ -725,7 +1131,7 @@ def check_data_integrity(
                 'end': max_date.strftime('%Y-%m-%d'),
                 'days': (max_date - min_date).days + 1
             }
-            
+        
             # 如果指定了日期范围，进行过滤
             if start_date:
                 start_dt = pd.to_datetime(start_date)
@@ -733,7 +1139,7 @@ def check_data_integrity(
             if end_date:
                 end_dt = pd.to_datetime(end_date)
                 df = df[df['trade_date_dt'] <= end_dt]
-            
+        
             # 1. 检查重复数据
             if check_duplicates:
                 duplicate_mask = df.duplicated(subset=['trade_date'], keep=False)
@@ -741,10 +1147,10 @@ def check_data_integrity(
                 if duplicate_count > 0:
                     symbol_results['duplicate_count'] = duplicate_count
                     symbol_results['issues'].append(f'发现 {duplicate_count} 条重复数据')
-                    results['summary']['duplicates'] += duplicate_count
+                    summary['duplicates'] += duplicate_count
                     if verbose:
-                        print(f"⚠️  {symbol}: 发现 {duplicate_count} 条重复数据")
-            
+                        emit(f"⚠️  {symbol}: 发现 {duplicate_count} 条重复数据")
+        
             # 2. 检查缺失日期
             if check_missing_dates and len(df) > 1:
                 # 确定检查的起始日期
@@ -757,84 +1163,55 @@ def check_data_integrity(
                     check_start_date = df['trade_date_dt'].min()
                     if verbose:
                         logging.debug(f"{symbol} 未指定开始日期，使用数据最早日期: {check_start_date.strftime('%Y-%m-%d')}")
-                
+            
                 # 确定检查的结束日期
                 if end_date:
                     check_end_date = pd.to_datetime(end_date)
                 else:
                     # 使用数据中的最晚日期作为结束日期
                     check_end_date = df['trade_date_dt'].max()
-                
-                # 转换interval为pandas频率
-                freq_map = {
-                    '1d': 'D',
-                    '1h': 'h',  # 使用小写 'h' 替代已弃用的 'H'
-                    '4h': '4h',  # 使用小写 'h' 替代已弃用的 'H'
-                    '1m': '1min',
-                    '5m': '5min',
-                    '15m': '15min',
-                    '30m': '30min'
-                }
-                freq = freq_map.get(interval, 'D')
-                
-                # 生成期望的日期序列（从检查起始日期到结束日期）
-                if freq != 'D':
-                    date_range = pd.date_range(
-                        start=check_start_date,
-                        end=check_end_date,
-                        freq=freq
-                    )
-                else:
-                    date_range = pd.date_range(
-                        start=check_start_date,
-                        end=check_end_date,
-                        freq='D'
-                    )
-                
-                # 获取实际存在的日期
-                existing_dates = set(df['trade_date_dt'].dt.date)
-                
-                # 只检查在检查范围内的日期
-                check_date_range = pd.date_range(start=check_start_date, end=check_end_date, freq=freq)
-                check_date_set = set(check_date_range.date)
-                
-                # 找出在检查范围内但不存在的数据
-                missing_dates = sorted(check_date_set - existing_dates)
-                
-                if missing_dates:
+            
+                # 缺失检查按天比较，分钟/小时级别也只需要检查范围内的每一天，
+                # 不必按K线频率生成完整的时间序列
+                expected_days = pd.date_range(
+                    start=check_start_date.normalize(),
+                    end=check_end_date.normalize(),
+                    freq='D'
+                )
+            
+                # 找出在检查范围内但不存在的日期（结果已排序）
+                existing_days = pd.DatetimeIndex(df['trade_date_dt'].dropna().unique())
+                missing_dates = expected_days.difference(existing_days)
+            
+                if len(missing_dates):
                     symbol_results['missing_dates'] = [d.strftime('%Y-%m-%d') for d in missing_dates[:10]]  # 只保存前10个
                     missing_count = len(missing_dates)
+                    symbol_results['missing_count'] = missing_count
                     symbol_results['issues'].append(f'缺失 {missing_count} 个日期')
-                    results['summary']['missing_dates'] += missing_count
+                    summary['missing_dates'] += missing_count
                     if verbose:
-                        print(f"⚠️  {symbol}: 缺失 {missing_count} 个日期（显示前10个: {symbol_results['missing_dates']}）")
-            
+                        emit(f"⚠️  {symbol}: 缺失 {missing_count} 个日期（显示前10个: {symbol_results['missing_dates']}）")
+        
             # 3. 检查数据质量
             if check_data_quality:
                 quality_issues = []
-                
+            
                 # 检查关键字段是否有空值
                 required_fields = ['open', 'high', 'low', 'close', 'volume']
                 for field in required_fields:
                     null_count = df[field].isna().sum()
                     if null_count > 0:
                         quality_issues.append(f'{field} 字段有 {null_count} 个空值')
-                
-                # 检查价格数据的合理性
-                invalid_price_mask = (
-                    (df['high'] < df['low']) |
-                    (df['open'] > df['high']) |
-                    (df['open'] < df['low']) |
-                    (df['close'] > df['high']) |
-                    (df['close'] < df['low'])
-                )
+            
+                # 检查价格数据的合理性（一次扫描同时得到非正价格计数）
+                invalid_price_mask, non_positive_counts = _scan_ohlc(df)
                 invalid_price_count = invalid_price_mask.sum()
                 if invalid_price_count > 0:
                     # 获取具体的问题数据
                     invalid_rows = df[invalid_price_mask].copy()
                     # 只保留前20条问题数据，避免输出过多
                     invalid_rows_display = invalid_rows.head(20)
-                    
+                
                     invalid_data_list = []
                     for idx, row in invalid_rows_display.iterrows():
                         issues = []
@@ -848,13 +1225,13 @@ def check_data_integrity(
                             issues.append(f"close({row['close']}) > high({row['high']})")
                         if row['close'] < row['low']:
                             issues.append(f"close({row['close']}) < low({row['low']})")
-                        
+                    
                         trade_date = row.get('trade_date', 'N/A')
                         if isinstance(trade_date, pd.Timestamp):
                             trade_date = trade_date.strftime('%Y-%m-%d %H:%M:%S')
                         elif pd.isna(trade_date):
                             trade_date = 'N/A'
-                        
+                    
                         invalid_data_list.append({
                             'trade_date': str(trade_date),
                             'open': float(row['open']) if pd.notna(row['open']) else None,
@@ -863,58 +1240,138 @@ def check_data_integrity(
                             'close': float(row['close']) if pd.notna(row['close']) else None,
                             'issues': issues
                         })
-                    
+                
                     quality_issues.append(f'发现 {invalid_price_count} 条价格数据不合理（high < low 或 open/close 超出范围）')
                     # 将具体的问题数据添加到symbol_results中
                     if 'invalid_price_data' not in symbol_results:
                         symbol_results['invalid_price_data'] = []
                     symbol_results['invalid_price_data'].extend(invalid_data_list)
-                    
+                    symbol_results['invalid_price_count'] = len(symbol_results['invalid_price_data'])
+                
                     if verbose:
-                        print(f"⚠️  {symbol}: 发现 {invalid_price_count} 条价格数据不合理")
+                        emit(f"⚠️  {symbol}: 发现 {invalid_price_count} 条价格数据不合理")
                         for data in invalid_data_list[:5]:  # 只显示前5条
-                            print(f"   日期: {data['trade_date']}, open={data['open']}, high={data['high']}, low={data['low']}, close={data['close']}, 问题: {', '.join(data['issues'])}")
+                            emit(f"   日期: {data['trade_date']}, open={data['open']}, high={data['high']}, low={data['low']}, close={data['close']}, 问题: {', '.join(data['issues'])}")
                         if invalid_price_count > 5:
-                            print(f"   ... 还有 {invalid_price_count - 5} 条问题数据未显示")
-                
+                            emit(f"   ... 还有 {invalid_price_count - 5} 条问题数据未显示")
+            
                 # 检查价格是否为0或负数
-                price_fields = ['open', 'high', 'low', 'close']
-                for field in price_fields:
-                    invalid_count = (df[field] <= 0).sum()
+                for field, invalid_count in zip(_OHLC_COLUMNS, non_positive_counts):
                     if invalid_count > 0:
                         quality_issues.append(f'{field} 字段有 {invalid_count} 个无效值（<=0）')
-                
+            
                 # 检查成交量是否为负数
                 if 'volume' in df.columns:
                     invalid_volume_count = (df['volume'] < 0).sum()
                     if invalid_volume_count > 0:
                         quality_issues.append(f'volume 字段有 {invalid_volume_count} 个负数')
-                
+            
                 if quality_issues:
                     symbol_results['data_quality_issues'] = quality_issues
                     symbol_results['issues'].extend(quality_issues)
-                    results['summary']['data_quality_issues'] += len(quality_issues)
+                    summary['data_quality_issues'] += len(quality_issues)
                     if verbose:
                         for issue in quality_issues:
-                            print(f"⚠️  {symbol}: {issue}")
-            
+                            emit(f"⚠️  {symbol}: {issue}")
+        
             # 如果没有问题，标记为通过
             if not symbol_results['issues']:
-                results['checked_symbols'] += 1
                 if verbose:
-                    print(f"✅ {symbol}: 数据完整性检查通过（{symbol_results['record_count']} 条记录，日期范围: {symbol_results['date_range']['start']} 至 {symbol_results['date_range']['end']}）")
-            else:
-                results['symbols_with_issues'].append(symbol)
+                    emit(f"✅ {symbol}: 数据完整性检查通过（{symbol_results['record_count']} 条记录，日期范围: {symbol_results['date_range']['start']} 至 {symbol_results['date_range']['end']}）")
+                return symbol_results, summary, 'ok', output
+            return symbol_results, summary, 'issues', output
+        
+    except Exception as e:
+        symbol_results['issues'].append(f'检查失败: {str(e)}')
+        if verbose:
+            emit(f"❌ {symbol}: 检查失败 - {str(e)}")
+        return symbol_results, summary, 'error', output
+
+
+def check_data_integrity(
+    symbol: Optional[str] = None,
+    interval: str = "1d",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    check_duplicates: bool = True,
+    check_missing_dates: bool = True,
+    check_data_quality: bool = True,
+    verbose: bool = True
+) -> Dict:
+    """
+    检查数据完整性
+    
+    Args:
+        symbol: 交易对符号，如果为None则检查所有交易对
+        interval: K线间隔，默认"1d"
+        start_date: 开始日期（可选），格式: YYYY-MM-DD
+        end_date: 结束日期（可选），格式: YYYY-MM-DD
+        check_duplicates: 是否检查重复数据，默认True
+        check_missing_dates: 是否检查缺失日期，默认True
+        check_data_quality: 是否检查数据质量（空值、异常值等），默认True
+        verbose: 是否输出详细信息，默认True
+    
+    Returns:
+        Dict: 包含检查结果的字典
+    """
+    results = {
+        'total_symbols': 0,
+        'checked_symbols': 0,
+        'symbols_with_issues': [],
+        'summary': {
+            'duplicates': 0,
+            'missing_dates': 0,
+            'data_quality_issues': 0,
+            'empty_tables': 0,
+            'total_records': 0
+        },
+        'details': {}
+    }
+    
+    # 获取要检查的交易对列表
+    if symbol:
+        symbols_to_check = [symbol]
+    else:
+        symbols_to_check = get_local_symbols(interval=interval)
+    
+    results['total_symbols'] = len(symbols_to_check)
+    
+    if verbose:
+        print(f"开始检查数据完整性...")
+        print(f"时间间隔: {interval}")
+        print(f"待检查交易对数量: {len(symbols_to_check)}")
+        if start_date:
+            print(f"开始日期: {start_date}")
+        if end_date:
+            print(f"结束日期: {end_date}")
+        print("-" * 60)
+    
+    # 各交易对的检查相互独立，主要耗时在数据库往返，用线程池并行执行
+    # 每个任务从连接池取独立连接；map 按输入顺序返回，汇总和输出顺序与串行一致
+    workers = max(1, min(DB_QUERY_WORKERS, len(symbols_to_check)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        checks = executor.map(
+            lambda s: _check_symbol_integrity(
+                s, interval, start_date, end_date,
+                check_duplicates, check_missing_dates, check_data_quality, verbose
+            ),
+            symbols_to_check
+        )
+        for symbol, (symbol_results, summary, status, output) in zip(symbols_to_check, checks):
+            # 每个交易对的输出合并为一次写入，减少 stdout 加锁和系统调用
+            if output:
+                print("\n".join(output))
+            for key, value in summary.items():
+                results['summary'][key] += value
+            results['summary']['total_records'] += symbol_results['record_count']
+            if status in ('ok', 'issues'):
                 results['checked_symbols'] += 1
-            
-            results['details'][symbol] = symbol_results
-            
-        except Exception as e:
-            symbol_results['issues'].append(f'检查失败: {str(e)}')
-            results['symbols_with_issues'].append(symbol)
+            if status in ('issues', 'error'):
+                results['symbols_with_issues'].append(symbol)
             results['details'][symbol] = symbol_results
-            if verbose:
-                print(f"❌ {symbol}: 检查失败 - {str(e)}")
+    
+    # 问题分类，供生成报告时直接使用（下划线开头的键不随 API 返回）
+    results['_categories'] = _categorize_issues(results['symbols_with_issues'], results['details'])
     
     # 输出总结
     if verbose:
@@ -936,354 +1393,527 @@ def check_data_integrity(
     return results
 
 
-def generate_integrity_report(
-    check_results: Dict,
-    interval: str,
+def check_data_integrity_cached(
+    symbol: Optional[str] = None,
+    interval: str = "1d",
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     check_duplicates: bool = True,
     check_missing_dates: bool = True,
     check_data_quality: bool = True,
-    output_format: str = "text",
-    output_file: Optional[str] = None
-) -> str:
+    verbose: bool = True,
+    force: bool = False
+) -> Dict:
     """
-    生成数据完整性检查报告
+    带缓存的 check_data_integrity
+    
+    相同参数在 INTEGRITY_CACHE_TTL 秒内重复检查时直接返回上次的结果（副本），
+    本进程写入数据后（get_local_kline_data.cache_clear()）缓存失效。
     
     Args:
-        check_results: check_data_integrity() 返回的检查结果
-        interval: K线间隔
-        start_date: 检查的开始日期（可选）
-        end_date: 检查的结束日期（可选）
-        check_duplicates: 是否检查了重复数据
-        check_missing_dates: 是否检查了缺失日期
-        check_data_quality: 是否检查了数据质量
-        output_format: 输出格式，可选: "text", "json", "html", "markdown"
-        output_file: 输出文件路径（可选），如果提供则保存到文件
+        与 check_data_integrity 相同；verbose 不影响缓存键
+        force: 为True时忽略缓存重新检查
     
     Returns:
-        str: 报告内容
+        Dict: 检查结果，调用方可以自由修改
+    """
+    key = (symbol, interval, start_date, end_date, check_duplicates, check_missing_dates, check_data_quality)
+    now = time.monotonic()
+    if not force:
+        with _integrity_cache_lock:
+            cached = _integrity_cache.get(key)
+        if cached is not None and now - cached[0] < INTEGRITY_CACHE_TTL:
+            if verbose:
+                print(f"使用 {int(now - cached[0])} 秒前的数据完整性检查结果")
+            return copy.deepcopy(cached[1])
+    
+    results = check_data_integrity(
+        symbol=symbol,
+        interval=interval,
+        start_date=start_date,
+        end_date=end_date,
+        check_duplicates=check_duplicates,
+        check_missing_dates=check_missing_dates,
+        check_data_quality=check_data_quality,
+        verbose=verbose
+    )
+    with _integrity_cache_lock:
+        _integrity_cache.pop(key, None)
+        while len(_integrity_cache) >= INTEGRITY_CACHE_SIZE:
+            # dict 保持插入顺序，淘汰最早的结果
+            _integrity_cache.pop(next(iter(_integrity_cache)))
+        _integrity_cache[key] = (now, copy.deepcopy(results))
+    return results
+
+
+def _missing_count(details: Dict) -> int:
+    """交易对的缺失日期总数（旧的检查结果没有 missing_count 时按保存的缺失日期计算）"""
+    return details.get('missing_count') or len(details['missing_dates'])
+
+
+def _categorize_issues(symbols: List[str], details_map: Dict) -> Dict[str, List[str]]:
+    """把有问题的交易对按问题类型分类（一个交易对可以属于多个类型）"""
+    categories = {'empty': [], 'duplicates': [], 'missing': [], 'quality': []}
+    for symbol in symbols:
+        details = details_map[symbol]
+        if details['record_count'] == 0:
+            categories['empty'].append(symbol)
+        if details['duplicate_count'] > 0:
+            categories['duplicates'].append(symbol)
+        if details['missing_dates']:
+            categories['missing'].append(symbol)
+        if details['data_quality_issues']:
+            categories['quality'].append(symbol)
+    return categories
+
+
+def _integrity_quality(summary: Dict, details_map: Dict) -> tuple:
+    """
+    计算数据质量评分
+    
+    Returns:
+        (问题总数, 总记录数, 问题率, 质量评分, 质量等级)，没有记录时后三项为None
+    """
+    total_issues = (
+        summary['duplicates'] +
+        summary['missing_dates'] +
+        summary['data_quality_issues']
+    )
+    # check_data_integrity 已在汇总中累计了记录数，旧的检查结果没有该字段时再逐个求和
+    total_records = summary.get('total_records') or sum(d['record_count'] for d in details_map.values())
+    if total_records <= 0:
+        return total_issues, total_records, None, None, None
+    
+    issue_rate = (total_issues / total_records) * 100
+    quality_score = max(0, 100 - issue_rate * 10)  # 每个问题扣10分，最低0分
+    
+    # 质量等级
+    if quality_score >= 95:
+        quality_level = "优秀"
+    elif quality_score >= 85:
+        quality_level = "良好"
+    elif quality_score >= 70:
+        quality_level = "一般"
+    elif quality_score >= 60:
+        quality_level = "较差"
+    else:
+        quality_level = "很差"
+    return total_issues, total_records, issue_rate, quality_score, quality_level
+
+
+def _iter_report_lines(
+    check_results: Dict,
+    interval: str,
+    start_date: Optional[str],
+    end_date: Optional[str],
+    check_duplicates: bool,
+    check_missing_dates: bool,
+    check_data_quality: bool,
+    report_time: Optional[datetime] = None,
+    quality: Optional[tuple] = None
+) -> Iterator[str]:
     """
-    from datetime import datetime
+    逐行生成文本格式的数据完整性报告（写文件时不需要先拼成完整字符串）
     
-    report_lines = []
+    quality 为 _integrity_quality() 的结果，调用方已经算过时传入，避免重复计算。
+    """
+    if report_time is None:
+        report_time = datetime.now()
+    summary = check_results['summary']
+    details_map = check_results['details']
+    issues_list = check_results['symbols_with_issues']
+    issues_set = set(issues_list)
     
     # 报告头部
-    report_lines.append("=" * 80)
-    report_lines.append("数据完整性检查报告")
-    report_lines.append("=" * 80)
-    report_lines.append(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    report_lines.append(f"K线间隔: {interval}")
+    yield from (
+        REPORT_SEP,
+        "数据完整性检查报告",
+        REPORT_SEP,
+        f"生成时间: {report_time.strftime('%Y-%m-%d %H:%M:%S')}",
+        f"K线间隔: {interval}",
+    )
     if start_date:
-        report_lines.append(f"开始日期: {start_date}")
+        yield f"开始日期: {start_date}"
     if end_date:
-        report_lines.append(f"结束日期: {end_date}")
-    report_lines.append("")
+        yield f"结束日期: {end_date}"
+    yield ""
     
     # 检查配置
-    report_lines.append("检查配置:")
-    report_lines.append(f"  - 检查重复数据: {'是' if check_duplicates else '否'}")
-    report_lines.append(f"  - 检查缺失日期: {'是' if check_missing_dates else '否'}")
-    report_lines.append(f"  - 检查数据质量: {'是' if check_data_quality else '否'}")
-    report_lines.append("")
+    yield from (
+        "检查配置:",
+        f"  - 检查重复数据: {'是' if check_duplicates else '否'}",
+        f"  - 检查缺失日期: {'是' if check_missing_dates else '否'}",
+        f"  - 检查数据质量: {'是' if check_data_quality else '否'}",
+        "",
+    )
     
     # 总体统计
-    report_lines.append("=" * 80)
-    report_lines.append("总体统计")
-    report_lines.append("=" * 80)
-    report_lines.append(f"总交易对数: {check_results['total_symbols']}")
-    report_lines.append(f"已检查交易对数: {check_results['checked_symbols']}")
-    report_lines.append(f"有问题的交易对数: {len(check_results['symbols_with_issues'])}")
-    report_lines.append(f"数据完整性: {((check_results['checked_symbols'] - len(check_results['symbols_with_issues'])) / check_results['checked_symbols'] * 100):.2f}%" if check_results['checked_symbols'] > 0 else "N/A")
-    report_lines.append("")
+    yield from (
+        REPORT_SEP,
+        "总体统计",
+        REPORT_SEP,
+        f"总交易对数: {check_results['total_symbols']}",
+        f"已检查交易对数: {check_results['checked_symbols']}",
+        f"有问题的交易对数: {len(issues_list)}",
+        f"数据完整性: {((check_results['checked_symbols'] - len(issues_list)) / check_results['checked_symbols'] * 100):.2f}%" if check_results['checked_symbols'] > 0 else "N/A",
+        "",
+    )
     
     # 问题分类统计
-    report_lines.append("问题分类统计:")
-    report_lines.append(f"  - 空表数量: {check_results['summary']['empty_tables']}")
-    report_lines.append(f"  - 重复数据总数: {check_results['summary']['duplicates']}")
-    report_lines.append(f"  - 缺失日期总数: {check_results['summary']['missing_dates']}")
-    report_lines.append(f"  - 数据质量问题总数: {check_results['summary']['data_quality_issues']}")
-    report_lines.append("")
+    yield from (
+        "问题分类统计:",
+        f"  - 空表数量: {summary['empty_tables']}",
+        f"  - 重复数据总数: {summary['duplicates']}",
+        f"  - 缺失日期总数: {summary['missing_dates']}",
+        f"  - 数据质量问题总数: {summary['data_quality_issues']}",
+        "",
+    )
     
     # 数据质量评分
-    total_issues = (
-        check_results['summary']['duplicates'] +
-        check_results['summary']['missing_dates'] +
-        check_results['summary']['data_quality_issues']
+    total_issues, total_records, issue_rate, quality_score, quality_level = (
+        quality or _integrity_quality(summary, details_map)
     )
-    total_records = sum(details.get('record_count', 0) for details in check_results['details'].values())
-    
-    # 初始化质量评分变量
-    quality_score = None
-    quality_level = None
-    
     if total_records > 0:
-        issue_rate = (total_issues / total_records) * 100 if total_records > 0 else 0
-        quality_score = max(0, 100 - issue_rate * 10)  # 每个问题扣10分，最低0分
-        report_lines.append("数据质量评分:")
-        report_lines.append(f"  - 总记录数: {total_records:,}")
-        report_lines.append(f"  - 问题总数: {total_issues}")
-        report_lines.append(f"  - 问题率: {issue_rate:.4f}%")
-        report_lines.append(f"  - 质量评分: {quality_score:.2f}/100")
-        
-        # 质量等级
-        if quality_score >= 95:
-            quality_level = "优秀"
-        elif quality_score >= 85:
-            quality_level = "良好"
-        elif quality_score >= 70:
-            quality_level = "一般"
-        elif quality_score >= 60:
-            quality_level = "较差"
-        else:
-            quality_level = "很差"
-        report_lines.append(f"  - 质量等级: {quality_level}")
-        report_lines.append("")
+        yield from (
+            "数据质量评分:",
+            f"  - 总记录数: {total_records:,}",
+            f"  - 问题总数: {total_issues}",
+            f"  - 问题率: {issue_rate:.4f}%",
+            f"  - 质量评分: {quality_score:.2f}/100",
+            f"  - 质量等级: {quality_level}",
+            "",
+        )
     
     # 有问题的交易对详情
-    if check_results['symbols_with_issues']:
-        report_lines.append("=" * 80)
-        report_lines.append("有问题的交易对详情")
-        report_lines.append("=" * 80)
-        
-        # 按问题类型分类
-        empty_tables = []
-        duplicate_issues = []
-        missing_date_issues = []
-        quality_issues = []
+    if issues_list:
+        yield from (
+            REPORT_SEP,
+            "有问题的交易对详情",
+            REPORT_SEP,
+        )
         
-        for symbol in check_results['symbols_with_issues']:
-            details = check_results['details'][symbol]
-            if details['record_count'] == 0:
-                empty_tables.append(symbol)
-            if details['duplicate_count'] > 0:
-                duplicate_issues.append((symbol, details))
-            if details['missing_dates']:
-                missing_date_issues.append((symbol, details))
-            if details['data_quality_issues']:
-                quality_issues.append((symbol, details))
+        # 按问题类型分类（check_data_integrity 已分好类，旧的检查结果没有时再分类）
+        categories = check_results.get('_categories') or _categorize_issues(issues_list, details_map)
+        empty_tables = categories['empty']
+        duplicate_issues = [(symbol, details_map[symbol]) for symbol in categories['duplicates']]
+        missing_date_issues = [(symbol, details_map[symbol]) for symbol in categories['missing']]
+        quality_issues = [(symbol, details_map[symbol]) for symbol in categories['quality']]
         
         # 空表
         if empty_tables:
-            report_lines.append(f"\n空表交易对 ({len(empty_tables)} 个):")
+            yield f"\n空表交易对 ({len(empty_tables)} 个):"
             for symbol in empty_tables[:20]:  # 只显示前20个
-                report_lines.append(f"  - {symbol}")
+                yield f"  - {symbol}"
             if len(empty_tables) > 20:
-                report_lines.append(f"  ... 还有 {len(empty_tables) - 20} 个空表")
+                yield f"  ... 还有 {len(empty_tables) - 20} 个空表"
         
         # 重复数据
         if duplicate_issues:
-            report_lines.append(f"\n有重复数据的交易对 ({len(duplicate_issues)} 个):")
-            for symbol, details in duplicate_issues[:10]:
-                report_lines.append(f"  - {symbol}: {details['duplicate_count']} 条重复数据")
+            yield f"\n有重复数据的交易对 ({len(duplicate_issues)} 个):"
+            # 只显示重复最多的前10个（同样多时保持原顺序）
+            for symbol, details in heapq.nlargest(10, duplicate_issues, key=lambda item: item[1]['duplicate_count']):
+                yield f"  - {symbol}: {details['duplicate_count']} 条重复数据"
             if len(duplicate_issues) > 10:
-                report_lines.append(f"  ... 还有 {len(duplicate_issues) - 10} 个交易对有重复数据")
+                yield f"  ... 还有 {len(duplicate_issues) - 10} 个交易对有重复数据"
         
         # 缺失日期
         if missing_date_issues:
-            report_lines.append(f"\n有缺失日期的交易对 ({len(missing_date_issues)} 个):")
-            for symbol, details in missing_date_issues[:10]:
-                missing_count = len(details['missing_dates'])
+            yield f"\n有缺失日期的交易对 ({len(missing_date_issues)} 个):"
+            # 只显示缺失最多的前10个（同样多时保持原顺序）
+            for symbol, details in heapq.nlargest(10, missing_date_issues, key=lambda item: _missing_count(item[1])):
+                missing_count = _missing_count(details)
                 date_range = details.get('date_range', {})
                 if date_range:
-                    report_lines.append(
+                    yield (
                         f"  - {symbol}: 缺失 {missing_count} 个日期 "
                         f"(数据范围: {date_range['start']} 至 {date_range['end']}, "
                         f"共 {date_range['days']} 天, 实际有 {details['record_count']} 条记录)"
                     )
                     if details['missing_dates']:
-                        missing_dates_str = ', '.join(details['missing_dates'][:5])
+                        # 最早的5个缺失日期（YYYY-MM-DD 按字符串比较即按日期比较，不要求列表有序）
+                        missing_dates_str = ', '.join(heapq.nsmallest(5, details['missing_dates']))
                         if missing_count > 5:
                             missing_dates_str += f" ... (还有 {missing_count - 5} 个)"
-                        report_lines.append(f"    缺失日期示例: {missing_dates_str}")
+                        yield f"    缺失日期示例: {missing_dates_str}"
                 else:
-                    report_lines.append(f"  - {symbol}: 缺失 {missing_count} 个日期")
+                    yield f"  - {symbol}: 缺失 {missing_count} 个日期"
             if len(missing_date_issues) > 10:
-                report_lines.append(f"  ... 还有 {len(missing_date_issues) - 10} 个交易对有缺失日期")
+                yield f"  ... 还有 {len(missing_date_issues) - 10} 个交易对有缺失日期"
         
         # 数据质量问题
         if quality_issues:
-            report_lines.append(f"\n有数据质量问题的交易对 ({len(quality_issues)} 个):")
-            for symbol, details in quality_issues[:10]:
-                report_lines.append(f"  - {symbol}:")
+            yield f"\n有数据质量问题的交易对 ({len(quality_issues)} 个):"
+            # 只显示问题最多的前10个（同样多时保持原顺序）
+            for symbol, details in heapq.nlargest(10, quality_issues, key=lambda item: len(item[1]['data_quality_issues'])):
+                yield f"  - {symbol}:"
                 for issue in details['data_quality_issues']:
-                    report_lines.append(f"    * {issue}")
+                    yield f"    * {issue}"
                 
                 # 如果有价格数据不合理的问题，显示具体的问题数据
-                if 'invalid_price_data' in details and details['invalid_price_data']:
-                    invalid_data_list = details['invalid_price_data']
-                    report_lines.append(f"    价格数据不合理详情 (共 {len(invalid_data_list)} 条):")
+                invalid_data_list = details.get('invalid_price_data')
+                if invalid_data_list:
+                    yield f"    价格数据不合理详情 (共 {details.get('invalid_price_count', len(invalid_data_list))} 条):"
                     # 显示所有问题数据（报告中应该包含完整信息）
                     for idx, data in enumerate(invalid_data_list, 1):
-                        report_lines.append(f"      [{idx}] 日期: {data['trade_date']}")
-                        report_lines.append(f"          open={data['open']}, high={data['high']}, low={data['low']}, close={data['close']}")
-                        report_lines.append(f"          问题: {', '.join(data['issues'])}")
+                        yield from (
+                            f"      [{idx}] 日期: {data['trade_date']}",
+                            f"          open={data['open']}, high={data['high']}, low={data['low']}, close={data['close']}",
+                            f"          问题: {', '.join(data['issues'])}",
+                        )
             if len(quality_issues) > 10:
-                report_lines.append(f"  ... 还有 {len(quality_issues) - 10} 个交易对有数据质量问题")
+                yield f"  ... 还有 {len(quality_issues) - 10} 个交易对有数据质量问题"
     
     # 正常交易对统计
-    normal_symbols = [
-        symbol for symbol, details in check_results['details'].items()
-        if symbol not in check_results['symbols_with_issues']
-    ]
+    normal_symbols = [symbol for symbol in details_map if symbol not in issues_set]
     if normal_symbols:
-        report_lines.append("\n" + "=" * 80)
-        report_lines.append("数据正常的交易对")
-        report_lines.append("=" * 80)
-        report_lines.append(f"正常交易对数: {len(normal_symbols)}")
+        yield from (
+            "\n" + REPORT_SEP,
+            "数据正常的交易对",
+            REPORT_SEP,
+            f"正常交易对数: {len(normal_symbols)}",
+        )
         if len(normal_symbols) <= 20:
             for symbol in normal_symbols:
-                details = check_results['details'][symbol]
+                details = details_map[symbol]
                 date_range = details.get('date_range', {})
                 if date_range:
-                    report_lines.append(
+                    yield (
                         f"  - {symbol}: {details['record_count']} 条记录 "
                         f"({date_range['start']} 至 {date_range['end']})"
                     )
                 else:
-                    report_lines.append(f"  - {symbol}: {details['record_count']} 条记录")
+                    yield f"  - {symbol}: {details['record_count']} 条记录"
         else:
-            report_lines.append(f"  (前20个)")
+            yield f"  (前20个)"
             for symbol in normal_symbols[:20]:
-                details = check_results['details'][symbol]
+                details = details_map[symbol]
                 date_range = details.get('date_range', {})
                 if date_range:
-                    report_lines.append(
+                    yield (
                         f"  - {symbol}: {details['record_count']} 条记录 "
                         f"({date_range['start']} 至 {date_range['end']})"
                     )
                 else:
-                    report_lines.append(f"  - {symbol}: {details['record_count']} 条记录")
-            report_lines.append(f"  ... 还有 {len(normal_symbols) - 20} 个正常交易对")
+                    yield f"  - {symbol}: {details['record_count']} 条记录"
+            yield f"  ... 还有 {len(normal_symbols) - 20} 个正常交易对"
     
     # 建议和修复方案
-    report_lines.append("\n" + "=" * 80)
-    report_lines.append("建议和修复方案")
-    report_lines.append("=" * 80)
-    
-    if check_results['summary']['empty_tables'] > 0:
-        report_lines.append(f"\n1. 发现 {check_results['summary']['empty_tables']} 个空表:")
-        report_lines.append("   建议: 使用数据下载功能下载这些交易对的数据")
-        report_lines.append(f"   命令: python download_klines.py --interval {interval} --missing-only")
-    
-    if check_results['summary']['missing_dates'] > 0:
-        report_lines.append(f"\n2. 发现 {check_results['summary']['missing_dates']} 个缺失日期:")
-        report_lines.append("   建议: 使用自动下载缺失数据功能补充缺失的日期")
-        report_lines.append("   方法: 在前端点击'自动下载缺失数据'按钮，或使用命令行:")
-        report_lines.append(f"         python data.py --interval {interval} --auto-download")
-    
-    if check_results['summary']['duplicates'] > 0:
-        report_lines.append(f"\n3. 发现 {check_results['summary']['duplicates']} 条重复数据:")
-        report_lines.append("   建议: 清理重复数据，可以使用数据库工具删除重复记录")
-        report_lines.append("   注意: 重复数据可能影响分析结果的准确性")
-    
-    if check_results['summary']['data_quality_issues'] > 0:
-        report_lines.append(f"\n4. 发现 {check_results['summary']['data_quality_issues']} 个数据质量问题:")
-        report_lines.append("   建议: 检查数据来源，可能需要重新下载有问题的数据")
-        report_lines.append("   注意: 数据质量问题可能导致回测和分析结果不准确")
+    yield from (
+        "\n" + REPORT_SEP,
+        "建议和修复方案",
+        REPORT_SEP,
+    )
     
-    if total_issues == 0:
-        report_lines.append("\n✓ 恭喜！所有数据检查通过，数据完整性良好。")
+    if summary['empty_tables'] > 0:
+        yield from (
+            f"\n1. 发现 {summary['empty_tables']} 个空表:",
+            "   建议: 使用数据下载功能下载这些交易对的数据",
+            f"   命令: python download_klines.py --interval {interval} --missing-only",
+        )
     
-    # 报告尾部
-    report_lines.append("\n" + "=" * 80)
-    report_lines.append("报告结束")
-    report_lines.append("=" * 80)
+    if summary['missing_dates'] > 0:
+        yield from (
+            f"\n2. 发现 {summary['missing_dates']} 个缺失日期:",
+            "   建议: 使用自动下载缺失数据功能补充缺失的日期",
+            "   方法: 在前端点击'自动下载缺失数据'按钮，或使用命令行:",
+            f"         python data.py --interval {interval} --auto-download",
+        )
     
-    report_content = "\n".join(report_lines)
+    if summary['duplicates'] > 0:
+        yield from (
+            f"\n3. 发现 {summary['duplicates']} 条重复数据:",
+            "   建议: 清理重复数据，可以使用数据库工具删除重复记录",
+            "   注意: 重复数据可能影响分析结果的准确性",
+        )
     
-    # 根据格式输出
-    if output_format == "json":
-        import json
-        report_dict = {
-            "report_time": datetime.now().isoformat(),
-            "config": {
-                "interval": interval,
-                "start_date": start_date,
-                "end_date": end_date,
-                "check_duplicates": check_duplicates,
-                "check_missing_dates": check_missing_dates,
-                "check_data_quality": check_data_quality
-            },
-            "summary": check_results['summary'],
-            "statistics": {
-                "total_symbols": check_results['total_symbols'],
-                "checked_symbols": check_results['checked_symbols'],
-                "symbols_with_issues": len(check_results['symbols_with_issues']),
-                "quality_score": quality_score if total_records > 0 else None,
-                "quality_level": quality_level if total_records > 0 else None
-            },
-            "details": check_results['details'],
-            "text_report": report_content
-        }
-        report_content = json.dumps(report_dict, ensure_ascii=False, indent=2)
+    if summary['data_quality_issues'] > 0:
+        yield from (
+            f"\n4. 发现 {summary['data_quality_issues']} 个数据质量问题:",
+            "   建议: 检查数据来源，可能需要重新下载有问题的数据",
+            "   注意: 数据质量问题可能导致回测和分析结果不准确",
+        )
     
-    elif output_format == "html":
-        html_content = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>数据完整性检查报告</title>
-    <style>
-        body {{ font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }}
-        .container {{ background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-        h1 {{ color: #333; border-bottom: 3px solid #4CAF50; padding-bottom: 10px; }}
-        h2 {{ color: #555; margin-top: 30px; }}
-        .stat {{ background: #f9f9f9; padding: 15px; margin: 10px 0; border-left: 4px solid #2196F3; }}
-        .issue {{ background: #fff3cd; padding: 10px; margin: 5px 0; border-left: 4px solid #ffc107; }}
-        .success {{ background: #d4edda; padding: 10px; margin: 5px 0; border-left: 4px solid #28a745; }}
-        .error {{ background: #f8d7da; padding: 10px; margin: 5px 0; border-left: 4px solid #dc3545; }}
-        pre {{ background: #f4f4f4; padding: 10px; border-radius: 4px; overflow-x: auto; }}
-        table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-        th, td {{ padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }}
-        th {{ background-color: #4CAF50; color: white; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>数据完整性检查报告</h1>
-        <p><strong>生成时间:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-        <p><strong>K线间隔:</strong> {interval}</p>
-        {f"<p><strong>开始日期:</strong> {start_date}</p>" if start_date else ""}
-        {f"<p><strong>结束日期:</strong> {end_date}</p>" if end_date else ""}
-        
-        <h2>总体统计</h2>
-        <div class="stat">
-            <p><strong>总交易对数:</strong> {check_results['total_symbols']}</p>
-            <p><strong>已检查交易对数:</strong> {check_results['checked_symbols']}</p>
-            <p><strong>有问题的交易对数:</strong> {len(check_results['symbols_with_issues'])}</p>
-        </div>
-        
-        <h2>问题分类</h2>
-        <div class="issue">
-            <p><strong>空表数量:</strong> {check_results['summary']['empty_tables']}</p>
-            <p><strong>重复数据总数:</strong> {check_results['summary']['duplicates']}</p>
-            <p><strong>缺失日期总数:</strong> {check_results['summary']['missing_dates']}</p>
-            <p><strong>数据质量问题总数:</strong> {check_results['summary']['data_quality_issues']}</p>
-        </div>
-        
-        <h2>详细结果</h2>
-        <pre>{report_content.replace('<', '&lt;').replace('>', '&gt;')}</pre>
-    </div>
-</body>
-</html>
-        """
-        report_content = html_content
+    if total_issues == 0:
+        yield "\n✓ 恭喜！所有数据检查通过，数据完整性良好。"
     
-    elif output_format == "markdown":
-        md_content = f"""# 数据完整性检查报告
+    # 报告尾部
+    yield from (
+        "\n" + REPORT_SEP,
+        "报告结束",
+        REPORT_SEP,
+    )
 
-**生成时间:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}  
-**K线间隔:** {interval}  
-{f"**开始日期:** {start_date}  " if start_date else ""}
+
+
+def _build_report_context(
+    check_results: Dict,
+    interval: str,
+    start_date: Optional[str],
+    end_date: Optional[str],
+    check_duplicates: bool,
+    check_missing_dates: bool,
+    check_data_quality: bool,
+    include_text: bool = False,
+    json_indent: Optional[int] = None
+) -> Dict:
+    """
+    汇总各报告格式共用的数据（只计算一次）
+    
+    文本报告以生成器的形式保存，由 _report_text() 在第一次需要时拼接，
+    不需要文本的格式（默认的 JSON）不会生成文本报告。
+    """
+    # 各格式的生成时间使用同一个时间点
+    report_time = datetime.now()
+    # 质量评分只计算一次，文本报告和 JSON 共用
+    quality = _integrity_quality(check_results['summary'], check_results['details'])
+    return {
+        'check_results': check_results,
+        'summary': check_results['summary'],
+        'details_map': check_results['details'],
+        'issues_list': check_results['symbols_with_issues'],
+        'interval': interval,
+        'start_date': start_date,
+        'end_date': end_date,
+        'check_duplicates': check_duplicates,
+        'check_missing_dates': check_missing_dates,
+        'check_data_quality': check_data_quality,
+        'include_text': include_text,
+        'json_indent': json_indent,
+        'report_time': report_time,
+        'report_time_str': report_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'quality': quality,
+        'report_lines': _iter_report_lines(
+            check_results, interval, start_date, end_date,
+            check_duplicates, check_missing_dates, check_data_quality,
+            report_time, quality
+        ),
+        'text': None,
+    }
+
+
+def _report_text(ctx: Dict) -> str:
+    """文本报告内容（第一次调用时拼接，之后复用）"""
+    if ctx['text'] is None:
+        ctx['text'] = "\n".join(ctx['report_lines'])
+    return ctx['text']
+
+
+def _format_report_json(ctx: Dict) -> str:
+    """JSON 格式的报告"""
+    summary = ctx['summary']
+    details_map = ctx['details_map']
+    check_results = ctx['check_results']
+    _, _, _, quality_score, quality_level = ctx['quality']
+    report_dict = {
+        "report_time": ctx['report_time'].isoformat(),
+        "config": {
+            "interval": ctx['interval'],
+            "start_date": ctx['start_date'],
+            "end_date": ctx['end_date'],
+            "check_duplicates": ctx['check_duplicates'],
+            "check_missing_dates": ctx['check_missing_dates'],
+            "check_data_quality": ctx['check_data_quality']
+        },
+        "summary": summary,
+        "statistics": {
+            "total_symbols": check_results['total_symbols'],
+            "checked_symbols": check_results['checked_symbols'],
+            "symbols_with_issues": len(ctx['issues_list']),
+            "quality_score": quality_score,
+            "quality_level": quality_level
+        },
+        "details": details_map
+    }
+    if ctx['include_text']:
+        report_dict["text_report"] = _report_text(ctx)
+    json_indent = ctx['json_indent']
+    return json.dumps(
+        report_dict,
+        ensure_ascii=False,
+        indent=json_indent,
+        separators=None if json_indent is not None else (',', ':')
+    )
+
+
+def _format_report_html(ctx: Dict) -> str:
+    """HTML 格式的报告（详细结果为转义后的文本报告）"""
+    summary = ctx['summary']
+    check_results = ctx['check_results']
+    start_date = ctx['start_date']
+    end_date = ctx['end_date']
+    parts = [
+        _HTML_REPORT_HEAD,
+        f"        <p><strong>生成时间:</strong> {ctx['report_time_str']}</p>\n",
+        f"        <p><strong>K线间隔:</strong> {ctx['interval']}</p>\n",
+        f"        <p><strong>开始日期:</strong> {start_date}</p>\n" if start_date else "        \n",
+        f"        <p><strong>结束日期:</strong> {end_date}</p>\n" if end_date else "        \n",
+        "        \n"
+        "        <h2>总体统计</h2>\n"
+        '        <div class="stat">\n',
+        f"            <p><strong>总交易对数:</strong> {check_results['total_symbols']}</p>\n",
+        f"            <p><strong>已检查交易对数:</strong> {check_results['checked_symbols']}</p>\n",
+        f"            <p><strong>有问题的交易对数:</strong> {len(ctx['issues_list'])}</p>\n",
+        "        </div>\n"
+        "        \n"
+        "        <h2>问题分类</h2>\n"
+        '        <div class="issue">\n',
+        f"            <p><strong>空表数量:</strong> {summary['empty_tables']}</p>\n",
+        f"            <p><strong>重复数据总数:</strong> {summary['duplicates']}</p>\n",
+        f"            <p><strong>缺失日期总数:</strong> {summary['missing_dates']}</p>\n",
+        f"            <p><strong>数据质量问题总数:</strong> {summary['data_quality_issues']}</p>\n",
+        "        </div>\n"
+        "        \n"
+        "        <h2>详细结果</h2>\n"
+        "        <pre>",
+        html.escape(_report_text(ctx), quote=False),
+        _HTML_REPORT_TAIL,
+    ]
+    return "".join(parts)
+
+
+def _iter_markdown_lines(report_lines) -> Iterator[str]:
+    """
+    把文本报告逐行转换为 Markdown
+    
+    分隔线之间的小节标题转为三级标题（分隔线本身不输出），列表项去掉两格缩进，
+    其余行原样输出，不会改动数据中的 '=' 等字符。
+    """
+    after_sep = False
+    for line in report_lines:
+        if line == REPORT_SEP:
+            after_sep = not after_sep
+            continue
+        if after_sep:
+            yield f"### {line}"
+            continue
+        stripped = line.lstrip(' ')
+        if stripped.startswith('-') and len(line) - len(stripped) >= 2:
+            yield line[2:]
+        else:
+            yield line
+
+
+def _format_report_markdown(ctx: Dict) -> str:
+    """Markdown 格式的报告（详细结果由文本报告逐行转换而来）"""
+    summary = ctx['summary']
+    check_results = ctx['check_results']
+    start_date = ctx['start_date']
+    end_date = ctx['end_date']
+    # 文本已经拼接过时按行复用，否则直接消费行生成器，不先拼成完整文本
+    report_lines = ctx['text'].split("\n") if ctx['text'] is not None else ctx['report_lines']
+    details_md = "\n".join(_iter_markdown_lines(report_lines))
+    return f"""# 数据完整性检查报告
+
+**生成时间:** {ctx['report_time_str']}  
+**K线间隔:** {ctx['interval']}  
+{f"**开始日期:** {start_date}  " if start_date else ""}
 {f"**结束日期:** {end_date}  " if end_date else ""}
 
 ## 检查配置
 
-- 检查重复数据: {'是' if check_duplicates else '否'}
-- 检查缺失日期: {'是' if check_missing_dates else '否'}
-- 检查数据质量: {'是' if check_data_quality else '否'}
+- 检查重复数据: {'是' if ctx['check_duplicates'] else '否'}
+- 检查缺失日期: {'是' if ctx['check_missing_dates'] else '否'}
+- 检查数据质量: {'是' if ctx['check_data_quality'] else '否'}
 
 ## 总体统计
 
@@ -1291,32 +1921,195 @@ def generate_integrity_report(
 |------|------|
 | 总交易对数 | {check_results['total_symbols']} |
 | 已检查交易对数 | {check_results['checked_symbols']} |
-| 有问题的交易对数 | {len(check_results['symbols_with_issues'])} |
+| 有问题的交易对数 | {len(ctx['issues_list'])} |
 
 ## 问题分类统计
 
 | 问题类型 | 数量 |
 |----------|------|
-| 空表数量 | {check_results['summary']['empty_tables']} |
-| 重复数据总数 | {check_results['summary']['duplicates']} |
-| 缺失日期总数 | {check_results['summary']['missing_dates']} |
-| 数据质量问题总数 | {check_results['summary']['data_quality_issues']} |
+| 空表数量 | {summary['empty_tables']} |
+| 重复数据总数 | {summary['duplicates']} |
+| 缺失日期总数 | {summary['missing_dates']} |
+| 数据质量问题总数 | {summary['data_quality_issues']} |
 
 ## 详细结果
 
-{report_content.replace('=', '#').replace('  -', '-')}
+{details_md}
 """
-        report_content = md_content
+
+
+def _empty_report(
+    output_format: str,
+    interval: str,
+    report_time: datetime,
+    json_indent: Optional[int] = None
+) -> str:
+    """没有任何检查结果时的简短报告（各格式保持各自的外层结构）"""
+    message = f"没有可检查的 {interval} K线数据"
+    report_time_str = report_time.strftime('%Y-%m-%d %H:%M:%S')
+    if output_format == "json":
+        return json.dumps(
+            {
+                "status": "empty",
+                "report_time": report_time.isoformat(),
+                "config": {"interval": interval},
+                "message": message
+            },
+            ensure_ascii=False,
+            indent=json_indent,
+            separators=None if json_indent is not None else (',', ':')
+        )
+    if output_format == "html":
+        return (
+            f"{_HTML_REPORT_HEAD}"
+            f"        <p><strong>生成时间:</strong> {report_time_str}</p>\n"
+            f"        <p><strong>K线间隔:</strong> {interval}</p>\n"
+            f"        <p>{message}</p>\n"
+            "    </div>\n"
+            "</body>\n"
+            "</html>\n"
+        )
+    if output_format == "markdown":
+        return (
+            "# 数据完整性检查报告\n\n"
+            f"**生成时间:** {report_time_str}  \n"
+            f"**K线间隔:** {interval}  \n\n"
+            f"{message}\n"
+        )
+    return "\n".join((
+        REPORT_SEP,
+        "数据完整性检查报告",
+        REPORT_SEP,
+        f"生成时间: {report_time_str}",
+        f"K线间隔: {interval}",
+        "",
+        message,
+    ))
+
+
+# 报告格式 -> 生成函数，未知格式按文本输出
+_REPORT_FORMATTERS = {
+    "text": _report_text,
+    "json": _format_report_json,
+    "html": _format_report_html,
+    "markdown": _format_report_markdown,
+}
+
+
+def _write_report_lines(output_file: str, report_lines: Iterator[str]) -> None:
+    """
+    把报告逐行写入文件，行之间用换行分隔（与先用换行拼接再写入的结果相同）
+    
+    直接写入带 1 MiB 缓冲的文件，不需要先把所有行拼成完整字符串。
+    """
+    # newline='\n' 固定使用 LF，写入时不做换行符转换
+    with open(output_file, 'w', encoding='utf-8', newline='\n', buffering=1 << 20) as f:
+        first = next(report_lines, None)
+        if first is not None:
+            f.write(first)
+            f.writelines("\n" + line for line in report_lines)
+
+
+def generate_integrity_report(
+    check_results: Dict,
+    interval: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    check_duplicates: bool = True,
+    check_missing_dates: bool = True,
+    check_data_quality: bool = True,
+    output_format: str = "text",
+    output_file: Optional[str] = None,
+    return_content: bool = True,
+    include_text: bool = False,
+    json_indent: Optional[int] = None
+) -> str:
+    """
+    生成数据完整性检查报告
+    
+    Args:
+        check_results: check_data_integrity() 返回的检查结果
+        interval: K线间隔
+        start_date: 检查的开始日期（可选）
+        end_date: 检查的结束日期（可选）
+        check_duplicates: 是否检查了重复数据
+        check_missing_dates: 是否检查了缺失日期
+        check_data_quality: 是否检查了数据质量
+        output_format: 输出格式，可选: "text", "json", "html", "markdown"
+        output_file: 输出文件路径（可选），如果提供则保存到文件
+        return_content: 是否需要返回报告内容，默认True。只写文件时传False，
+                        文本报告会逐行写入文件，不在内存中拼接，返回空字符串
+        include_text: JSON 格式是否附带文本报告（text_report 字段），默认False，
+                      不需要时不生成文本报告
+        json_indent: JSON 格式的缩进，默认None输出紧凑格式
+    
+    Returns:
+        str: 报告内容
+    """
+    # 没有任何交易对的检查结果时（如本地数据库为空）只输出简短报告
+    if not check_results.get('details'):
+        report_content = _empty_report(output_format, interval, datetime.now(), json_indent)
+    else:
+        ctx = _build_report_context(
+            check_results, interval, start_date, end_date,
+            check_duplicates, check_missing_dates, check_data_quality,
+            include_text, json_indent
+        )
+        
+        # 文本报告直接逐行写入文件，不在内存中拼接完整内容
+        if output_file and output_format == "text" and not return_content:
+            _write_report_lines(output_file, ctx['report_lines'])
+            print(f"报告已保存到: {output_file}")
+            return ""
+        
+        report_content = _REPORT_FORMATTERS.get(output_format, _report_text)(ctx)
     
     # 保存到文件
     if output_file:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(report_content)
+        Path(output_file).write_text(report_content, encoding='utf-8', newline='\n')
         print(f"报告已保存到: {output_file}")
     
     return report_content
 
 
+def _missing_date_runs(
+    missing_dates: List[str],
+    interval: str = "1d",
+    as_datetime: bool = False
+) -> List[tuple]:
+    """
+    把缺失日期合并为连续的日期区间
+    
+    每个区间单独下载，不会把区间之间已有的数据重新下载一遍。
+    日期按 datetime64[D] 排序和比较，不逐个解析字符串。
+    日内K线（1m～12h）的区间结束于最后一天的 23:59:59，否则最后一天只会下载零点那一根K线。
+    
+    Args:
+        missing_dates: 缺失日期列表，格式: YYYY-MM-DD
+        interval: K线间隔，默认"1d"
+        as_datetime: 为True时返回 datetime，否则返回 YYYY-MM-DD（日内K线的结束时间为 YYYY-MM-DD HH:MM:SS）字符串
+    
+    Returns:
+        List[tuple]: [(开始时间, 结束时间), ...]，按日期升序
+    """
+    if not missing_dates:
+        return []
+    days = np.unique(np.array(missing_dates, dtype='datetime64[D]'))
+    # 相邻日期间隔超过1天的位置就是区间的分界
+    breaks = np.flatnonzero(np.diff(days).astype(np.int64) > 1) + 1
+    bounds = np.split(days, breaks)
+    # 日线及以上的K线每天只有零点一根，结束于最后一天零点即可
+    intraday = interval not in ['1d', '3d', '1w', '1M']
+    end_offset = np.timedelta64(86399 if intraday else 0, 's')
+    runs = [(run[0].astype('datetime64[s]'), run[-1].astype('datetime64[s]') + end_offset) for run in bounds]
+    if as_datetime:
+        return [(start.tolist(), end.tolist()) for start, end in runs]
+    return [
+        (str(start.astype('datetime64[D]')), str(end).replace('T', ' ') if intraday else str(end.astype('datetime64[D]')))
+        for start, end in runs
+    ]
+
+
 def generate_download_script_from_check(
     check_results: Dict,
     interval: str,
@@ -1335,12 +2128,15 @@ def generate_download_script_from_check(
     Returns:
         str: 生成的下载脚本内容
     """
-    from datetime import datetime, timedelta
+    now = datetime.now()
+    # 空表没有日期范围时，默认下载最近1年的数据
+    default_end = (now - timedelta(days=1)).strftime('%Y-%m-%d')
+    default_start = (now - timedelta(days=365)).strftime('%Y-%m-%d')
     
     script_lines = [
         "#!/bin/bash",
         f"# 根据数据完整性检查结果自动生成的下载脚本",
-        f"# 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        f"# 生成时间: {now.strftime('%Y-%m-%d %H:%M:%S')}",
         f"# K线间隔: {interval}",
         "",
         "# 下载缺失的交易对和缺失日期的数据",
@@ -1372,9 +2168,8 @@ def generate_download_script_from_check(
                 start_date = details['date_range']['start']
                 end_date = details['date_range']['end']
             else:
-                # 默认下载最近1年的数据
-                end_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-                start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+                start_date = default_start
+                end_date = default_end
             
             script_lines.append(
                 f"python download_klines.py --interval {interval} --symbols {symbol} "
@@ -1385,16 +2180,11 @@ def generate_download_script_from_check(
     if symbols_with_missing_dates:
         script_lines.append("# 下载缺失日期的数据")
         for symbol, info in symbols_with_missing_dates.items():
-            missing_dates = info['missing_dates']
-            if missing_dates:
-                # 计算缺失日期的范围
-                missing_dates_sorted = sorted(missing_dates)
-                start_date = missing_dates_sorted[0]
-                end_date = missing_dates_sorted[-1]
-                
+            # 每段连续的缺失日期生成一条命令
+            for start_date, end_date in _missing_date_runs(info['missing_dates'], interval):
                 script_lines.append(
                     f"python download_klines.py --interval {interval} --symbols {symbol} "
-                    f"--start-time {start_date} --end-time {end_date}"
+                    f"--start-time {start_date} --end-time \"{end_date}\""
                 )
         script_lines.append("")
     
@@ -1408,9 +2198,8 @@ def generate_download_script_from_check(
     
     # 如果指定了输出文件，写入文件
     if output_file:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(script_content)
-        import os
+        # 脚本由 bash 执行，固定使用 LF 换行
+        Path(output_file).write_text(script_content, encoding='utf-8', newline='\n')
         os.chmod(output_file, 0o755)  # 添加执行权限
         print(f"下载脚本已保存到: {output_file}")
     
@@ -1428,7 +2217,7 @@ def generate_download_script_from_check(
                 start_date = dt.strptime(details['date_range']['start'], '%Y-%m-%d')
                 end_date = dt.strptime(details['date_range']['end'], '%Y-%m-%d')
             else:
-                end_date = dt.now() - timedelta(days=1)
+                end_date = now - timedelta(days=1)
                 start_date = end_date - timedelta(days=365)
             
             print(f"下载 {symbol} 的数据...")
@@ -1442,12 +2231,7 @@ def generate_download_script_from_check(
         
         # 下载缺失日期
         for symbol, info in symbols_with_missing_dates.items():
-            missing_dates = info['missing_dates']
-            if missing_dates:
-                missing_dates_sorted = sorted(missing_dates)
-                start_date = dt.strptime(missing_dates_sorted[0], '%Y-%m-%d')
-                end_date = dt.strptime(missing_dates_sorted[-1], '%Y-%m-%d')
-                
+            for start_date, end_date in _missing_date_runs(info['missing_dates'], interval, as_datetime=True):
                 print(f"下载 {symbol} 缺失日期的数据 ({start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')})...")
                 download_kline_data(
                     symbol=symbol,
@@ -1457,6 +2241,8 @@ def generate_download_script_from_check(
                     update_existing=True  # 强制更新，确保下载缺失的数据
                 )
         
+        # 新下载的数据和新建的表在本进程内立即可见
+        get_local_kline_data.cache_clear()
         print("自动下载完成！")
     
     return script_content
@@ -1465,7 +2251,8 @@ def generate_download_script_from_check(
 def download_missing_data_from_check(
     check_results: Dict,
     interval: str,
-    verbose: bool = True
+    verbose: bool = True,
+    max_workers: int = DOWNLOAD_WORKERS
 ) -> Dict:
     """
     根据数据完整性检查结果直接下载缺失的数据
@@ -1474,12 +2261,12 @@ def download_missing_data_from_check(
         check_results: check_data_integrity() 返回的检查结果
         interval: K线间隔
         verbose: 是否输出详细信息
+        max_workers: 并行下载的交易对数，默认8（1 表示串行下载）
     
     Returns:
         Dict: 下载结果统计
     """
     from download_klines import download_kline_data
-    from datetime import datetime, timedelta
     
     download_stats = {
         'empty_tables_downloaded': 0,
@@ -1487,50 +2274,37 @@ def download_missing_data_from_check(
         'failed': [],
         'success': []
     }
+    # 成功/失败的交易对，用 dict 作为有序集合（O(1) 去重判断），返回前转换为列表
+    succeeded = {}
+    failed = {}
     
-    # 下载空表
+    # 空表没有日期范围时，默认下载最近1年的数据
+    default_end = datetime.now() - timedelta(days=1)
+    default_start = default_end - timedelta(days=365)
+    
+    # 每个交易对要下载的区间：空表整体下载，其他按连续的缺失日期分段下载
+    tasks = []
     for symbol, details in check_results['details'].items():
         if details['record_count'] == 0:
-            try:
-                if details['date_range']:
-                    start_date = datetime.strptime(details['date_range']['start'], '%Y-%m-%d')
-                    end_date = datetime.strptime(details['date_range']['end'], '%Y-%m-%d')
-                else:
-                    # 默认下载最近1年的数据
-                    end_date = datetime.now() - timedelta(days=1)
-                    start_date = end_date - timedelta(days=365)
-                
-                if verbose:
-                    print(f"下载空表 {symbol} 的数据 ({start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')})...")
-                
-                success = download_kline_data(
-                    symbol=symbol,
-                    interval=interval,
-                    start_time=start_date,
-                    end_time=end_date,
-                    update_existing=True  # 强制更新，确保下载缺失的数据
-                )
-                
-                if success:
-                    download_stats['empty_tables_downloaded'] += 1
-                    download_stats['success'].append(symbol)
-                else:
-                    download_stats['failed'].append(symbol)
-            except Exception as e:
-                if verbose:
-                    print(f"下载 {symbol} 失败: {e}")
-                download_stats['failed'].append(symbol)
+            if details['date_range']:
+                start_date = datetime.strptime(details['date_range']['start'], '%Y-%m-%d')
+                end_date = datetime.strptime(details['date_range']['end'], '%Y-%m-%d')
+            else:
+                start_date = default_start
+                end_date = default_end
+            tasks.append((symbol, 'empty', [(start_date, end_date)]))
+        elif details['missing_dates']:
+            tasks.append((symbol, 'missing', _missing_date_runs(details['missing_dates'], interval, as_datetime=True)))
     
-    # 下载缺失日期
-    for symbol, details in check_results['details'].items():
-        if details['missing_dates']:
-            try:
-                missing_dates = sorted(details['missing_dates'])
-                start_date = datetime.strptime(missing_dates[0], '%Y-%m-%d')
-                end_date = datetime.strptime(missing_dates[-1], '%Y-%m-%d')
-                
+    def download_symbol(task) -> bool:
+        """下载一个交易对的所有区间，全部成功才算成功（同一交易对的区间串行写入）"""
+        symbol, kind, ranges = task
+        success = True
+        try:
+            for start_date, end_date in ranges:
                 if verbose:
-                    print(f"下载 {symbol} 缺失日期的数据 ({start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')})...")
+                    label = f"空表 {symbol} " if kind == 'empty' else f" {symbol} 缺失日期"
+                    print(f"下载{label}的数据 ({start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')})...")
                 
                 success = download_kline_data(
                     symbol=symbol,
@@ -1538,23 +2312,33 @@ def download_missing_data_from_check(
                     start_time=start_date,
                     end_time=end_date,
                     update_existing=True  # 强制更新，确保下载缺失的数据
-                )
-                
+                ) and success
+        except Exception as e:
+            if verbose:
+                print(f"下载 {symbol} {'失败' if kind == 'empty' else '缺失日期失败'}: {e}")
+            return False
+        return success
+    
+    # 下载主要耗时在网络请求，不同交易对写入不同的表，用线程池并行下载
+    # map 按提交顺序返回结果，成功/失败列表的顺序与串行下载一致
+    if tasks:
+        workers = max(1, min(max_workers, len(tasks)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for (symbol, kind, _), success in zip(tasks, executor.map(download_symbol, tasks)):
                 if success:
-                    download_stats['missing_dates_downloaded'] += 1
-                    if symbol not in download_stats['success']:
-                        download_stats['success'].append(symbol)
-                    # 等待数据库写入完成
-                    import time
-                    time.sleep(0.5)
+                    if kind == 'empty':
+                        download_stats['empty_tables_downloaded'] += 1
+                    else:
+                        download_stats['missing_dates_downloaded'] += 1
+                    succeeded[symbol] = None
                 else:
-                    if symbol not in download_stats['failed']:
-                        download_stats['failed'].append(symbol)
-            except Exception as e:
-                if verbose:
-                    print(f"下载 {symbol} 缺失日期失败: {e}")
-                if symbol not in download_stats['failed']:
-                    download_stats['failed'].append(symbol)
+                    failed[symbol] = None
+    
+    download_stats['success'] = list(succeeded)
+    download_stats['failed'] = list(failed)
+    
+    # 数据已更新，丢弃缓存的旧K线
+    get_local_kline_data.cache_clear()
     
     if verbose:
         print("\n下载统计:")
@@ -1568,6 +2352,615 @@ def download_missing_data_from_check(
     return download_stats
 
 
+@lru_cache(maxsize=2048)
+def _kline_overview_stmt(table_name: str):
+    """按表名缓存复检概况的聚合查询语句"""
+    null_counts = ",\n".join(
+        f"            COUNT(*) FILTER (WHERE {col} IS NULL OR {col} = 'NaN') AS null_{col}"
+        for col in _OHLCV_COLUMNS
+    )
+    return text(f'''
+        SELECT
+            COUNT(*) AS record_count,
+            MIN(trade_date) AS first_trade_date,
+            MAX(trade_date) AS last_trade_date,
+            COUNT(trade_date) - COUNT(DISTINCT trade_date) AS duplicates,
+{null_counts},
+            COUNT(*) FILTER (WHERE open <= 0 OR high <= 0 OR low <= 0 OR close <= 0) AS invalid_prices,
+            COUNT(*) FILTER (WHERE volume < 0) AS invalid_volumes
+        FROM "{table_name}"
+    ''')
+
+
+def _local_kline_overview(conn, symbol: str, interval: str) -> Optional[Dict]:
+    """
+    用一条聚合查询统计本地K线表的概况（复检时使用，不读取整表）
+    
+    统计口径与 _local_kline_overview_from_df 一致，空值同时统计 NULL 和 NaN。
+    表名大小写不一致时按实际表名查询；表不存在时直接返回空概况，不再查询数据库。
+    
+    Returns:
+        概况字典；交易对不合法或查询失败时返回None（由调用方回退到读取整表）
+    """
+    symbol = symbol.upper()
+    if not _SAFE_SYMBOL_RE.match(symbol):
+        return None
+    
+    actual_name = _resolve_table_name(conn, f'K{interval}{symbol}')
+    if actual_name is None:
+        # 与读取到空表的结果相同
+        return {'record_count': 0}
+    try:
+        row = conn.execute(_kline_overview_stmt(actual_name)).mappings().fetchone()
+    except Exception as e:
+        logging.debug(f"{symbol} 聚合统计本地数据失败，回退到读取整表: {e}")
+        with suppress(Exception):
+            conn.rollback()
+        return None
+    if row is None:
+        return None
+    return {
+        'record_count': row['record_count'],
+        'first_trade_date': row['first_trade_date'],
+        'last_trade_date': row['last_trade_date'],
+        'duplicates': row['duplicates'],
+        'null_counts': {col: row[f'null_{col}'] for col in _OHLCV_COLUMNS},
+        'invalid_prices': row['invalid_prices'],
+        'invalid_volumes': row['invalid_volumes']
+    }
+
+
+def _count_duplicate_dates(df: pd.DataFrame):
+    """统计 trade_date 重复的行数（与 duplicated().sum() 结果相同，但不生成整列的布尔掩码）"""
+    if 'trade_date' not in df.columns:
+        return 0
+    # dropna=False：与 duplicated 一致，多个空值也算作重复
+    # 保持 numpy 整数类型，与其他统计值一样由结果转换统一处理
+    return np.int64(len(df) - df['trade_date'].nunique(dropna=False))
+
+
+def _summarize_ohlcv(df: pd.DataFrame) -> Dict:
+    """
+    统计K线数据中OHLCV列的空值数、无效价格数和无效成交量数
+    
+    五列转成一个二维 float32 数组后一次扫描完成，缺少的列不计入统计。
+    这里只判断空值和正负，不需要 float64 的精度，float32 数组的扫描数据量减半
+    （价格之间的大小比较仍需 float64，见 _scan_ohlc）。
+    
+    Returns:
+        {'null_counts': {列名: 空值数}, 'invalid_prices': 价格<=0的行数, 'invalid_volumes': 成交量<0的行数}
+    """
+    arr = df.reindex(columns=list(_OHLCV_COLUMNS)).to_numpy(dtype=np.float32)
+    # 缺少的列在 reindex 后全为 NaN，NaN 参与比较时为 False，只需在空值计数中排除
+    null_counts = np.isnan(arr).sum(axis=0)
+    return {
+        'null_counts': {
+            col: null_counts[i] if col in df.columns else 0
+            for i, col in enumerate(_OHLCV_COLUMNS)
+        },
+        'invalid_prices': (arr[:, :4] <= 0).any(axis=1).sum(),
+        'invalid_volumes': (arr[:, 4] < 0).sum()
+    }
+
+
+def _local_kline_overview_from_df(local_df: pd.DataFrame) -> Dict:
+    """根据已读取的K线数据统计概况（_local_kline_overview 查询失败时的回退）"""
+    if local_df.empty:
+        return {'record_count': 0}
+    
+    # 本地数据已按 open_time 排序，首尾两行就是最早/最晚的交易日期
+    first_trade_date = None
+    last_trade_date = None
+    if 'trade_date' in local_df.columns:
+        trade_dates = local_df['trade_date']
+        first_idx = trade_dates.first_valid_index()
+        if first_idx is not None:
+            first_trade_date = trade_dates.loc[first_idx]
+            last_trade_date = trade_dates.loc[trade_dates.last_valid_index()]
+    
+    return {
+        'record_count': len(local_df),
+        'first_trade_date': first_trade_date,
+        'last_trade_date': last_trade_date,
+        'duplicates': _count_duplicate_dates(local_df),
+        **_summarize_ohlcv(local_df)
+    }
+
+
+def _iter_symbol_section(title: str, symbols: List[str]) -> Iterator[str]:
+    """逐行生成复检报告中的交易对列表小节，列表为空时不输出"""
+    if not symbols:
+        return
+    yield "-" * 80
+    yield title
+    yield "-" * 80
+    yield from (f"  - {symbol}" for symbol in symbols)
+    yield ""
+
+
+def _iter_data_summary_lines(title: str, data: Dict) -> Iterator[str]:
+    """逐行生成复检报告中本地/交易所数据的统计信息"""
+    yield f"\n{title}:"
+    if 'error' in data:
+        yield f"  错误: {data['error']}"
+    else:
+        yield f"  记录数: {data.get('record_count', 0)}"
+        if data.get('date_range', {}).get('start'):
+            yield f"  日期范围: {data['date_range']['start']} 至 {data['date_range']['end']}"
+        yield f"  重复数据: {data.get('duplicates', 0)}"
+        null_counts = data.get('null_counts', {})
+        total_nulls = sum(null_counts.values())
+        yield f"  空值总数: {total_nulls}"
+        if total_nulls > 0:
+            yield f"    - open: {null_counts.get('open', 0)}"
+            yield f"    - high: {null_counts.get('high', 0)}"
+            yield f"    - low: {null_counts.get('low', 0)}"
+            yield f"    - close: {null_counts.get('close', 0)}"
+            yield f"    - volume: {null_counts.get('volume', 0)}"
+        yield f"  无效价格: {data.get('invalid_prices', 0)}"
+        yield f"  无效成交量: {data.get('invalid_volumes', 0)}"
+
+
+def _iter_recheck_report_lines(
+    recheck_results: Dict,
+    interval: str,
+    start_date: Optional[str],
+    end_date: Optional[str]
+) -> Iterator[str]:
+    """逐行生成复检报告（TXT格式）"""
+    report_time = datetime.now()
+    yield REPORT_SEP
+    yield "数据复检报告"
+    yield REPORT_SEP
+    yield f"生成时间: {report_time.strftime('%Y-%m-%d %H:%M:%S')}"
+    yield f"K线间隔: {interval}"
+    if start_date:
+        yield f"开始日期: {start_date}"
+    if end_date:
+        yield f"结束日期: {end_date}"
+    yield ""
+    
+    # 总结统计
+    yield "-" * 80
+    yield "复检总结"
+    yield "-" * 80
+    yield f"总复检数: {recheck_results['total_rechecked']}"
+    yield f"交易所API问题: {len(recheck_results['exchange_api_issues'])}"
+    yield f"本地数据问题: {len(recheck_results['local_data_issues'])}"
+    yield f"两边都有问题: {len(recheck_results['both_issues'])}"
+    yield f"可通过重新下载修复: {len(recheck_results['fixed_by_redownload'])}"
+    yield ""
+    
+    # 问题分类
+    yield from _iter_symbol_section("交易所API问题交易对", recheck_results['exchange_api_issues'])
+    yield from _iter_symbol_section("本地数据问题交易对", recheck_results['local_data_issues'])
+    yield from _iter_symbol_section("两边都有问题的交易对", recheck_results['both_issues'])
+    yield from _iter_symbol_section("可通过重新下载修复的交易对", recheck_results['fixed_by_redownload'])
+    
+    # 详细对比信息
+    yield REPORT_SEP
+    yield "详细对比信息"
+    yield REPORT_SEP
+    
+    for symbol, detail in recheck_results['details'].items():
+        yield ""
+        yield f"交易对: {symbol}"
+        yield "-" * 80
+        
+        if detail.get('issues'):
+            yield f"原始问题: {', '.join(detail['issues'])}"
+        
+        # 本地数据信息
+        yield from _iter_data_summary_lines("本地数据", detail.get('local_data', {}))
+        
+        # 交易所数据信息
+        yield from _iter_data_summary_lines("交易所数据", detail.get('exchange_data', {}))
+        
+        # 对比信息
+        comparison = detail.get('comparison', {})
+        if comparison:
+            yield "\n对比分析:"
+            yield f"  记录数差异: {comparison.get('record_count_diff', 0)} (本地 - 交易所)"
+            yield f"  重复数据差异: {comparison.get('duplicates_diff', 0)}"
+            yield f"  空值差异: {comparison.get('nulls_diff', 0)}"
+            yield f"  无效价格差异: {comparison.get('invalid_prices_diff', 0)}"
+            yield f"  无效成交量差异: {comparison.get('invalid_volumes_diff', 0)}"
+        
+        # 结论
+        if detail.get('conclusion'):
+            yield f"\n结论: {detail['conclusion']}"
+
+
+def _kline_count(start_time: datetime, end_time: datetime, interval_seconds: int) -> int:
+    """计算指定时间范围内的数据条数"""
+    if not start_time or not end_time:
+        return 0
+    total_seconds = int((end_time - start_time).total_seconds())
+    return total_seconds // interval_seconds + 1
+
+
+def _split_kline_range(start_time: datetime, end_time: datetime, interval_seconds: int, max_count: int = 1500) -> List[tuple]:
+    """
+    将时间范围分割成多个段，每段不超过max_count条数据
+    
+    只对首尾各调用一次 timestamp()，各段的毫秒时间戳用整数加法得到。
+    
+    Returns:
+        [(段开始时间, 段结束时间, 开始时间戳毫秒, 结束时间戳毫秒), ...]
+    """
+    if not start_time or not end_time:
+        return []
+    step_ms = (max_count - 1) * interval_seconds * 1000
+    interval_ms = interval_seconds * 1000
+    start_ms = int(start_time.timestamp() * 1000)
+    end_ms = int(end_time.timestamp() * 1000)
+    ranges = []
+    seg_start_ms = start_ms
+    while seg_start_ms < end_ms:
+        seg_end_ms = min(seg_start_ms + step_ms, end_ms)
+        ranges.append((
+            start_time + timedelta(milliseconds=seg_start_ms - start_ms),
+            end_time if seg_end_ms == end_ms else start_time + timedelta(milliseconds=seg_end_ms - start_ms),
+            seg_start_ms,
+            seg_end_ms
+        ))
+        seg_start_ms = seg_end_ms + interval_ms
+    return ranges
+
+
+def _fetch_kline_segments(symbol: str, interval: str, time_ranges: List[tuple]) -> List[pd.DataFrame]:
+    """
+    并发下载同一交易对多个时间段的K线数据
+    
+    Returns:
+        与 time_ranges 顺序一致的 DataFrame 列表，没有数据的段为空 DataFrame
+    """
+    def fetch(seg):
+        _, _, seg_start_ts, seg_end_ts = seg
+        with _exchange_request_slots:
+            api_data = kline_candlestick_data(
+                symbol=symbol,
+                interval=interval,
+                starttime=seg_start_ts,
+                endtime=seg_end_ts,
+                limit=1500
+            )
+        return kline2df(api_data) if api_data else pd.DataFrame()
+    
+    workers = max(1, min(SEGMENT_DOWNLOAD_WORKERS, len(time_ranges)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fetch, time_ranges))
+
+
+def _json_default(obj):
+    """JSON 序列化时处理 numpy/pandas 类型（只会对标准 JSON 不支持的值调用）"""
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+
+def _to_python_types(obj):
+    """
+    把嵌套的 dict/list 中的 numpy/pandas 类型转换为 Python 原生类型
+    
+    通过一次 JSON 序列化和解析完成，遍历在 C 实现中进行，
+    只有遇到 numpy/pandas 值时才回调 _json_default。
+    """
+    if orjson is not None:
+        return orjson.loads(orjson.dumps(
+            obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        ))
+    return json.loads(json.dumps(obj, default=_json_default))
+
+
+def _recheck_symbol(
+    symbol: str,
+    idx: int,
+    total: int,
+    issues: List[str],
+    interval: str,
+    start_dt: Optional[datetime],
+    end_dt: Optional[datetime],
+    now_dt: datetime,
+    interval_seconds: int,
+    verbose: bool
+) -> tuple:
+    """
+    复检单个交易对（在线程池中执行，使用独立的数据库连接）
+    
+    输出不直接打印，而是收集起来由调用方按交易对顺序打印，避免多线程输出交错。
+    
+    Returns:
+        (symbol_detail, 所属问题分类列表, 输出行)
+    """
+    categories = []
+    output = []
+    emit = output.append
+    
+    if verbose:
+        emit(f"\n[{idx}/{total}] 复检 {symbol}...")
+        if issues:
+            emit(f"  问题: {', '.join(issues)}")
+    
+    symbol_detail = {
+        'symbol': symbol,
+        'issues': issues,
+        'local_data': {},
+        'exchange_data': {},
+        'comparison': {},
+        'conclusion': None
+    }
+    
+    try:
+        # 1. 获取本地数据统计
+        # 先用一条聚合查询在数据库中统计，不把整表读入内存；查询失败时回退到读取整表
+        # 本地数据的最早/最晚时间，同时用于日期范围和API请求区间
+        local_min = None
+        local_max = None
+        overview = None
+        with suppress(Exception), engine.connect() as conn:
+            overview = _local_kline_overview(conn, symbol, interval)
+        if overview is None:
+            try:
+                overview = _local_kline_overview_from_df(
+                    get_local_kline_data(symbol, interval=interval, columns=_KLINE_CHECK_COLUMNS)
+                )
+            except Exception as e:
+                # 表可能不存在或其他错误
+                if verbose:
+                    emit(f"  警告: 获取本地数据失败: {str(e)}")
+                symbol_detail['local_data'] = {
+                    'record_count': 0,
+                    'error': f'获取本地数据失败: {str(e)}'
+                }
+        
+        if overview is not None and overview['record_count'] > 0:
+            # 计算日期范围（只解析最早/最晚两个交易日期）
+            date_start = None
+            date_end = None
+            if overview['first_trade_date'] is not None and overview['last_trade_date'] is not None:
+                local_min, local_max = pd.to_datetime(
+                    [overview['first_trade_date'], overview['last_trade_date']],
+                    format='ISO8601', errors='coerce'
+                )
+                if pd.isna(local_min) or pd.isna(local_max):
+                    local_min = local_max = None
+                else:
+                    date_start = local_min.strftime('%Y-%m-%d')
+                    date_end = local_max.strftime('%Y-%m-%d')
+            
+            symbol_detail['local_data'] = {
+                'record_count': overview['record_count'],  # 显示总记录数
+                'date_range': {
+                    'start': date_start,
+                    'end': date_end
+                },
+                'duplicates': overview['duplicates'],
+                'null_counts': overview['null_counts'],
+                'invalid_prices': overview['invalid_prices'],
+                'invalid_volumes': overview['invalid_volumes']
+            }
+        elif overview is not None:
+            symbol_detail['local_data'] = {
+                'record_count': 0,
+                'error': '本地数据为空'
+            }
+        
+        # 2. 从交易所API获取数据
+        # 计算时间戳和日期范围
+        # 如果没有指定日期范围，使用合理的默认值
+        if start_dt:
+            actual_start_dt = start_dt
+        elif local_min is not None:
+            # 使用本地数据的最早日期
+            actual_start_dt = local_min.to_pydatetime()
+        else:
+            # 默认从2020年开始
+            actual_start_dt = datetime(2020, 1, 1)
+        
+        if end_dt:
+            actual_end_dt = end_dt
+        elif local_max is not None:
+            # 使用本地数据最晚日期加1天，确保能获取到最新数据
+            actual_end_dt = local_max.to_pydatetime() + timedelta(days=1)
+        else:
+            # 如果没有指定结束日期，使用当前时间
+            actual_end_dt = now_dt
+        
+        # 计算时间戳
+        start_timestamp = int(actual_start_dt.timestamp() * 1000)
+        end_timestamp = int(actual_end_dt.timestamp() * 1000)
+        
+        # 计算数据条数，判断是否需要分段下载
+        data_count = _kline_count(actual_start_dt, actual_end_dt, interval_seconds)
+        
+        # 获取交易所数据（分段获取）
+        try:
+            exchange_df = pd.DataFrame()
+            
+            if data_count > 1500:
+                # 需要分段下载
+                if verbose:
+                    emit(f"  数据条数 {data_count} 超过1500条，将分段下载...")
+                
+                time_ranges = _split_kline_range(actual_start_dt, actual_end_dt, interval_seconds, max_count=1500)
+                
+                if verbose:
+                    for idx, (seg_start, seg_end, _, _) in enumerate(time_ranges, 1):
+                        emit(f"  下载第 {idx}/{len(time_ranges)} 段: {seg_start.strftime('%Y-%m-%d')} 至 {seg_end.strftime('%Y-%m-%d')}")
+                
+                # 各段并发请求（限流重试由客户端处理），全部返回后再一次性合并、去重、排序
+                seg_dfs = [
+                    seg_df for seg_df in _fetch_kline_segments(symbol, interval, time_ranges)
+                    if not seg_df.empty
+                ]
+                if seg_dfs:
+                    exchange_df = (
+                        pd.concat(seg_dfs, ignore_index=True)
+                        .drop_duplicates(subset=['trade_date'], keep='first')
+                        .sort_values('trade_date', ignore_index=True)
+                    )
+            else:
+                # 单次下载即可
+                with _exchange_request_slots:
+                    api_data = kline_candlestick_data(
+                        symbol=symbol,
+                        interval=interval,
+                        starttime=start_timestamp,
+                        endtime=end_timestamp,
+                        limit=1500
+                    )
+                
+                if api_data:
+                    exchange_df = kline2df(api_data)
+            
+            if not exchange_df.empty:
+                # 显示实际总记录数（不过滤）
+                total_record_count = len(exchange_df)
+                
+                # 计算日期范围（min/max 本身会跳过 NaT，不需要先 dropna 复制整列）
+                date_start = None
+                date_end = None
+                if 'trade_date' in exchange_df.columns:
+                    trade_dates = pd.to_datetime(exchange_df['trade_date'])
+                    ts_min = trade_dates.min()
+                    if pd.notna(ts_min):
+                        date_start = ts_min.strftime('%Y-%m-%d')
+                        date_end = trade_dates.max().strftime('%Y-%m-%d')
+                
+                symbol_detail['exchange_data'] = {
+                    'record_count': total_record_count,  # 显示总记录数
+                    'date_range': {
+                        'start': date_start,
+                        'end': date_end
+                    },
+                    'duplicates': _count_duplicate_dates(exchange_df),
+                    **_summarize_ohlcv(exchange_df)
+                }
+                
+                # 3. 对比分析
+                comparison = {}
+                
+                # 对比记录数
+                local_count = symbol_detail['local_data'].get('record_count', 0)
+                exchange_count = symbol_detail['exchange_data'].get('record_count', 0)
+                comparison['record_count_diff'] = local_count - exchange_count
+                
+                # 对比重复数据
+                local_duplicates = symbol_detail['local_data'].get('duplicates', 0)
+                exchange_duplicates = symbol_detail['exchange_data'].get('duplicates', 0)
+                comparison['duplicates_diff'] = local_duplicates - exchange_duplicates
+                
+                # 对比空值
+                local_nulls = sum(symbol_detail['local_data'].get('null_counts', {}).values())
+                exchange_nulls = sum(symbol_detail['exchange_data'].get('null_counts', {}).values())
+                comparison['nulls_diff'] = local_nulls - exchange_nulls
+                
+                # 对比无效价格
+                local_invalid_prices = symbol_detail['local_data'].get('invalid_prices', 0)
+                exchange_invalid_prices = symbol_detail['exchange_data'].get('invalid_prices', 0)
+                comparison['invalid_prices_diff'] = local_invalid_prices - exchange_invalid_prices
+                
+                # 对比无效成交量
+                local_invalid_volumes = symbol_detail['local_data'].get('invalid_volumes', 0)
+                exchange_invalid_volumes = symbol_detail['exchange_data'].get('invalid_volumes', 0)
+                comparison['invalid_volumes_diff'] = local_invalid_volumes - exchange_invalid_volumes
+                
+                symbol_detail['comparison'] = comparison
+                
+                # 4. 得出结论
+                conclusion_parts = []
+                
+                # 各项判断条件只计算一次
+                exchange_has_issue = (
+                    exchange_duplicates > 0 or exchange_nulls > 0 or
+                    exchange_invalid_prices > 0 or exchange_invalid_volumes > 0
+                )
+                local_has_issue = (
+                    local_duplicates > 0 or local_nulls > 0 or
+                    local_invalid_prices > 0 or local_invalid_volumes > 0
+                )
+                local_worse = (
+                    local_duplicates > exchange_duplicates or
+                    local_nulls > exchange_nulls or
+                    local_invalid_prices > exchange_invalid_prices or
+                    local_invalid_volumes > exchange_invalid_volumes
+                )
+                
+                # 如果交易所数据也有问题
+                if exchange_has_issue:
+                    conclusion_parts.append("交易所API数据存在问题")
+                    categories.append('exchange_api_issues')
+                
+                # 如果本地数据问题更严重
+                if local_worse:
+                    conclusion_parts.append("本地数据问题更严重")
+                    categories.append('local_data_issues')
+                
+                # 如果两边都有问题
+                if exchange_has_issue and local_has_issue:
+                    categories.append('both_issues')
+                
+                # 如果本地数据问题可以通过重新下载修复
+                if local_worse and not exchange_has_issue:
+                    conclusion_parts.append("建议重新下载修复")
+                    categories.append('fixed_by_redownload')
+                
+                if conclusion_parts:
+                    symbol_detail['conclusion'] = " | ".join(conclusion_parts)
+                else:
+                    symbol_detail['conclusion'] = "数据正常"
+                
+                if verbose:
+                    emit(f"  本地记录数: {local_count}, 交易所记录数: {exchange_count}")
+                    emit(f"  本地重复: {local_duplicates}, 交易所重复: {exchange_duplicates}")
+                    emit(f"  本地空值: {local_nulls}, 交易所空值: {exchange_nulls}")
+                    emit(f"  结论: {symbol_detail['conclusion']}")
+                else:
+                    symbol_detail['exchange_data'] = {
+                        'record_count': 0,
+                        'error': '交易所API返回空数据'
+                    }
+                    symbol_detail['conclusion'] = "交易所API返回空数据"
+                    categories.append('exchange_api_issues')
+                    
+                    if verbose:
+                        emit(f"  警告: 交易所API返回空数据")
+            else:
+                symbol_detail['exchange_data'] = {
+                    'record_count': 0,
+                    'error': '交易所API返回None'
+                }
+                symbol_detail['conclusion'] = "交易所API返回None"
+                categories.append('exchange_api_issues')
+                
+                if verbose:
+                    emit(f"  警告: 交易所API返回None")
+                    
+        except Exception as e:
+            symbol_detail['exchange_data'] = {
+                'error': f'获取交易所数据失败: {str(e)}'
+            }
+            symbol_detail['conclusion'] = f"获取交易所数据失败: {str(e)}"
+            categories.append('exchange_api_issues')
+            
+            if verbose:
+                emit(f"  错误: 获取交易所数据失败: {str(e)}")
+                
+    except Exception as e:
+        symbol_detail['error'] = f'复检过程出错: {str(e)}'
+        if verbose:
+            emit(f"  错误: {str(e)}")
+    
+    return symbol_detail, categories, output
+
+
 def recheck_problematic_symbols(
     check_results: Dict,
     interval: str,
@@ -1590,7 +2983,6 @@ def recheck_problematic_symbols(
     Returns:
         Dict: 包含复检结果的字典
     """
-    import time
     from datetime import datetime as dt
     
     recheck_results = {
@@ -1622,370 +3014,33 @@ def recheck_problematic_symbols(
     if end_date:
         end_dt = dt.strptime(end_date, '%Y-%m-%d')
     
-    for idx, symbol in enumerate(problematic_symbols, 1):
-        # 从check_results的details中获取该交易对的详细信息
-        symbol_details = check_results.get('details', {}).get(symbol, {})
-        issues = symbol_details.get('issues', [])
-        
-        if verbose:
-            print(f"\n[{idx}/{len(problematic_symbols)}] 复检 {symbol}...")
-            if issues:
-                print(f"  问题: {', '.join(issues)}")
-        
-        symbol_detail = {
-            'symbol': symbol,
-            'issues': issues,
-            'local_data': {},
-            'exchange_data': {},
-            'comparison': {},
-            'conclusion': None
-        }
-        
-        try:
-            # 1. 获取本地数据
-            local_df = pd.DataFrame()  # 初始化为空DataFrame
-            try:
-                local_df = get_local_kline_data(symbol, interval=interval)
-            except Exception as e:
-                # 表可能不存在或其他错误
-                if verbose:
-                    print(f"  警告: 获取本地数据失败: {str(e)}")
-                symbol_detail['local_data'] = {
-                    'record_count': 0,
-                    'error': f'获取本地数据失败: {str(e)}'
-                }
-            
-            if not local_df.empty:
-                # 确保有 trade_date_dt 列（用于日期过滤）
-                if 'trade_date_dt' not in local_df.columns:
-                    if 'trade_date' in local_df.columns:
-                        local_df['trade_date_dt'] = pd.to_datetime(local_df['trade_date'])
-                    else:
-                        # 如果没有 trade_date 列，使用所有数据
-                        local_df['trade_date_dt'] = pd.NaT
-                
-                # 确定要检查的日期范围
-                if start_dt and end_dt:
-                    mask = (local_df['trade_date_dt'] >= start_dt) & (local_df['trade_date_dt'] <= end_dt)
-                    local_df_filtered = local_df[mask].copy()
-                elif start_dt:
-                    mask = local_df['trade_date_dt'] >= start_dt
-                    local_df_filtered = local_df[mask].copy()
-                elif end_dt:
-                    mask = local_df['trade_date_dt'] <= end_dt
-                    local_df_filtered = local_df[mask].copy()
-                else:
-                    local_df_filtered = local_df.copy()
-                
-                # 显示实际总记录数（不过滤）
-                total_record_count = len(local_df)
-                
-                # 计算日期范围
-                date_start = None
-                date_end = None
-                if 'trade_date_dt' in local_df.columns and not local_df['trade_date_dt'].isna().all():
-                    valid_dates = local_df['trade_date_dt'].dropna()
-                    if not valid_dates.empty:
-                        date_start = valid_dates.min().strftime('%Y-%m-%d')
-                        date_end = valid_dates.max().strftime('%Y-%m-%d')
-                
-                symbol_detail['local_data'] = {
-                    'record_count': total_record_count,  # 显示总记录数
-                    'date_range': {
-                        'start': date_start,
-                        'end': date_end
-                    },
-                    'duplicates': local_df.duplicated(subset=['trade_date']).sum() if 'trade_date' in local_df.columns else 0,
-                    'null_counts': {
-                        'open': local_df['open'].isna().sum() if 'open' in local_df.columns else 0,
-                        'high': local_df['high'].isna().sum() if 'high' in local_df.columns else 0,
-                        'low': local_df['low'].isna().sum() if 'low' in local_df.columns else 0,
-                        'close': local_df['close'].isna().sum() if 'close' in local_df.columns else 0,
-                        'volume': local_df['volume'].isna().sum() if 'volume' in local_df.columns else 0
-                    },
-                    'invalid_prices': (((local_df['open'] <= 0) if 'open' in local_df.columns else pd.Series([False])) | 
-                                      ((local_df['high'] <= 0) if 'high' in local_df.columns else pd.Series([False])) | 
-                                      ((local_df['low'] <= 0) if 'low' in local_df.columns else pd.Series([False])) | 
-                                      ((local_df['close'] <= 0) if 'close' in local_df.columns else pd.Series([False]))).sum(),
-                    'invalid_volumes': (local_df['volume'] < 0).sum() if 'volume' in local_df.columns else 0
-                }
-            else:
-                symbol_detail['local_data'] = {
-                    'record_count': 0,
-                    'error': '本地数据为空'
-                }
-            
-            # 2. 从交易所API获取数据
-            time.sleep(0.2)  # 避免API限流
-            
-            # 计算时间戳和日期范围
-            # 如果没有指定日期范围，使用合理的默认值
-            if start_dt:
-                actual_start_dt = start_dt
-            elif not local_df.empty and 'trade_date_dt' in local_df.columns:
-                # 使用本地数据的最早日期
-                valid_dates = local_df['trade_date_dt'].dropna()
-                if not valid_dates.empty:
-                    actual_start_dt = valid_dates.min().to_pydatetime()
-                else:
-                    # 默认从2020年开始
-                    actual_start_dt = dt(2020, 1, 1)
-            else:
-                # 默认从2020年开始
-                actual_start_dt = dt(2020, 1, 1)
-            
-            if end_dt:
-                actual_end_dt = end_dt
-            elif not local_df.empty and 'trade_date_dt' in local_df.columns:
-                # 使用本地数据的最晚日期，或者当前时间
-                valid_dates = local_df['trade_date_dt'].dropna()
-                if not valid_dates.empty:
-                    # 使用本地数据最晚日期加1天，确保能获取到最新数据
-                    actual_end_dt = valid_dates.max().to_pydatetime() + timedelta(days=1)
-                else:
-                    actual_end_dt = dt.now()
-            else:
-                # 如果没有指定结束日期，使用当前时间
-                actual_end_dt = dt.now()
-            
-            # 计算时间戳
-            start_timestamp = int(actual_start_dt.timestamp() * 1000)
-            end_timestamp = int(actual_end_dt.timestamp() * 1000)
-            
-            # 计算数据条数，判断是否需要分段下载
-            def calculate_interval_seconds(interval: str) -> int:
-                """计算K线间隔对应的秒数"""
-                interval_map = {
-                    '1m': 60, '3m': 180, '5m': 300, '15m': 900, '30m': 1800,
-                    '1h': 3600, '2h': 7200, '4h': 14400, '6h': 21600, '8h': 28800,
-                    '12h': 43200, '1d': 86400, '3d': 259200, '1w': 604800, '1M': 2592000
-                }
-                return interval_map.get(interval, 86400)
-            
-            def calculate_data_count(start_time: datetime, end_time: datetime, interval: str) -> int:
-                """计算指定时间范围内的数据条数"""
-                if not start_time or not end_time:
-                    return 0
-                interval_seconds = calculate_interval_seconds(interval)
-                total_seconds = int((end_time - start_time).total_seconds())
-                count = total_seconds // interval_seconds + 1
-                return count
-            
-            def split_time_range(start_time: datetime, end_time: datetime, interval: str, max_count: int = 1500) -> List[tuple]:
-                """将时间范围分割成多个段，每段不超过max_count条数据"""
-                if not start_time or not end_time:
-                    return []
-                interval_seconds = calculate_interval_seconds(interval)
-                max_seconds = (max_count - 1) * interval_seconds
-                ranges = []
-                current_start = start_time
-                while current_start < end_time:
-                    current_end = min(current_start + timedelta(seconds=max_seconds), end_time)
-                    ranges.append((current_start, current_end))
-                    current_start = current_end + timedelta(seconds=interval_seconds)
-                return ranges
-            
-            # 计算数据条数
-            data_count = calculate_data_count(actual_start_dt, actual_end_dt, interval)
-            
-            # 获取交易所数据（分段获取）
-            try:
-                exchange_df = pd.DataFrame()
-                
-                if data_count > 1500:
-                    # 需要分段下载
-                    if verbose:
-                        print(f"  数据条数 {data_count} 超过1500条，将分段下载...")
-                    
-                    time_ranges = split_time_range(actual_start_dt, actual_end_dt, interval, max_count=1500)
-                    
-                    for idx, (seg_start, seg_end) in enumerate(time_ranges, 1):
-                        seg_start_ts = int(seg_start.timestamp() * 1000)
-                        seg_end_ts = int(seg_end.timestamp() * 1000)
-                        
-                        if verbose:
-                            print(f"  下载第 {idx}/{len(time_ranges)} 段: {seg_start.strftime('%Y-%m-%d')} 至 {seg_end.strftime('%Y-%m-%d')}")
-                        
-                        time.sleep(0.2)  # 避免API限流
-                        
-                        api_data = kline_candlestick_data(
-                            symbol=symbol,
-                            interval=interval,
-                            starttime=seg_start_ts,
-                            endtime=seg_end_ts,
-                            limit=1500
-                        )
-                        
-                        if api_data:
-                            seg_df = kline2df(api_data)
-                            if not seg_df.empty:
-                                if exchange_df.empty:
-                                    exchange_df = seg_df
-                                else:
-                                    # 合并数据，去重
-                                    exchange_df = pd.concat([exchange_df, seg_df], ignore_index=True)
-                                    exchange_df = exchange_df.drop_duplicates(subset=['trade_date'], keep='first')
-                                    exchange_df = exchange_df.sort_values('trade_date').reset_index(drop=True)
-                else:
-                    # 单次下载即可
-                    api_data = kline_candlestick_data(
-                        symbol=symbol,
-                        interval=interval,
-                        starttime=start_timestamp,
-                        endtime=end_timestamp,
-                        limit=1500
-                    )
-                    
-                    if api_data:
-                        exchange_df = kline2df(api_data)
-                
-                if not exchange_df.empty:
-                    # 转换trade_date为datetime
-                    if 'trade_date' in exchange_df.columns:
-                        exchange_df['trade_date_dt'] = pd.to_datetime(exchange_df['trade_date'])
-                    else:
-                        exchange_df['trade_date_dt'] = pd.NaT
-                    
-                    # 显示实际总记录数（不过滤）
-                    total_record_count = len(exchange_df)
-                    
-                    # 计算日期范围
-                    date_start = None
-                    date_end = None
-                    if 'trade_date_dt' in exchange_df.columns and not exchange_df['trade_date_dt'].isna().all():
-                        valid_dates = exchange_df['trade_date_dt'].dropna()
-                        if not valid_dates.empty:
-                            date_start = valid_dates.min().strftime('%Y-%m-%d')
-                            date_end = valid_dates.max().strftime('%Y-%m-%d')
-                    
-                    symbol_detail['exchange_data'] = {
-                        'record_count': total_record_count,  # 显示总记录数
-                        'date_range': {
-                            'start': date_start,
-                            'end': date_end
-                        },
-                        'duplicates': exchange_df.duplicated(subset=['trade_date']).sum() if 'trade_date' in exchange_df.columns else 0,
-                        'null_counts': {
-                            'open': exchange_df['open'].isna().sum() if 'open' in exchange_df.columns else 0,
-                            'high': exchange_df['high'].isna().sum() if 'high' in exchange_df.columns else 0,
-                            'low': exchange_df['low'].isna().sum() if 'low' in exchange_df.columns else 0,
-                            'close': exchange_df['close'].isna().sum() if 'close' in exchange_df.columns else 0,
-                            'volume': exchange_df['volume'].isna().sum() if 'volume' in exchange_df.columns else 0
-                        },
-                        'invalid_prices': (((exchange_df['open'] <= 0) if 'open' in exchange_df.columns else pd.Series([False])) | 
-                                          ((exchange_df['high'] <= 0) if 'high' in exchange_df.columns else pd.Series([False])) | 
-                                          ((exchange_df['low'] <= 0) if 'low' in exchange_df.columns else pd.Series([False])) | 
-                                          ((exchange_df['close'] <= 0) if 'close' in exchange_df.columns else pd.Series([False]))).sum(),
-                        'invalid_volumes': (exchange_df['volume'] < 0).sum() if 'volume' in exchange_df.columns else 0
-                    }
-                    
-                    # 3. 对比分析
-                    comparison = {}
-                    
-                    # 对比记录数
-                    local_count = symbol_detail['local_data'].get('record_count', 0)
-                    exchange_count = symbol_detail['exchange_data'].get('record_count', 0)
-                    comparison['record_count_diff'] = local_count - exchange_count
-                    
-                    # 对比重复数据
-                    local_duplicates = symbol_detail['local_data'].get('duplicates', 0)
-                    exchange_duplicates = symbol_detail['exchange_data'].get('duplicates', 0)
-                    comparison['duplicates_diff'] = local_duplicates - exchange_duplicates
-                    
-                    # 对比空值
-                    local_nulls = sum(symbol_detail['local_data'].get('null_counts', {}).values())
-                    exchange_nulls = sum(symbol_detail['exchange_data'].get('null_counts', {}).values())
-                    comparison['nulls_diff'] = local_nulls - exchange_nulls
-                    
-                    # 对比无效价格
-                    local_invalid_prices = symbol_detail['local_data'].get('invalid_prices', 0)
-                    exchange_invalid_prices = symbol_detail['exchange_data'].get('invalid_prices', 0)
-                    comparison['invalid_prices_diff'] = local_invalid_prices - exchange_invalid_prices
-                    
-                    # 对比无效成交量
-                    local_invalid_volumes = symbol_detail['local_data'].get('invalid_volumes', 0)
-                    exchange_invalid_volumes = symbol_detail['exchange_data'].get('invalid_volumes', 0)
-                    comparison['invalid_volumes_diff'] = local_invalid_volumes - exchange_invalid_volumes
-                    
-                    symbol_detail['comparison'] = comparison
-                    
-                    # 4. 得出结论
-                    conclusion_parts = []
-                    
-                    # 如果交易所数据也有问题
-                    if exchange_duplicates > 0 or exchange_nulls > 0 or exchange_invalid_prices > 0 or exchange_invalid_volumes > 0:
-                        conclusion_parts.append("交易所API数据存在问题")
-                        recheck_results['exchange_api_issues'].append(symbol)
-                    
-                    # 如果本地数据问题更严重
-                    if (local_duplicates > exchange_duplicates or 
-                        local_nulls > exchange_nulls or 
-                        local_invalid_prices > exchange_invalid_prices or 
-                        local_invalid_volumes > exchange_invalid_volumes):
-                        conclusion_parts.append("本地数据问题更严重")
-                        recheck_results['local_data_issues'].append(symbol)
-                    
-                    # 如果两边都有问题
-                    if (exchange_duplicates > 0 or exchange_nulls > 0 or exchange_invalid_prices > 0 or exchange_invalid_volumes > 0) and \
-                       (local_duplicates > 0 or local_nulls > 0 or local_invalid_prices > 0 or local_invalid_volumes > 0):
-                        recheck_results['both_issues'].append(symbol)
-                    
-                    # 如果本地数据问题可以通过重新下载修复
-                    if (local_duplicates > exchange_duplicates or 
-                        local_nulls > exchange_nulls or 
-                        local_invalid_prices > exchange_invalid_prices or 
-                        local_invalid_volumes > exchange_invalid_volumes) and \
-                       (exchange_duplicates == 0 and exchange_nulls == 0 and exchange_invalid_prices == 0 and exchange_invalid_volumes == 0):
-                        conclusion_parts.append("建议重新下载修复")
-                        recheck_results['fixed_by_redownload'].append(symbol)
-                    
-                    if conclusion_parts:
-                        symbol_detail['conclusion'] = " | ".join(conclusion_parts)
-                    else:
-                        symbol_detail['conclusion'] = "数据正常"
-                    
-                    if verbose:
-                        print(f"  本地记录数: {local_count}, 交易所记录数: {exchange_count}")
-                        print(f"  本地重复: {local_duplicates}, 交易所重复: {exchange_duplicates}")
-                        print(f"  本地空值: {local_nulls}, 交易所空值: {exchange_nulls}")
-                        print(f"  结论: {symbol_detail['conclusion']}")
-                    else:
-                        symbol_detail['exchange_data'] = {
-                            'record_count': 0,
-                            'error': '交易所API返回空数据'
-                        }
-                        symbol_detail['conclusion'] = "交易所API返回空数据"
-                        recheck_results['exchange_api_issues'].append(symbol)
-                        
-                        if verbose:
-                            print(f"  警告: 交易所API返回空数据")
-                else:
-                    symbol_detail['exchange_data'] = {
-                        'record_count': 0,
-                        'error': '交易所API返回None'
-                    }
-                    symbol_detail['conclusion'] = "交易所API返回None"
-                    recheck_results['exchange_api_issues'].append(symbol)
-                    
-                    if verbose:
-                        print(f"  警告: 交易所API返回None")
-                        
-            except Exception as e:
-                symbol_detail['exchange_data'] = {
-                    'error': f'获取交易所数据失败: {str(e)}'
-                }
-                symbol_detail['conclusion'] = f"获取交易所数据失败: {str(e)}"
-                recheck_results['exchange_api_issues'].append(symbol)
-                
-                if verbose:
-                    print(f"  错误: 获取交易所数据失败: {str(e)}")
-                    
-        except Exception as e:
-            symbol_detail['error'] = f'复检过程出错: {str(e)}'
-            if verbose:
-                print(f"  错误: {str(e)}")
-        
-        recheck_results['details'][symbol] = symbol_detail
+    # 没有指定结束日期且本地没有数据时，API请求到复检开始的时间
+    now_dt = dt.now()
+    # K线间隔对应的秒数，对所有交易对都一样
+    interval_seconds = INTERVAL_SECONDS.get(interval, 86400)
+    
+    # 各交易对的复检相互独立，主要耗时在数据库查询和交易所API请求，用线程池并行执行
+    # 交易所请求的并发数由 _exchange_request_slots 统一限制；map 按输入顺序返回，结果和输出顺序与串行一致
+    details_map = check_results.get('details', {})
+    total = len(problematic_symbols)
+    # 按交易对顺序预先建好 details 的键，哈希表只分配一次，下面只更新值
+    recheck_results['details'] = dict.fromkeys(problematic_symbols)
+    workers = max(1, min(RECHECK_WORKERS, total))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rechecks = executor.map(
+            lambda item: _recheck_symbol(
+                item[1], item[0], total, details_map.get(item[1], {}).get('issues', []),
+                interval, start_dt, end_dt, now_dt, interval_seconds, verbose
+            ),
+            enumerate(problematic_symbols, 1)
+        )
+        for symbol, (symbol_detail, categories, output) in zip(problematic_symbols, rechecks):
+            # 每个交易对的输出合并为一次写入，减少 stdout 加锁和系统调用
+            if output:
+                print("\n".join(output))
+            for category in categories:
+                recheck_results[category].append(symbol)
+            recheck_results['details'][symbol] = symbol_detail
     
     if verbose:
         print("\n" + "=" * 80)
@@ -1996,178 +3051,23 @@ def recheck_problematic_symbols(
         print(f"  两边都有问题: {len(recheck_results['both_issues'])}")
         print(f"  可通过重新下载修复: {len(recheck_results['fixed_by_redownload'])}")
     
-    # 生成TXT报告文件
+    # 生成TXT报告文件（逐行写入文件，不在内存中拼接完整内容）
     if output_file:
         try:
-            report_lines = []
-            report_lines.append("=" * 80)
-            report_lines.append("数据复检报告")
-            report_lines.append("=" * 80)
-            report_lines.append(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            report_lines.append(f"K线间隔: {interval}")
-            if start_date:
-                report_lines.append(f"开始日期: {start_date}")
-            if end_date:
-                report_lines.append(f"结束日期: {end_date}")
-            report_lines.append("")
-            
-            # 总结统计
-            report_lines.append("-" * 80)
-            report_lines.append("复检总结")
-            report_lines.append("-" * 80)
-            report_lines.append(f"总复检数: {recheck_results['total_rechecked']}")
-            report_lines.append(f"交易所API问题: {len(recheck_results['exchange_api_issues'])}")
-            report_lines.append(f"本地数据问题: {len(recheck_results['local_data_issues'])}")
-            report_lines.append(f"两边都有问题: {len(recheck_results['both_issues'])}")
-            report_lines.append(f"可通过重新下载修复: {len(recheck_results['fixed_by_redownload'])}")
-            report_lines.append("")
-            
-            # 问题分类
-            if recheck_results['exchange_api_issues']:
-                report_lines.append("-" * 80)
-                report_lines.append("交易所API问题交易对")
-                report_lines.append("-" * 80)
-                for symbol in recheck_results['exchange_api_issues']:
-                    report_lines.append(f"  - {symbol}")
-                report_lines.append("")
-            
-            if recheck_results['local_data_issues']:
-                report_lines.append("-" * 80)
-                report_lines.append("本地数据问题交易对")
-                report_lines.append("-" * 80)
-                for symbol in recheck_results['local_data_issues']:
-                    report_lines.append(f"  - {symbol}")
-                report_lines.append("")
-            
-            if recheck_results['both_issues']:
-                report_lines.append("-" * 80)
-                report_lines.append("两边都有问题的交易对")
-                report_lines.append("-" * 80)
-                for symbol in recheck_results['both_issues']:
-                    report_lines.append(f"  - {symbol}")
-                report_lines.append("")
-            
-            if recheck_results['fixed_by_redownload']:
-                report_lines.append("-" * 80)
-                report_lines.append("可通过重新下载修复的交易对")
-                report_lines.append("-" * 80)
-                for symbol in recheck_results['fixed_by_redownload']:
-                    report_lines.append(f"  - {symbol}")
-                report_lines.append("")
-            
-            # 详细对比信息
-            report_lines.append("=" * 80)
-            report_lines.append("详细对比信息")
-            report_lines.append("=" * 80)
-            
-            for symbol, detail in recheck_results['details'].items():
-                report_lines.append("")
-                report_lines.append(f"交易对: {symbol}")
-                report_lines.append("-" * 80)
-                
-                if detail.get('issues'):
-                    report_lines.append(f"原始问题: {', '.join(detail['issues'])}")
-                
-                # 本地数据信息
-                local_data = detail.get('local_data', {})
-                report_lines.append("\n本地数据:")
-                if 'error' in local_data:
-                    report_lines.append(f"  错误: {local_data['error']}")
-                else:
-                    report_lines.append(f"  记录数: {local_data.get('record_count', 0)}")
-                    if local_data.get('date_range', {}).get('start'):
-                        report_lines.append(f"  日期范围: {local_data['date_range']['start']} 至 {local_data['date_range']['end']}")
-                    report_lines.append(f"  重复数据: {local_data.get('duplicates', 0)}")
-                    null_counts = local_data.get('null_counts', {})
-                    total_nulls = sum(null_counts.values())
-                    report_lines.append(f"  空值总数: {total_nulls}")
-                    if total_nulls > 0:
-                        report_lines.append(f"    - open: {null_counts.get('open', 0)}")
-                        report_lines.append(f"    - high: {null_counts.get('high', 0)}")
-                        report_lines.append(f"    - low: {null_counts.get('low', 0)}")
-                        report_lines.append(f"    - close: {null_counts.get('close', 0)}")
-                        report_lines.append(f"    - volume: {null_counts.get('volume', 0)}")
-                    report_lines.append(f"  无效价格: {local_data.get('invalid_prices', 0)}")
-                    report_lines.append(f"  无效成交量: {local_data.get('invalid_volumes', 0)}")
-                
-                # 交易所数据信息
-                exchange_data = detail.get('exchange_data', {})
-                report_lines.append("\n交易所数据:")
-                if 'error' in exchange_data:
-                    report_lines.append(f"  错误: {exchange_data['error']}")
-                else:
-                    report_lines.append(f"  记录数: {exchange_data.get('record_count', 0)}")
-                    if exchange_data.get('date_range', {}).get('start'):
-                        report_lines.append(f"  日期范围: {exchange_data['date_range']['start']} 至 {exchange_data['date_range']['end']}")
-                    report_lines.append(f"  重复数据: {exchange_data.get('duplicates', 0)}")
-                    null_counts = exchange_data.get('null_counts', {})
-                    total_nulls = sum(null_counts.values())
-                    report_lines.append(f"  空值总数: {total_nulls}")
-                    if total_nulls > 0:
-                        report_lines.append(f"    - open: {null_counts.get('open', 0)}")
-                        report_lines.append(f"    - high: {null_counts.get('high', 0)}")
-                        report_lines.append(f"    - low: {null_counts.get('low', 0)}")
-                        report_lines.append(f"    - close: {null_counts.get('close', 0)}")
-                        report_lines.append(f"    - volume: {null_counts.get('volume', 0)}")
-                    report_lines.append(f"  无效价格: {exchange_data.get('invalid_prices', 0)}")
-                    report_lines.append(f"  无效成交量: {exchange_data.get('invalid_volumes', 0)}")
-                
-                # 对比信息
-                comparison = detail.get('comparison', {})
-                if comparison:
-                    report_lines.append("\n对比分析:")
-                    report_lines.append(f"  记录数差异: {comparison.get('record_count_diff', 0)} (本地 - 交易所)")
-                    report_lines.append(f"  重复数据差异: {comparison.get('duplicates_diff', 0)}")
-                    report_lines.append(f"  空值差异: {comparison.get('nulls_diff', 0)}")
-                    report_lines.append(f"  无效价格差异: {comparison.get('invalid_prices_diff', 0)}")
-                    report_lines.append(f"  无效成交量差异: {comparison.get('invalid_volumes_diff', 0)}")
-                
-                # 结论
-                if detail.get('conclusion'):
-                    report_lines.append(f"\n结论: {detail['conclusion']}")
-            
-            # 写入文件
-            report_content = "\n".join(report_lines)
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(report_content)
+            _write_report_lines(
+                output_file,
+                _iter_recheck_report_lines(recheck_results, interval, start_date, end_date)
+            )
             
             if verbose:
                 print(f"\n复检报告已保存到: {output_file}")
         except Exception as e:
             if verbose:
                 print(f"\n警告: 生成报告文件失败: {str(e)}")
-            import traceback
             traceback.print_exc()
     
     # 转换所有 numpy/pandas 类型为 Python 原生类型，以便 JSON 序列化
-    def convert_to_python_types(obj):
-        """递归转换 numpy/pandas 类型为 Python 原生类型"""
-        try:
-            import numpy as np
-        except ImportError:
-            np = None
-        
-        if isinstance(obj, dict):
-            return {k: convert_to_python_types(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [convert_to_python_types(item) for item in obj]
-        elif np is not None:
-            if isinstance(obj, (np.integer, np.int64, np.int32)):
-                return int(obj)
-            elif isinstance(obj, (np.floating, np.float64, np.float32)):
-                return float(obj)
-            elif isinstance(obj, np.bool_):
-                return bool(obj)
-            elif isinstance(obj, np.ndarray):
-                return obj.tolist()
-        elif pd.isna(obj):
-            return None
-        elif hasattr(obj, 'item'):  # numpy scalar
-            return obj.item()
-        else:
-            return obj
-    
-    return convert_to_python_types(recheck_results)
+    return _to_python_types(recheck_results)
 
 
 if __name__ == "__main__":
@@ -2315,7 +3215,9 @@ if __name__ == "__main__":
             check_missing_dates=check_missing_dates,
             check_data_quality=check_data_quality,
             output_format=report_format,
-            output_file=report_file
+            output_file=report_file,
+            return_content=False,
+            json_indent=2  # 保存到文件的 JSON 报告保持缩进，便于阅读
         )
         if not args.quiet:
             print(f"\n报告已生成: {report_file}")
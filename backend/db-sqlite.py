@@ -2,8 +2,11 @@ import sqlite3
 import pandas as pd
 import os
 import sys
+import threading
 from datetime import datetime, timedelta
 db_path = "~/downloads/nan/crypto_data.db"
+#批量插入每批的行数（SQLite 在 40~50 行一批时吞吐最好）
+BULK_INSERT_BATCH_SIZE = 50
 
 #连接数据库
 def connect_db(path):
@@ -12,6 +15,26 @@ def connect_db(path):
         print(f"❌ 错误: 文件不存在: {expanded_path}")
         sys.exit(1)
     conn = sqlite3.connect(expanded_path)
+    #只设置本连接有效的读取参数，不修改数据库文件本身（日志模式等写入参数在 bulk_insert 中设置）
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    #256 MB 页缓存 + 256 MB 内存映射，重复读取时直接命中缓存
+    conn.execute("PRAGMA cache_size=-262144;")
+    conn.execute("PRAGMA mmap_size=268435456;")
+    return conn
+
+#每个线程按数据库路径各自缓存连接（sqlite3 连接默认不能跨线程使用）
+_local = threading.local()
+
+#获取当前线程到指定数据库的连接，第一次调用时打开，之后复用
+def get_conn(path=db_path):
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    expanded_path = os.path.expanduser(path)
+    conn = conns.get(expanded_path)
+    if conn is None:
+        conn = connect_db(expanded_path)
+        conns[expanded_path] = conn
     return conn
 
 #获取所有表名
@@ -21,13 +44,42 @@ def get_all_tables(conn):
     tables = [row[0] for row in cursor.fetchall()]
     return tables
 
-print("连接数据库...")
-print(f"数据库路径: {db_path}")
-print("-" * 50)
-print("获取所有表名...")
-print("-" * 50)
-print(len(get_all_tables(connect_db(db_path))))
+#批量插入数据
+def bulk_insert(conn, table, rows, batch_size=BULK_INSERT_BATCH_SIZE):
+    """
+    分批 executemany 插入多行数据，所有批次在同一个事务中提交
+
+    Args:
+        conn: sqlite3 连接
+        table: 表名
+        rows: 行数据列表，每行是与表列顺序一致的元组
+        batch_size: 每批的行数，默认50
+
+    Returns:
+        int: 插入的行数
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    #WAL 日志 + NORMAL 同步：写入时不必每次提交都 fsync 主库文件
+    #注意 journal_mode=WAL 会持久保存在数据库文件中
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    placeholders = ",".join("?" * len(rows[0]))
+    stmt = f'INSERT INTO "{table}" VALUES ({placeholders})'
+    with conn:
+        for i in range(0, len(rows), batch_size):
+            conn.executemany(stmt, rows[i:i + batch_size])
+    return len(rows)
 
 #获取第一个表的数据
 def get_data(table_name):
-    
\ No newline at end of file
+    return pd.read_sql_query(f'SELECT * FROM "{table_name}"', get_conn())
+
+if __name__ == "__main__":
+    print("连接数据库...")
+    print(f"数据库路径: {db_path}")
+    print("-" * 50)
+    print("获取所有表名...")
+    print("-" * 50)
+    print(len(get_all_tables(get_conn())))
@@ -1,13 +1,23 @@
 from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.pool import QueuePool
+import io
 import logging
+from functools import lru_cache
 
 # 从配置文件获取数据库连接
 try:
-    from config import DATABASE_URL
+    from config import (
+        DATABASE_URL, PG_POOL_SIZE, PG_MAX_OVERFLOW, PG_POOL_RECYCLE,
+        PG_POOL_TIMEOUT, PG_POOL_PRE_PING
+    )
 except ImportError:
     # 如果config模块不可用，使用环境变量构建连接URL
     import os
+    PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "20"))
+    PG_MAX_OVERFLOW = int(os.getenv("PG_MAX_OVERFLOW", "10"))
+    PG_POOL_RECYCLE = int(os.getenv("PG_POOL_RECYCLE", "60"))
+    PG_POOL_TIMEOUT = int(os.getenv("PG_POOL_TIMEOUT", "30"))
+    PG_POOL_PRE_PING = os.getenv("PG_POOL_PRE_PING", "false").lower() == "true"
     PG_HOST = os.getenv("PG_HOST", "localhost")
     PG_PORT = int(os.getenv("PG_PORT", "5432"))
     PG_DB = os.getenv("PG_DB", "crypto_data")
@@ -26,7 +36,10 @@ connect_args = {
     "keepalives": 1,
     "keepalives_idle": 30,
     "keepalives_interval": 10,
-    "keepalives_count": 5
+    "keepalives_count": 5,
+    # 已发送的数据30秒内未被确认就断开连接，避免网络中断时写入一直挂起
+    # （libpq 本身已对连接开启 TCP_NODELAY，不需要另外关闭 Nagle 算法）
+    "tcp_user_timeout": 30000
 }
 
 # 如果环境变量要求 SSL，添加 SSL 参数
@@ -38,98 +51,332 @@ elif "192.168" in DATABASE_URL or "localhost" not in DATABASE_URL.lower():
     # 如果服务器不支持 SSL，会自动降级到非 SSL
     connect_args["sslmode"] = "prefer"
 
+# 批量写入的分页大小
+# 调用方把多行参数以 list[dict] 一次传给 conn.execute(stmt, rows)，不要逐行循环执行：
+# - Core insert() 语句由 insertmanyvalues 合并为多行 VALUES (...),(...)，每页最多 1000 行
+# - text() 语句由 psycopg2 execute_batch 按页合并发送，每页 500 条
+INSERTMANYVALUES_PAGE_SIZE = 1000
+EXECUTEMANY_BATCH_PAGE_SIZE = 500
+
 engine = create_engine(
     DATABASE_URL,
     poolclass=QueuePool,
-    pool_size=5,
-    max_overflow=10,
-    pool_pre_ping=True,  # 自动检测并重连断开的连接
+    pool_size=PG_POOL_SIZE,
+    max_overflow=PG_MAX_OVERFLOW,
+    pool_recycle=PG_POOL_RECYCLE,
+    pool_timeout=PG_POOL_TIMEOUT,
+    # 默认不在每次取连接时 SELECT 1：在 PgBouncer 事务模式下它会多一次往返并占用后端连接，
+    # 断开的连接由 TCP keepalive 和 pool_recycle 处理
+    pool_pre_ping=PG_POOL_PRE_PING,
     echo=False,
+    executemany_mode="values_plus_batch",
+    executemany_batch_page_size=EXECUTEMANY_BATCH_PAGE_SIZE,
+    insertmanyvalues_page_size=INSERTMANYVALUES_PAGE_SIZE,
+    # 每张K线表的语句各自占用编译缓存，表多时默认的500条不够
+    query_cache_size=2048,
     connect_args=connect_args
 )
 
 
+def _quote_ident(name):
+    """把标识符（表名、索引名）加上双引号，内部的双引号转义为两个"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+# K线表是否存在（原始大小写或小写）
+_KLINE_TABLE_EXISTS_SQL = text(
+    "SELECT to_regclass(:quoted) IS NOT NULL OR to_regclass(:lowered) IS NOT NULL;"
+)
+
+
+@lru_cache(maxsize=4096)
+def _kline_table_ddl(table_name):
+    """K线表的建表语句，每个表名只构建一次，重复使用同一个 text() 对象"""
+    table = _quote_ident(table_name)
+    index = _quote_ident(f"idx_{table_name}_open_time")
+    # PostgreSQL 表创建语句
+    # 注意：PostgreSQL 使用 SERIAL 而不是 AUTOINCREMENT
+    # REAL 在 PostgreSQL 中是单精度，使用 DOUBLE PRECISION 或 NUMERIC
+    # IF NOT EXISTS：多个线程/进程同时创建同一张表时不会报错
+    return text(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        trade_date VARCHAR(50) PRIMARY KEY,
+        open_time BIGINT,
+        open DOUBLE PRECISION,
+        high DOUBLE PRECISION,
+        low DOUBLE PRECISION,
+        close DOUBLE PRECISION,
+        volume DOUBLE PRECISION,
+        close_time BIGINT,
+        quote_volume DOUBLE PRECISION,
+        trade_count BIGINT,
+        active_buy_volume DOUBLE PRECISION,
+        active_buy_quote_volume DOUBLE PRECISION,
+        reserved_field TEXT,
+        diff DOUBLE PRECISION,
+        pct_chg DOUBLE PRECISION
+    );
+    CREATE INDEX IF NOT EXISTS {index} ON {table} (open_time);
+    """)
+
+
+# 本进程中已确认存在（或已创建）的K线表，命中时 create_table 不再查询数据库
+# 删除表时必须调用 forget_tables 使其失效（delete_table 已经调用）
+_known_tables = set()
+
+
 # 1. 查询表是否存在，没有则创建
 def create_table(table_name):
     """创建K线数据表（如果不存在）"""
+    if table_name in _known_tables:
+        return True
+    
     with engine.connect() as conn:
-        # PostgreSQL 使用 information_schema 查询表是否存在
+        # 用 to_regclass 直接查系统目录判断表是否存在，比 information_schema 视图快
         # 注意：PostgreSQL中，如果表名用引号创建，会保持大小写；否则会转换为小写
-        # 所以需要检查两种情况：原始大小写和小写
+        # 所以需要检查两种情况：原始大小写和小写（小写的旧表不能交给 IF NOT EXISTS 判断）
         result = conn.execute(
-            text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND (table_name = :table_name OR table_name = LOWER(:table_name))
-                );
-            """),
-            {"table_name": table_name}
+            _KLINE_TABLE_EXISTS_SQL,
+            {"quoted": f"public.{_quote_ident(table_name)}", "lowered": f"public.{_quote_ident(table_name.lower())}"}
         )
         
         table_exists = result.fetchone()[0]
 
         if not table_exists:
-            # PostgreSQL 表创建语句
-            # 注意：PostgreSQL 使用 SERIAL 而不是 AUTOINCREMENT
-            # REAL 在 PostgreSQL 中是单精度，使用 DOUBLE PRECISION 或 NUMERIC
-            text_create = f"""
-            CREATE TABLE "{table_name}" (
-                trade_date VARCHAR(50) PRIMARY KEY,
-                open_time BIGINT,
-                open DOUBLE PRECISION,
-                high DOUBLE PRECISION,
-                low DOUBLE PRECISION,
-                close DOUBLE PRECISION,
-                volume DOUBLE PRECISION,
-                close_time BIGINT,
-                quote_volume DOUBLE PRECISION,
-                trade_count BIGINT,
-                active_buy_volume DOUBLE PRECISION,
-                active_buy_quote_volume DOUBLE PRECISION,
-                reserved_field TEXT,
-                diff DOUBLE PRECISION,
-                pct_chg DOUBLE PRECISION
-            );
-            CREATE INDEX IF NOT EXISTS "idx_{table_name}_open_time" ON "{table_name}" (open_time);
-            """
-            conn.execute(text(text_create))
+            conn.execute(_kline_table_ddl(table_name))
             conn.commit()
             logging.info(f"Table '{table_name}' created successfully with open_time index.")
+        _known_tables.add(table_name)
         return table_exists
     
+# public schema 下的所有表名
+_PUBLIC_TABLES_SQL = text("""
+    SELECT c.relname
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public'
+    AND c.relkind IN ('r', 'p');
+""")
+
+
+def ensure_schema(table_names):
+    """
+    批量创建K线数据表（如果不存在）
+    
+    下载开始前调用一次：一次查询取出已有的表，缺少的表在同一次请求中全部创建。
+    之后这些表的 create_table 调用直接命中 _known_tables，不再访问数据库。
+    
+    Args:
+        table_names: K线表名列表
+    
+    Returns:
+        int: 新创建的表数量
+    """
+    pending = [name for name in dict.fromkeys(table_names) if name not in _known_tables]
+    if not pending:
+        return 0
+    
+    with engine.connect() as conn:
+        existing = {row[0] for row in conn.execute(_PUBLIC_TABLES_SQL)}
+        # 与 create_table 相同，小写的旧表也算已存在
+        missing = [name for name in pending if name not in existing and name.lower() not in existing]
+        if missing:
+            conn.exec_driver_sql("\n".join(_kline_table_ddl(name).text for name in missing))
+            conn.commit()
+            logging.info(f"批量创建了 {len(missing)} 张K线表")
+    
+    _known_tables.update(pending)
+    return len(missing)
+
+
+# K线表的列顺序（与 create_table 中的建表语句一致）
+KLINE_TABLE_COLUMNS = [
+    "trade_date", "open_time", "open", "high", "low", "close", "volume",
+    "close_time", "quote_volume", "trade_count", "active_buy_volume",
+    "active_buy_quote_volume", "reserved_field", "diff", "pct_chg"
+]
+
+
+def _copy_from_dataframe(cur, quoted_table, df):
+    """把DataFrame序列化为制表符分隔的文本，用一次 COPY ... FROM STDIN 写入指定的表"""
+    buf = io.StringIO()
+    df.to_csv(buf, sep='\t', header=False, index=False, na_rep='\\N')
+    buf.seek(0)
+    
+    columns = ', '.join(_quote_ident(col) for col in df.columns)
+    cur.copy_expert(f"COPY {quoted_table} ({columns}) FROM STDIN WITH (FORMAT text, NULL '\\N')", buf)
+
+
+def copy_dataframe(table_name, df, synchronous_commit=True):
+    """
+    使用 PostgreSQL COPY ... FROM STDIN 批量写入DataFrame
+    
+    整个DataFrame序列化为一份制表符分隔的文本，在一次COPY中写入，
+    没有逐行INSERT的网络往返和SQL解析开销。COPY是原子的：
+    任何一行违反约束（如主键重复）时整批回滚并抛出异常。
+    
+    Args:
+        table_name: 表名
+        df: 要写入的DataFrame，列名必须与表的列名一致
+        synchronous_commit: 是否等待WAL落盘后再返回提交结果。可以重新下载的数据传False，
+                            本次事务使用 SET LOCAL synchronous_commit = OFF，数据库崩溃时
+                            可能丢失最近提交的少量数据，但不会损坏数据
+    
+    Returns:
+        int: 写入的行数
+    """
+    if df.empty:
+        return 0
+    
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            if not synchronous_commit:
+                cur.execute("SET LOCAL synchronous_commit = OFF")
+            _copy_from_dataframe(cur, _quote_ident(table_name), df)
+        raw_conn.commit()
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+    return len(df)
+
+
+def bulk_insert_kline(table_name, df):
+    """
+    使用 COPY 批量写入K线数据
+    
+    K线数据可以从交易所重新下载，提交时不等待WAL落盘。
+    
+    Args:
+        table_name: K线表名
+        df: K线DataFrame（trade_date 已转换为字符串），多余的列会被忽略
+    
+    Returns:
+        int: 写入的行数
+    """
+    columns = [col for col in KLINE_TABLE_COLUMNS if col in df.columns]
+    return copy_dataframe(table_name, df[columns], synchronous_commit=False)
+
+
+def bulk_backfill(table_name, df, update_existing=False):
+    """
+    经由临时暂存表批量写入K线数据，已存在的 trade_date 不会导致整批失败
+    
+    数据先 COPY 进与目标表结构相同的临时表（临时表不写WAL，提交时自动删除），
+    再用一条 INSERT ... SELECT ... ON CONFLICT 合并进目标表。整个过程在一个事务中，
+    失败时全部回滚。
+    
+    Args:
+        table_name: K线表名
+        df: K线DataFrame（trade_date 已转换为字符串），多余的列会被忽略
+        update_existing: 已存在的 trade_date 是否用新数据覆盖，默认False（跳过）
+    
+    Returns:
+        int: 插入（或更新）的行数
+    """
+    if df.empty:
+        return 0
+    
+    columns = [col for col in KLINE_TABLE_COLUMNS if col in df.columns]
+    table = _quote_ident(table_name)
+    # 临时表只在本连接可见，并发写入同一张表时不会冲突
+    stage = _quote_ident(f"{table_name}_stg")
+    column_list = ', '.join(_quote_ident(col) for col in columns)
+    if update_existing:
+        updates = ', '.join(
+            f'{_quote_ident(col)} = EXCLUDED.{_quote_ident(col)}' for col in columns if col != 'trade_date'
+        )
+        on_conflict = f'ON CONFLICT (trade_date) DO UPDATE SET {updates}'
+    else:
+        on_conflict = 'ON CONFLICT DO NOTHING'
+    
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            cur.execute("SET LOCAL synchronous_commit = OFF")
+            cur.execute(f'CREATE TEMP TABLE {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP')
+            _copy_from_dataframe(cur, stage, df[columns])
+            cur.execute(f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {stage} {on_conflict}')
+            saved_count = cur.rowcount
+        raw_conn.commit()
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+    return saved_count
+
+
 # 2. 删除表    
 def delete_table(table_name):
     """删除指定的表"""
     with engine.connect() as conn:
         conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}";'))
         conn.commit()
+        forget_tables([table_name])
         logging.info(f"Table '{table_name}' deleted successfully.")
 
 
+def forget_tables(table_names=None):
+    """
+    让已删除的表在本进程的表缓存中失效，之后的 create_table/ensure_schema 会重新建表
+    
+    任何绕过 delete_table 直接执行 DROP TABLE 的地方都必须在删除后调用。
+    
+    Args:
+        table_names: 已删除的表名列表（不区分大小写），为None时清空全部缓存
+    """
+    global _trade_table_checked
+    if table_names is None:
+        _known_tables.clear()
+        _trade_table_checked = False
+        return
+    
+    dropped = {name.lower() for name in table_names}
+    # 缓存中的表名与数据库中的实际表名大小写可能不同，按小写匹配
+    for name in [name for name in _known_tables if name.lower() in dropped]:
+        _known_tables.discard(name)
+    if 'backtrade_records' in dropped:
+        _trade_table_checked = False
+
+
+# 交易记录表在本进程中是否已检查（创建/迁移）过
+_trade_table_checked = False
+
+# 交易记录表及 has_added_position 字段是否存在
+_TRADE_TABLE_PROBE_SQL = text("""
+    SELECT
+        to_regclass(:regclass) IS NOT NULL,
+        EXISTS (
+            SELECT 1 FROM pg_attribute
+            WHERE attrelid = to_regclass(:regclass)
+            AND attname = 'has_added_position'
+            AND NOT attisdropped
+        );
+""")
+
+
 # 3. 创建交易记录表（用于回测结果存储）
 def create_trade_table():
     """创建交易记录表"""
+    global _trade_table_checked
+    if _trade_table_checked:
+        return True
+    
     table_name = 'backtrade_records'
     with engine.connect() as conn:
-        # PostgreSQL 使用 information_schema 查询表是否存在
-        result = conn.execute(
-            text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = :table_name
-                );
-            """),
-            {"table_name": table_name}
-        )
-        table_exists = result.fetchone()[0]
+        # 一次查询同时得到表和 has_added_position 字段是否存在
+        # to_regclass/pg_attribute 直接查系统目录，比 information_schema 视图快
+        result = conn.execute(_TRADE_TABLE_PROBE_SQL, {"regclass": f"public.{_quote_ident(table_name)}"})
+        table_exists, has_added_position = result.fetchone()
         
         if not table_exists:
             # PostgreSQL 表创建语句
             # 使用 SERIAL 或 BIGSERIAL 作为自增主键
             text_create = f"""
-            CREATE TABLE "{table_name}" (
+            CREATE TABLE IF NOT EXISTS "{table_name}" (
                 id BIGSERIAL PRIMARY KEY,
                 entry_date VARCHAR(50) NOT NULL,
                 symbol VARCHAR(50) NOT NULL,
@@ -154,18 +401,7 @@ def create_trade_table():
             logging.info(f"交易记录表 '{table_name}' 创建成功")
         else:
             # 检查是否需要添加 has_added_position 字段
-            # PostgreSQL 使用 information_schema.columns 查询列信息
-            result = conn.execute(
-                text("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_schema = 'public' 
-                    AND table_name = :table_name;
-                """),
-                {"table_name": table_name}
-            )
-            columns = [row[0] for row in result.fetchall()]
-            if 'has_added_position' not in columns:
+            if not has_added_position:
                 logging.info(f"添加 has_added_position 字段到表 '{table_name}'")
                 conn.execute(
                     text(f'ALTER TABLE "{table_name}" ADD COLUMN has_added_position INTEGER DEFAULT 0;')
@@ -173,6 +409,7 @@ def create_trade_table():
                 conn.commit()
             logging.info(f"交易记录表 '{table_name}' 已存在")
         
+        _trade_table_checked = True
         return table_exists
 
 
@@ -64,8 +64,9 @@
   --auto-split: 当数据条数超过限制时自动分段下载（默认: True）
   --no-auto-split: 禁用自动分段下载
   --request-delay: 每次API请求之间的延迟时间（秒），避免频率限制（默认: 0.1）
-  --batch-size: 每处理多少个交易对后暂停（默认: 30）
-  --batch-delay: 每批处理后的暂停时间（秒）（默认: 3.0）
+  --batch-size: 每处理多少个交易对后暂停（默认: 30，仅 --workers 1 时有效）
+  --batch-delay: 每批处理后的暂停时间（秒）（默认: 3.0，仅 --workers 1 时有效）
+  --workers: 并行下载的交易对数（默认: 4，1 表示串行下载）
   --update: 更新已存在的数据
   --missing-only: 只下载缺失的交易对
   --symbols: 指定要下载的交易对列表
@@ -141,18 +142,41 @@ from binance_client import (
 from binance_sdk_derivatives_trading_usds_futures.rest_api.models import (
     KlineCandlestickDataIntervalEnum
 )
-from db import engine, create_table
+from db import engine, create_table, bulk_insert_kline, bulk_backfill, ensure_schema, PG_POOL_SIZE
 
 # 🔧 缓存交易所正常交易的交易对列表（避免重复查询）
 _valid_trading_symbols_cache: Optional[List[str]] = None
 _cache_timestamp: Optional[datetime] = None
+# 上面列表对应的集合（列表, 集合），用于 O(1) 判断交易对是否正常交易
+_valid_trading_symbols_set: tuple = (None, frozenset())
 CACHE_TTL_SECONDS = 3600
 DEFAULT_REQUEST_DELAY = 0.3
 DEFAULT_BATCH_SIZE = 30
 DEFAULT_BATCH_DELAY = 3.0
+# 批量下载时并行处理的交易对数（主要耗时在网络请求；所有请求共用 binance_client 的权重限流，
+# 每个线程写入时占用一个数据库连接，不超过连接池大小）
+DEFAULT_DOWNLOAD_WORKERS = min(4, PG_POOL_SIZE)
 BATCH_SIZE = 50  # PostgreSQL 批量插入大小
 API_DATA_LIMIT = 1500
 DISK_SPACE_REQUIRED_GB = 1.0
+# K线间隔对应的秒数
+INTERVAL_SECONDS = {
+    '1m': 60,
+    '3m': 180,
+    '5m': 300,
+    '15m': 900,
+    '30m': 1800,
+    '1h': 3600,
+    '2h': 7200,
+    '4h': 14400,
+    '6h': 21600,
+    '8h': 28800,
+    '12h': 43200,
+    '1d': 86400,
+    '3d': 259200,
+    '1w': 604800,
+    '1M': 2592000,  # 假设1个月=30天
+}
 
 
 def get_valid_trading_symbols(force_refresh: bool = False) -> List[str]:
@@ -199,6 +223,22 @@ def get_valid_trading_symbols(force_refresh: bool = False) -> List[str]:
         return []
 
 
+def get_valid_trading_symbol_set(force_refresh: bool = False) -> frozenset:
+    """
+    获取交易所正常交易的交易对集合（与 get_valid_trading_symbols 共用缓存）
+    
+    逐个校验交易对时用集合判断，不需要每次在列表中线性查找。
+    """
+    global _valid_trading_symbols_set
+    
+    symbols = get_valid_trading_symbols(force_refresh)
+    source, symbol_set = _valid_trading_symbols_set
+    if symbols is not source:
+        symbol_set = frozenset(symbols)
+        _valid_trading_symbols_set = (symbols, symbol_set)
+    return symbol_set
+
+
 def validate_symbol(symbol: str, skip_validation: bool = False) -> bool:
     """
     校验交易对是否在交易所正常交易
@@ -213,7 +253,7 @@ def validate_symbol(symbol: str, skip_validation: bool = False) -> bool:
     if skip_validation:
         return True
     
-    valid_symbols = get_valid_trading_symbols()
+    valid_symbols = get_valid_trading_symbol_set()
     
     if not valid_symbols:
         # 如果无法获取交易对列表，记录警告但允许继续（避免网络问题导致无法下载）
@@ -332,24 +372,7 @@ def calculate_interval_seconds(interval: str) -> int:
     Returns:
         int: 对应的秒数
     """
-    interval_map = {
-        '1m': 60,
-        '3m': 180,
-        '5m': 300,
-        '15m': 900,
-        '30m': 1800,
-        '1h': 3600,
-        '2h': 7200,
-        '4h': 14400,
-        '6h': 21600,
-        '8h': 28800,
-        '12h': 43200,
-        '1d': 86400,
-        '3d': 259200,
-        '1w': 604800,
-        '1M': 2592000,  # 假设1个月=30天
-    }
-    return interval_map.get(interval, 86400)
+    return INTERVAL_SECONDS.get(interval, 86400)
 
 
 def ensure_utc_timezone(*args: datetime) -> tuple:
@@ -474,6 +497,9 @@ def _insert_with_skip_duplicates(df: pd.DataFrame, table_name: str, engine) -> i
     """
     逐条插入数据，跳过重复的trade_date
     
+    INSERT 语句只构建一次（SQLAlchemy 复用同一个已编译的语句），所有行在同一个连接、
+    同一个事务中插入；重复的行由 ON CONFLICT DO NOTHING 跳过，不需要逐行提交或回滚。
+    
     Args:
         df: 要插入的DataFrame
         table_name: 表名
@@ -489,39 +515,32 @@ def _insert_with_skip_duplicates(df: pd.DataFrame, table_name: str, engine) -> i
     # 🔧 修复：表名用双引号括起来，避免包含特殊字符时SQL语法错误
     quoted_table_name = f'"{table_name}"'
     
-    for idx, (_, row) in enumerate(df.iterrows(), 1):
-        try:
-            # 将row转换为字典
-            row_dict = row.to_dict()
-            
-            # 构建INSERT语句，使用命名参数（:param）
-            # 🔧 修复：列名也用双引号括起来，避免特殊字符问题
-            columns = ', '.join([f'"{col}"' for col in df.columns])
-            placeholders = ', '.join([f':{col}' for col in df.columns])
-            
-            stmt = f"INSERT INTO {quoted_table_name} ({columns}) VALUES ({placeholders})"
-            with engine.connect() as conn:
-                # SQLAlchemy的execute方法使用字典作为参数
-                conn.execute(text(stmt), row_dict)
-                conn.commit()
-            saved_count += 1
-            
-            # 每处理100条输出一次进度
-            if idx % 100 == 0:
-                logging.info(f"逐条插入进度: {idx}/{total_rows}, 已保存: {saved_count}, 跳过: {skipped_count}")
-        except Exception as e:
-            # 如果是UNIQUE constraint错误，跳过这条数据
-            error_msg = str(e)
-            is_unique_error = any(keyword in error_msg for keyword in ["UniqueViolation", "duplicate key", "IntegrityError"]) or "unique" in error_msg.lower()
-            
-            if is_unique_error:
-                skipped_count += 1
-                continue
-            else:
-                trade_date = row_dict.get('trade_date', 'unknown') if 'row_dict' in locals() else 'unknown'
-                logging.error(f"插入数据失败: {e}, trade_date: {trade_date}")
-                logging.error(f"SQL语句: {stmt}")
-                raise
+    # 构建INSERT语句，使用命名参数（:param）
+    # 🔧 修复：列名也用双引号括起来，避免特殊字符问题
+    columns = ', '.join([f'"{col}"' for col in df.columns])
+    placeholders = ', '.join([f':{col}' for col in df.columns])
+    stmt = f"INSERT INTO {quoted_table_name} ({columns}) VALUES ({placeholders}) ON CONFLICT DO NOTHING"
+    insert_stmt = text(stmt)
+    
+    row_dict = {}
+    try:
+        with engine.connect() as conn:
+            for idx, row_dict in enumerate(df.to_dict('records'), 1):
+                # 没有插入任何行说明trade_date已存在，跳过这条数据
+                if conn.execute(insert_stmt, row_dict).rowcount > 0:
+                    saved_count += 1
+                else:
+                    skipped_count += 1
+                
+                # 每处理100条输出一次进度
+                if idx % 100 == 0:
+                    logging.info(f"逐条插入进度: {idx}/{total_rows}, 已保存: {saved_count}, 跳过: {skipped_count}")
+            conn.commit()
+    except Exception as e:
+        trade_date = row_dict.get('trade_date', 'unknown')
+        logging.error(f"插入数据失败: {e}, trade_date: {trade_date}")
+        logging.error(f"SQL语句: {stmt}")
+        raise
     
     logging.info(f"逐条插入完成: 总计 {total_rows} 条，成功保存 {saved_count} 条，跳过 {skipped_count} 条重复数据")
     return saved_count
@@ -818,16 +837,7 @@ def download_kline_data(
                 # 合并所有分段的数据
                 df = pd.concat(all_dfs, ignore_index=True)
                 
-                # 将trade_date转换为字符串格式(用于数据库存储和去重)
-                # 根据K线间隔选择合适的日期格式
-                if interval in ['1d', '3d', '1w', '1M']:
-                    # 日线及以上, 使用日期格式
-                    df['trade_date'] = df['trade_date'].dt.strftime('%Y-%m-%d')
-                else:
-                    # 小时线及以下, 使用完整时间格式
-                    df['trade_date'] = df['trade_date'].dt.strftime('%Y-%m-%d %H:%M:%S')
-                
-                # 去重（按trade_date）
+                # 去重（按trade_date，此时还是 datetime64，按整数哈希，转换为字符串统一在后面进行）
                 df = df.drop_duplicates(subset=['trade_date'], keep='first')
                 logging.info(f"{symbol} 分段下载完成，合并后共 {len(df)} 条数据（去重前: {sum(len(d) for d in all_dfs)} 条）")
             else:
@@ -891,39 +901,25 @@ def download_kline_data(
             logging.warning(f"{symbol} 转换后的DataFrame为空")
             return False
         
-        # 将trade_date转换为字符串格式(用于数据库存储和去重)
-        # 注意：分段下载时已经在合并前转换过了，这里需要检查是否已转换
-        if df['trade_date'].dtype == 'object':
-            # 已经是字符串格式，跳过转换
-            pass
-        else:
-            # 根据K线间隔选择合适的日期格式
-            if interval in ['1d', '3d', '1w', '1M']:
-                # 日线及以上, 使用日期格式
-                df['trade_date'] = df['trade_date'].dt.strftime('%Y-%m-%d')
-            else:
-                # 小时线及以下, 使用完整时间格式
-                df['trade_date'] = df['trade_date'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        # 去重（确保DataFrame内部没有重复的trade_date）
+        # trade_date 此时还是 datetime64（naive UTC），按整数键去重比转换为字符串后再去重快；
+        # 下面过滤不完整数据只依赖 trade_date，先去重不影响结果
+        before_dedup = len(df)
+        df = df.drop_duplicates(subset=['trade_date'], keep='first')
+        after_dedup = len(df)
+        if after_dedup < before_dedup:
+            logging.info(f"{symbol} DataFrame内部去重，移除 {before_dedup - after_dedup} 条重复数据")
         
-        # 过滤掉不完整的数据
+        # 过滤掉不完整的数据（直接比较 datetime64，不需要逐行解析字符串）
         now_utc = datetime.now(timezone.utc)
-        today_str = now_utc.strftime('%Y-%m-%d')
         before_filter = len(df)
 
         if interval in ['1d', '3d', '1w', '1M']:
-            df = df[df['trade_date'] != today_str]
+            today = pd.Timestamp(now_utc.strftime('%Y-%m-%d'))
+            df = df[df['trade_date'].dt.normalize() != today]
         else:
             latest_complete_time = _get_latest_complete_kline_time(interval)
-
-            def is_complete_kline(trade_date_str: str) -> bool:
-                try:
-                    trade_date_obj = datetime.strptime(trade_date_str, '%Y-%m-%d %H:%M:%S')
-                    trade_date_utc = trade_date_obj.replace(tzinfo=timezone.utc)
-                    return trade_date_utc <= latest_complete_time
-                except (ValueError, TypeError):
-                    return True
-
-            df = df[df['trade_date'].apply(is_complete_kline)]
+            df = df[df['trade_date'] <= latest_complete_time.replace(tzinfo=None)]
 
             if before_filter > len(df):
                 logging.info(f"{symbol} 过滤掉 {before_filter - len(df)} 条不完整的K线数据（最新完整K线时间: {latest_complete_time.strftime('%Y-%m-%d %H:%M:%S')}）")
@@ -932,12 +928,14 @@ def download_kline_data(
         if after_filter < before_filter:
             logging.info(f"{symbol} 共过滤掉 {before_filter - after_filter} 条不完整数据")
         
-        # 再次去重（确保DataFrame内部没有重复的trade_date）
-        before_dedup = len(df)
-        df = df.drop_duplicates(subset=['trade_date'], keep='first')
-        after_dedup = len(df)
-        if after_dedup < before_dedup:
-            logging.info(f"{symbol} DataFrame内部去重，移除 {before_dedup - after_dedup} 条重复数据")
+        # 将trade_date转换为字符串格式(用于数据库存储和比对已存在数据)
+        # 根据K线间隔选择合适的日期格式
+        if interval in ['1d', '3d', '1w', '1M']:
+            # 日线及以上, 使用日期格式
+            df['trade_date'] = df['trade_date'].dt.strftime('%Y-%m-%d')
+        else:
+            # 小时线及以下, 使用完整时间格式
+            df['trade_date'] = df['trade_date'].dt.strftime('%Y-%m-%d %H:%M:%S')
         
         # 过滤已存在的数据
         if existing_dates and not update_existing:
@@ -964,58 +962,26 @@ def download_kline_data(
                     logging.info(f"{symbol} 最终检查后没有新数据需要保存")
                     return True
         
-        BATCH_SIZE = 50  # PostgreSQL 批量插入大小
         total_rows = len(df)
-        saved_count = 0
-
-        if total_rows <= BATCH_SIZE:
-            try:
-                df.to_sql(
-                    name=table_name,
-                    con=engine,
-                    if_exists='append',
-                    index=False,
-                    method='multi'
-                )
-                saved_count = len(df)
-            except Exception as e:
-                # 🔧 增强：如果是唯一约束冲突，降级到逐条插入
-                error_msg = str(e)
-                is_unique_error = any(keyword in error_msg for keyword in ["UniqueViolation", "duplicate key", "IntegrityError"]) or "unique" in error_msg.lower()
-                
-                if is_unique_error:
-                    logging.warning(f"⚠️ {symbol} 批量插入发生冲突，尝试降级到逐条插入自愈模式...")
-                    saved_count = _insert_with_skip_duplicates(df, table_name, engine)
-                else:
-                    logging.error(f"{symbol} 批量插入失败: {e}")
-                    raise
-        else:
-            for i in range(0, total_rows, BATCH_SIZE):
-                batch_df = df.iloc[i:i+BATCH_SIZE]
+        
+        # 使用 COPY 一次写入全部数据，没有逐批 INSERT 的往返和解析开销
+        try:
+            saved_count = bulk_insert_kline(table_name, df)
+        except Exception as e:
+            # 🔧 增强：COPY 整批回滚，如果是唯一约束冲突，经由暂存表合并写入（update_existing 时覆盖已存在的数据，否则跳过）
+            error_msg = str(e)
+            is_unique_error = any(keyword in error_msg for keyword in ["UniqueViolation", "duplicate key", "IntegrityError"]) or "unique" in error_msg.lower()
+            
+            if is_unique_error:
+                logging.warning(f"⚠️ {symbol} 批量写入发生冲突，改为经由暂存表合并写入...")
                 try:
-                    batch_df.to_sql(
-                        name=table_name,
-                        con=engine,
-                        if_exists='append',
-                        index=False,
-                        method='multi'
-                    )
-                    saved_count += len(batch_df)
-                except Exception as e:
-                    # 🔧 增强：批量插入失败时尝试逐条插入该批次
-                    error_msg = str(e)
-                    is_unique_error = any(keyword in error_msg for keyword in ["UniqueViolation", "duplicate key", "IntegrityError"]) or "unique" in error_msg.lower()
-                    
-                    if is_unique_error:
-                        logging.warning(f"⚠️ {symbol} 第 {i//BATCH_SIZE + 1} 批插入冲突，尝试逐条插入自愈...")
-                        saved_batch_count = _insert_with_skip_duplicates(batch_df, table_name, engine)
-                        saved_count += saved_batch_count
-                    else:
-                        logging.error(f"{symbol} 第 {i//BATCH_SIZE + 1} 批插入失败: {e}")
-                        raise
-
-                if (i + BATCH_SIZE) % (BATCH_SIZE * 10) == 0 or (i + BATCH_SIZE) >= total_rows:
-                    logging.info(f"{symbol} 已保存 {saved_count}/{total_rows} 条数据")
+                    saved_count = bulk_backfill(table_name, df, update_existing=update_existing)
+                except Exception as merge_error:
+                    logging.warning(f"⚠️ {symbol} 暂存表合并写入失败（{merge_error}），尝试降级到逐条插入自愈模式...")
+                    saved_count = _insert_with_skip_duplicates(df, table_name, engine)
+            else:
+                logging.error(f"{symbol} 批量写入失败: {e}")
+                raise
         
         if saved_count < total_rows:
             logging.info(f"{symbol} 成功保存 {saved_count} 条K线数据（共 {total_rows} 条，跳过 {total_rows - saved_count} 条重复数据）")
@@ -1039,7 +1005,8 @@ def download_all_symbols(
     auto_split: bool = True,
     request_delay: float = DEFAULT_REQUEST_DELAY,
     batch_size: int = DEFAULT_BATCH_SIZE,
-    batch_delay: float = DEFAULT_BATCH_DELAY
+    batch_delay: float = DEFAULT_BATCH_DELAY,
+    max_workers: int = DEFAULT_DOWNLOAD_WORKERS
 ):
     """
     下载所有交易对的K线数据
@@ -1052,6 +1019,10 @@ def download_all_symbols(
         limit: 每次请求的最大条数, 默认1500
         update_existing: 是否更新已存在的数据, 默认False
         symbols: 指定要下载的交易对列表, 默认None(下载所有)
+        batch_size: 每处理多少个交易对后暂停（仅单线程下载时有效）
+        batch_delay: 每批处理后的暂停时间（秒）（仅单线程下载时有效）
+        max_workers: 并行下载的交易对数, 默认4（1 表示串行下载）。
+            并行时由 binance_client 的权重限流控制请求频率，不再按批次暂停
     """
     logging.info("=" * 80)
     logging.info(f"开始下载所有交易对的K线数据，间隔: {interval}")
@@ -1080,10 +1051,10 @@ def download_all_symbols(
         # 过滤掉不在交易所正常交易的交易对
         valid_symbols = []
         invalid_symbols = []
-        valid_trading_list = get_valid_trading_symbols()
+        valid_trading_set = get_valid_trading_symbol_set()
         
         for symbol in all_symbols:
-            if valid_trading_list and symbol not in valid_trading_list:
+            if valid_trading_set and symbol not in valid_trading_set:
                 invalid_symbols.append(symbol)
                 logging.warning(f"⚠️ 交易对 {symbol} 不在交易所正常交易列表中，将跳过")
             else:
@@ -1125,30 +1096,55 @@ def download_all_symbols(
             start_time = end_time - timedelta(days=days_back)
         # 如果days_back也为None，则start_time保持为None（下载所有数据）
     
+    # 启动时一次性创建所有缺少的表，下载过程中的 create_table 不再访问数据库
+    try:
+        ensure_schema([f'K{interval}{symbol}' for symbol in all_symbols])
+    except Exception as e:
+        # 失败时由每个交易对下载前的 create_table 逐个建表
+        logging.warning(f"批量创建K线表失败，将在下载时逐个创建: {e}")
+    
     # 下载每个交易对的数据
     success_count = 0
     fail_count = 0
     
-    for i, symbol in enumerate(all_symbols, 1):
+    def download_symbol(i: int, symbol: str) -> bool:
         logging.info(f"[{i}/{len(all_symbols)}] 处理交易对: {symbol}")
-        if download_kline_data(
-            symbol=symbol,
-            interval=interval,
-            start_time=start_time,
-            end_time=end_time,
-            limit=limit,
-            update_existing=update_existing,
-            auto_split=auto_split,
-            request_delay=request_delay
-        ):
-            success_count += 1
-        else:
-            fail_count += 1
-        
-        # 每处理指定数量的交易对后暂停，避免触发交易所API限制
-        if i % batch_size == 0:
-            logging.info(f"已处理 {i} 个交易对, 暂停 {batch_delay} 秒以避免API限制...")
-            time.sleep(batch_delay)
+        try:
+            return download_kline_data(
+                symbol=symbol,
+                interval=interval,
+                start_time=start_time,
+                end_time=end_time,
+                limit=limit,
+                update_existing=update_existing,
+                auto_split=auto_split,
+                request_delay=request_delay
+            )
+        except Exception as e:
+            logging.error(f"下载 {symbol} 时发生未捕获错误: {e}")
+            return False
+    
+    if max_workers <= 1:
+        for i, symbol in enumerate(all_symbols, 1):
+            if download_symbol(i, symbol):
+                success_count += 1
+            else:
+                fail_count += 1
+            
+            # 每处理指定数量的交易对后暂停，避免触发交易所API限制
+            if i % batch_size == 0:
+                logging.info(f"已处理 {i} 个交易对, 暂停 {batch_delay} 秒以避免API限制...")
+                time.sleep(batch_delay)
+    else:
+        # 下载主要耗时在网络请求，不同交易对写入不同的表，用线程池并行下载
+        workers = min(max_workers, len(all_symbols))
+        logging.info(f"使用 {workers} 个线程并行下载...")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for success in executor.map(download_symbol, range(1, len(all_symbols) + 1), all_symbols):
+                if success:
+                    success_count += 1
+                else:
+                    fail_count += 1
     
     logging.info(f"下载完成！成功: {success_count}, 失败: {fail_count}")
 
@@ -1162,7 +1158,8 @@ def download_missing_symbols(
     auto_split: bool = True,
     request_delay: float = DEFAULT_REQUEST_DELAY,
     batch_size: int = DEFAULT_BATCH_SIZE,
-    batch_delay: float = DEFAULT_BATCH_DELAY
+    batch_delay: float = DEFAULT_BATCH_DELAY,
+    max_workers: int = DEFAULT_DOWNLOAD_WORKERS
 ):
     """只下载本地数据库中缺失的交易对数据"""
     logging.info("=" * 80)
@@ -1206,7 +1203,8 @@ def download_missing_symbols(
         auto_split=auto_split,
         request_delay=request_delay,
         batch_size=batch_size,
-        batch_delay=batch_delay
+        batch_delay=batch_delay,
+        max_workers=max_workers
     )
 
 
@@ -1522,6 +1520,12 @@ if __name__ == "__main__":
         default=3.0,
         help='每批处理后的暂停时间（秒）(默认: 3.0)'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_DOWNLOAD_WORKERS,
+        help=f'并行下载的交易对数，1 表示串行下载(默认: {DEFAULT_DOWNLOAD_WORKERS})'
+    )
     parser.add_argument(
         '--update',
         action='store_true',
@@ -1582,7 +1586,8 @@ if __name__ == "__main__":
             auto_split=args.auto_split,
             request_delay=args.request_delay,
             batch_size=args.batch_size,
-            batch_delay=args.batch_delay
+            batch_delay=args.batch_delay,
+            max_workers=args.workers
         )
     else:
         # 下载所有或指定的交易对
@@ -1597,6 +1602,7 @@ if __name__ == "__main__":
             auto_split=args.auto_split,
             request_delay=args.request_delay,
             batch_size=args.batch_size,
-            batch_delay=args.batch_delay
+            batch_delay=args.batch_delay,
+            max_workers=args.workers
         )
 
@@ -258,56 +258,51 @@ class AutoDataDownloader:
                             logging.debug(f"    {symbol} {table_name}: 本地已是最新，无需更新")
                         continue
                     
-                    with engine.connect() as conn:
-                        for item in data:
-                            timestamp = item['timestamp']
-                            
-                            # 跳过已存在的数据（虽然 ON CONFLICT 会处理，但可以提前过滤减少数据库操作）
-                            if timestamp <= latest_timestamp:
-                                continue
-                            
-                            long_short_ratio = float(item['longShortRatio'])
-                            
-                            if table_name == 'top_account_ratio':
-                                conn.execute(text("""
-                                    INSERT INTO top_account_ratio
-                                    (symbol, timestamp, long_short_ratio, long_account, short_account)
-                                    VALUES (:symbol, :timestamp, :long_short_ratio, :long_account, :short_account)
-                                    ON CONFLICT (symbol, timestamp) 
-                                    DO UPDATE SET 
-                                        long_short_ratio = EXCLUDED.long_short_ratio,
-                                        long_account = EXCLUDED.long_account,
-                                        short_account = EXCLUDED.short_account
-                                """), {
-                                    'symbol': symbol,
-                                    'timestamp': timestamp,
-                                    'long_short_ratio': long_short_ratio,
-                                    'long_account': float(item['longAccount']),
-                                    'short_account': float(item['shortAccount'])
-                                })
-                            
-                            elif table_name == 'top_position_ratio':
-                                conn.execute(text("""
-                                    INSERT INTO top_position_ratio
-                                    (symbol, timestamp, long_short_ratio, long_position, short_position)
-                                    VALUES (:symbol, :timestamp, :long_short_ratio, :long_position, :short_position)
-                                    ON CONFLICT (symbol, timestamp) 
-                                    DO UPDATE SET 
-                                        long_short_ratio = EXCLUDED.long_short_ratio,
-                                        long_position = EXCLUDED.long_position,
-                                        short_position = EXCLUDED.short_position
-                                """), {
-                                    'symbol': symbol,
-                                    'timestamp': timestamp,
-                                    'long_short_ratio': long_short_ratio,
-                                    'long_position': float(item['longPosition']),
-                                    'short_position': float(item['shortPosition'])
-                                })
-                            
-                            total_records += 1
-                            new_records += 1
-                        
-                        conn.commit()
+                    # 先收集所有新数据，再用一次 executemany 批量写入
+                    if table_name == 'top_account_ratio':
+                        stmt = text("""
+                            INSERT INTO top_account_ratio
+                            (symbol, timestamp, long_short_ratio, long_account, short_account)
+                            VALUES (:symbol, :timestamp, :long_short_ratio, :long_account, :short_account)
+                            ON CONFLICT (symbol, timestamp) 
+                            DO UPDATE SET 
+                                long_short_ratio = EXCLUDED.long_short_ratio,
+                                long_account = EXCLUDED.long_account,
+                                short_account = EXCLUDED.short_account
+                        """)
+                        # 跳过已存在的数据（虽然 ON CONFLICT 会处理，但可以提前过滤减少数据库操作）
+                        rows = [{
+                            'symbol': symbol,
+                            'timestamp': item['timestamp'],
+                            'long_short_ratio': float(item['longShortRatio']),
+                            'long_account': float(item['longAccount']),
+                            'short_account': float(item['shortAccount'])
+                        } for item in data if item['timestamp'] > latest_timestamp]
+                    else:
+                        stmt = text("""
+                            INSERT INTO top_position_ratio
+                            (symbol, timestamp, long_short_ratio, long_position, short_position)
+                            VALUES (:symbol, :timestamp, :long_short_ratio, :long_position, :short_position)
+                            ON CONFLICT (symbol, timestamp) 
+                            DO UPDATE SET 
+                                long_short_ratio = EXCLUDED.long_short_ratio,
+                                long_position = EXCLUDED.long_position,
+                                short_position = EXCLUDED.short_position
+                        """)
+                        rows = [{
+                            'symbol': symbol,
+                            'timestamp': item['timestamp'],
+                            'long_short_ratio': float(item['longShortRatio']),
+                            'long_position': float(item['longPosition']),
+                            'short_position': float(item['shortPosition'])
+                        } for item in data if item['timestamp'] > latest_timestamp]
+                    
+                    if rows:
+                        with engine.connect() as conn:
+                            conn.execute(stmt, rows)
+                            conn.commit()
+                        total_records += len(rows)
+                        new_records += len(rows)
                     
                     time.sleep(0.05)
                 
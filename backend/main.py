@@ -12,6 +12,7 @@
 import sys
 from pathlib import Path
 import asyncio
+import heapq
 from contextlib import asynccontextmanager
 
 # 添加项目根目录到Python路径（独立项目：main.py在backend目录下，上一级就是项目根目录）
@@ -48,6 +49,7 @@ from data import (
     delete_table,
     delete_kline_data,
     check_data_integrity,
+    check_data_integrity_cached,
     generate_download_script_from_check,
     download_missing_data_from_check,
     generate_integrity_report,
@@ -683,8 +685,8 @@ async def sync_symbols(request: SyncSymbolsRequest, background_tasks: Background
         raise HTTPException(status_code=503, detail="Binance API不可用")
     
     try:
-        # 获取交易所交易对列表
-        exchange_symbols = in_exchange_trading_symbols()
+        # 获取交易所交易对列表（同步操作需要最新数据，跳过缓存）
+        exchange_symbols = in_exchange_trading_symbols(force_refresh=True)
         
         if not exchange_symbols:
             raise HTTPException(status_code=500, detail="无法获取交易所交易对列表")
@@ -1024,11 +1026,17 @@ async def delete_table_by_name(request: DeleteTableByNameRequest):
         raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
 
 
+def _public_check_results(results: Dict) -> Dict:
+    """去掉检查结果中下划线开头的内部键（如报告用的问题分类）"""
+    return {key: value for key, value in results.items() if not key.startswith('_')}
+
+
 @app.post("/api/data-integrity", tags=["数据管理"])
 async def check_data_integrity_api(request: DataIntegrityRequest):
     """检查K线数据完整性"""
     try:
-        result = check_data_integrity(
+        # 用户主动检查时总是重新检查，结果缓存起来供随后的下载缺失数据复用
+        result = check_data_integrity_cached(
             symbol=request.symbol,
             interval=request.interval,
             start_date=request.start_date,
@@ -1036,9 +1044,10 @@ async def check_data_integrity_api(request: DataIntegrityRequest):
             check_duplicates=request.check_duplicates,
             check_missing_dates=request.check_missing_dates,
             check_data_quality=request.check_data_quality,
-            verbose=True
+            verbose=True,
+            force=True
         )
-        return result
+        return _public_check_results(result)
     except Exception as e:
         logging.error(f"数据完整性检查失败: {e}")
         raise HTTPException(status_code=500, detail=f"检查失败: {str(e)}")
@@ -1105,8 +1114,8 @@ async def generate_download_script_api(request: GenerateDownloadScriptRequest):
 async def download_missing_data_api(request: DataIntegrityRequest):
     """下载缺失数据"""
     try:
-        # 先检查数据完整性
-        check_results = check_data_integrity(
+        # 先检查数据完整性（刚检查过相同范围时复用检查结果）
+        check_results = check_data_integrity_cached(
             symbol=request.symbol,
             interval=request.interval,
             start_date=request.start_date,
@@ -1138,9 +1147,9 @@ async def download_missing_data_api(request: DataIntegrityRequest):
         
         return {
             "status": "success",
-            "check_results_before": check_results,
+            "check_results_before": _public_check_results(check_results),
             "download_stats": download_stats,
-            "check_results_after": check_results_after
+            "check_results_after": _public_check_results(check_results_after)
         }
     except Exception as e:
         logging.error(f"下载缺失数据失败: {e}")
@@ -1311,6 +1320,7 @@ async def update_kline_data_api(request: UpdateKlineDataRequest):
             update_stmt = f"UPDATE {table_name} SET {', '.join(update_fields)} WHERE trade_date = :trade_date"
             conn.execute(text(update_stmt), update_values)
             conn.commit()
+            get_local_kline_data.cache_clear()
             
             # 获取更新后的数据
             updated_result = conn.execute(text(check_stmt), {"trade_date": request.trade_date})
@@ -1423,9 +1433,8 @@ async def get_top_gainers(date: Optional[str] = None, top_n: int = 3):
                 "message": f"未找到 {date} 的数据"
             }
         
-        # 按涨幅排序，取前N名
-        sorted_data = sorted(all_data, key=lambda x: x['pct_chg'], reverse=True)
-        top_gainers = sorted_data[:top_n]
+        # 取涨幅前N名（堆选择，无需对全部交易对排序）
+        top_gainers = heapq.nlargest(top_n, all_data, key=lambda x: x['pct_chg'])
         
         return {
             "date": date,
@@ -0,0 +1,74 @@
+"""
+data 模块补全缺失数据测试：日内K线的缺失日期必须整天下载
+
+download_kline_data 被替换为记录调用参数的假函数，不访问交易所和数据库。
+"""
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# 添加 backend 目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# 导入时会创建币安客户端，测试不发请求，给一个占位的密钥即可
+os.environ.setdefault("BINANCE_API_KEY", "test")
+os.environ.setdefault("BINANCE_API_SECRET", "test")
+
+import data  # noqa: E402
+import download_klines  # noqa: E402
+
+MISSING_DATES = ['2024-01-03', '2024-01-10']
+
+
+def _check_results(missing_dates):
+    return {
+        'summary': {'empty_tables': 0},
+        'details': {
+            'BTCUSDT': {
+                'record_count': 100,
+                'missing_dates': missing_dates,
+                'date_range': {'start': '2024-01-01', 'end': '2024-01-31'},
+            }
+        },
+    }
+
+
+def test_missing_date_runs_cover_whole_days_for_intraday():
+    assert data._missing_date_runs(MISSING_DATES, '1h', as_datetime=True) == [
+        (datetime(2024, 1, 3), datetime(2024, 1, 3, 23, 59, 59)),
+        (datetime(2024, 1, 10), datetime(2024, 1, 10, 23, 59, 59)),
+    ]
+    assert data._missing_date_runs(MISSING_DATES, '1h') == [
+        ('2024-01-03', '2024-01-03 23:59:59'),
+        ('2024-01-10', '2024-01-10 23:59:59'),
+    ]
+    # 日线每天只有零点一根K线
+    assert data._missing_date_runs(MISSING_DATES, '1d') == [
+        ('2024-01-03', '2024-01-03'),
+        ('2024-01-10', '2024-01-10'),
+    ]
+
+
+def test_download_missing_data_requests_whole_days(monkeypatch):
+    calls = []
+
+    def fake_download_kline_data(symbol, interval, start_time, end_time, update_existing):
+        calls.append((symbol, interval, start_time, end_time))
+        return True
+
+    monkeypatch.setattr(download_klines, "download_kline_data", fake_download_kline_data)
+
+    stats = data.download_missing_data_from_check(_check_results(MISSING_DATES), '1h', verbose=False)
+
+    assert stats['success'] == ['BTCUSDT']
+    assert calls == [
+        ('BTCUSDT', '1h', datetime(2024, 1, 3), datetime(2024, 1, 3, 23, 59, 59)),
+        ('BTCUSDT', '1h', datetime(2024, 1, 10), datetime(2024, 1, 10, 23, 59, 59)),
+    ]
+
+
+def test_generated_script_ends_at_end_of_day():
+    script = data.generate_download_script_from_check(_check_results(MISSING_DATES), '1h')
+
+    assert '--start-time 2024-01-03 --end-time "2024-01-03 23:59:59"' in script
+    assert '--start-time 2024-01-10 --end-time "2024-01-10 23:59:59"' in script
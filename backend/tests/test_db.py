@@ -0,0 +1,126 @@
+"""
+db 模块表缓存测试：删除表之后再次下载必须重新建表
+
+使用假的 engine 记录执行的 SQL，不需要真实的 PostgreSQL。
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加 backend 目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+
+class FakeConnection:
+    """模拟数据库连接，existing 是数据库中已有的表名集合"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, stmt, params=None):
+        if stmt is db._PUBLIC_TABLES_SQL:
+            return FakeResult([(name,) for name in self.engine.existing])
+        if stmt is db._KLINE_TABLE_EXISTS_SQL:
+            names = {params["quoted"], params["lowered"]}
+            exists = any(f'public."{name}"' in names for name in self.engine.existing)
+            return FakeResult([(exists,)])
+        sql = str(stmt)
+        if sql.startswith("DROP TABLE"):
+            self.engine.existing.discard(sql.split('"')[1])
+            return FakeResult([])
+        # 单表建表语句（create_table）
+        self.exec_driver_sql(sql)
+        return FakeResult([])
+
+    def exec_driver_sql(self, sql):
+        self.engine.ddl.append(sql)
+        for line in sql.splitlines():
+            line = line.strip()
+            if line.startswith("CREATE TABLE IF NOT EXISTS"):
+                self.engine.existing.add(line.split('"')[1])
+
+    def commit(self):
+        pass
+
+
+class FakeEngine:
+    def __init__(self, existing=()):
+        self.existing = set(existing)
+        self.ddl = []
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+@pytest.fixture
+def fake_engine(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(db, "engine", engine)
+    db.forget_tables()
+    yield engine
+    db.forget_tables()
+
+
+def test_ensure_schema_creates_only_missing_tables(fake_engine):
+    fake_engine.existing.add("K1dBBBUSDT")
+
+    assert db.ensure_schema(["K1dAAAUSDT", "K1dBBBUSDT"]) == 1
+    assert fake_engine.existing == {"K1dAAAUSDT", "K1dBBBUSDT"}
+
+    # 已缓存的表不再访问数据库
+    fake_engine.ddl.clear()
+    assert db.ensure_schema(["K1dAAAUSDT", "K1dBBBUSDT"]) == 0
+    assert db.create_table("K1dAAAUSDT") is True
+    assert fake_engine.ddl == []
+
+
+def test_ensure_schema_recreates_table_dropped_outside_db(fake_engine):
+    db.ensure_schema(["K1dAAAUSDT"])
+
+    # 模拟 data.delete_table 等直接执行 DROP TABLE 的路径，实际表名大小写可能不同
+    fake_engine.existing.discard("K1dAAAUSDT")
+    db.forget_tables(["k1daaausdt"])
+
+    fake_engine.ddl.clear()
+    assert db.ensure_schema(["K1dAAAUSDT"]) == 1
+    assert "K1dAAAUSDT" in fake_engine.existing
+    assert len(fake_engine.ddl) == 1
+
+
+def test_create_table_after_delete_table(fake_engine):
+    assert db.create_table("K1hAAAUSDT") is False
+    assert db.create_table("K1hAAAUSDT") is True
+
+    db.delete_table("K1hAAAUSDT")
+    assert "K1hAAAUSDT" not in fake_engine.existing
+
+    assert db.create_table("K1hAAAUSDT") is False
+    assert "K1hAAAUSDT" in fake_engine.existing
+
+
+def test_forget_all_tables(fake_engine):
+    db.ensure_schema(["K1dAAAUSDT", "K1dBBBUSDT"])
+    fake_engine.existing.clear()
+    db.forget_tables()
+
+    assert db.ensure_schema(["K1dAAAUSDT", "K1dBBBUSDT"]) == 2
@@ -0,0 +1,71 @@
+"""
+db-sqlite.py 测试（文件名带连字符，通过 importlib 按路径导入）
+"""
+import importlib.util
+import sqlite3
+import threading
+from pathlib import Path
+
+import pytest
+
+_MODULE_PATH = Path(__file__).resolve().parent.parent / "db-sqlite.py"
+_spec = importlib.util.spec_from_file_location("db_sqlite", _MODULE_PATH)
+db_sqlite = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(db_sqlite)
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = tmp_path / "crypto_data.db"
+    sqlite3.connect(path).close()
+    return str(path)
+
+
+def _journal_mode(conn):
+    return conn.execute("PRAGMA journal_mode;").fetchone()[0]
+
+
+def test_connect_db_does_not_change_journal_mode(db_file):
+    conn = db_sqlite.connect_db(db_file)
+    assert _journal_mode(conn) == "delete"
+    conn.close()
+
+
+def test_bulk_insert_in_batches(db_file):
+    conn = db_sqlite.connect_db(db_file)
+    conn.execute('CREATE TABLE "K1dBTCUSDT" (trade_date TEXT, close REAL)')
+
+    rows = [(f"2024-01-{i:02d}", float(i)) for i in range(1, 124)]
+    assert db_sqlite.bulk_insert(conn, "K1dBTCUSDT", rows, batch_size=50) == 123
+    assert conn.execute('SELECT COUNT(*) FROM "K1dBTCUSDT"').fetchone()[0] == 123
+    assert _journal_mode(conn) == "wal"
+    assert db_sqlite.bulk_insert(conn, "K1dBTCUSDT", []) == 0
+    conn.close()
+
+
+def test_get_conn_reuses_connection_per_thread(db_file, monkeypatch):
+    monkeypatch.setattr(db_sqlite, "_local", threading.local())
+    conn = db_sqlite.get_conn(db_file)
+    assert db_sqlite.get_conn(db_file) is conn
+    assert conn.execute("PRAGMA cache_size;").fetchone()[0] == -262144
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db_sqlite.get_conn(db_file)))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_get_conn_keyed_by_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_sqlite, "_local", threading.local())
+    paths = []
+    for name in ("a.db", "b.db"):
+        path = tmp_path / name
+        sqlite3.connect(path).close()
+        paths.append(str(path))
+
+    conn_a = db_sqlite.get_conn(paths[0])
+    conn_b = db_sqlite.get_conn(paths[1])
+    assert conn_b is not conn_a
+    assert conn_b.execute("PRAGMA database_list;").fetchone()[2] == paths[1]
+    assert db_sqlite.get_conn(paths[0]) is conn_a